@@ -0,0 +1,22 @@
+#version 450
+
+#extension GL_ARB_separate_shader_objects : enable
+#extension GL_ARB_shading_language_420pack : enable
+
+layout (location = 0) in vec2 inUv;
+
+layout (location = 0) out vec4 outFragColor;
+
+layout (set=0, binding=0) uniform sampler2D textures[16];
+
+layout (set=1, binding=0) uniform View {
+    mat4 mvp;
+    int texture_index;
+} view;
+
+
+void main() 
+{
+    // The index is the same for the whole draw, so it can index the table without `nonuniformEXT`
+    outFragColor = texture(textures[view.texture_index], inUv, 0.0);
+}
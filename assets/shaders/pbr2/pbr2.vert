@@ -11,8 +11,11 @@ layout (location = 0) out vec3 outPos;
 layout (location = 1) out vec2 outUv;
 layout (location = 2) out vec3 outNormal;
 
-layout (set=1, binding=0) uniform View {
-    mat4 mvp;
+layout (set=0, binding=5) uniform Camera {
+    mat4 view_projection;
+} camera;
+
+layout (push_constant) uniform View {
     mat4 model;
     mat4 normal;
 } view;
@@ -27,5 +30,5 @@ void main(void)
 
     outUv = inUv;
 
-    gl_Position = view.mvp * vec4(inPos, 1.0);
+    gl_Position = camera.view_projection * pos;
 }
@@ -12,7 +12,10 @@ class PanicPanda(object):
             "QUEUES": (
                 QueueConf.Default,
                 QueueConf(name="compute", type=QueueType.Compute, required=False),
-            )
+                QueueConf(name="transfer", type=QueueType.Transfer, required=False),
+            ),
+            "FRAMES_IN_FLIGHT": 2,
+            "INDIRECT_DRAWS": False,
         }
         
         self.engine = Engine(engine_configuration)
@@ -39,42 +42,46 @@ class PanicPanda(object):
             self.set_scene(scene_index)
 
     def set_scene(self, scene_index):
-        engine = self.engine
-
         if scene_index == 1:
             if self.main is None:
                 self.main = MainScene(self, self.engine)
 
-            engine.load(self.main.scene)
-            engine.activate(self.main.scene) 
+            self.activate(self.main.scene)
 
         elif scene_index == 2:
             if self.debug_texture is None:
                 self.debug_texture = DebugTexturesScene(self, self.engine)
 
-            engine.load(self.debug_texture.scene)
-            engine.activate(self.debug_texture.scene)
+            self.activate(self.debug_texture.scene)
 
         elif scene_index == 3:
             if self.debug_normals is None:
                 self.debug_normals = DebugNormalsScene(self, self.engine)
 
-            engine.load(self.debug_normals.scene)
-            engine.activate(self.debug_normals.scene)
+            self.activate(self.debug_normals.scene)
 
         elif scene_index == 4:
             if self.debug_pbr is None:
                 self.debug_pbr = DebugPBRScene(self, self.engine)
 
-            engine.load(self.debug_pbr.scene)
-            engine.activate(self.debug_pbr.scene)
+            self.activate(self.debug_pbr.scene)
 
         elif scene_index == 5:
             if self.debug_compute is None:
                 self.debug_compute = DebugComputeScene(self, self.engine)
                 
-            engine.load(self.debug_compute.scene)
-            engine.activate(self.debug_compute.scene)
+            self.activate(self.debug_compute.scene)
+
+    def activate(self, scene):
+        engine = self.engine
+
+        # The first scene is loaded right away. The next ones are loaded in the background
+        # and activated by `engine.update` once they are ready, so the current scene keeps rendering in the meantime.
+        if engine.current_scene_index is None:
+            engine.load(scene)
+            engine.activate(scene)
+        else:
+            engine.load_async(scene, activate=True)
 
     def run(self):
         engine = self.engine
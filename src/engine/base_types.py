@@ -1,4 +1,5 @@
 from collections import namedtuple
+from functools import lru_cache
 
 Queue = namedtuple("Queue", ("handle", "family"))
 ImageAndView = namedtuple("ImageAndView", ("image", "view"))
@@ -25,55 +26,105 @@ class Id(object):
         
 
 class UniformsMaps(object):
+    """
+        Uniforms of a component. Before the component is loaded, this is a container for the default values
+        of the uniforms. Once the component is loaded, it is replaced by a `BoundUniformsMaps` holding the values
+        that are written to the GPU.
+    """
 
     # Used to filter out non data fields when initializing uniforms in `DataScene._setup_uniforms`
-    _NON_UNIFORM_NAMES = ('as_dict', 'bound', 'merge', 'uniform_names', 'updated_member_names')
+    _NON_UNIFORM_NAMES = ('as_dict', 'bind', 'bound', 'merge', 'touch', 'uniform_names', 'updated_member_names')
+
+    bound = False
+    uniform_names = frozenset()
 
     def __init__(self):
-        sup = super()
-        sup.__setattr__('updated_member_names', set())
-        sup.__setattr__('uniform_names', [])
-        sup.__setattr__('bound', False)
+        self.updated_member_names = set()
+
+    def bind(self, values, updated_member_names):
+        """ Create the bound uniforms using the values in `values` (uniform name -> value) """
+        return bound_uniforms_type(tuple(values.keys()))(values, updated_member_names)
 
     def merge(self, **values):
-        if self.bound:
-            raise NotImplementedError()
-        else:
-            for name, value in values.items():
-                setattr(self, name, value)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def touch(self, *names):
+        # Default values are always uploaded when the component is loaded
+        pass
 
     def as_dict(self):
-        d = {}
-        for n in self.uniform_names:
-            uni = super().__getattribute__(n)
-            d[n] = fields = {}
-
-            if hasattr(uni, '_fields_'):
-                for name, ctype in uni._fields_:
-                    value = getattr(uni, name)
-                    if hasattr(value, '_length_'):
-                        fields[name] = value[::]
-                    else:
-                        fields[name] = value
-            else:
-                d[n] = uni
-        
-        return d
+        return _uniforms_as_dict(self)
+
 
-    def __getattribute__(self, name):
-        sup = super()
-        names = sup.__getattribute__("uniform_names")
+class BoundUniformsMaps(object):
+    """
+        Uniforms of a loaded component. Each uniform is stored in a slot of a class generated for the shader
+        by `bound_uniforms_type`, so reading a uniform is a plain attribute lookup.
+
+        Assigning a uniform marks it as updated. Values modified in place (ex: `uniforms.render.debug[0] = 1`)
+        must be marked with `touch`.
+    """
+
+    __slots__ = ('updated_member_names',)
+
+    bound = True
+    uniform_names = frozenset()
+
+    def __init__(self, values, updated_member_names):
+        set_attr = super().__setattr__
+        set_attr('updated_member_names', set(updated_member_names))
+        for name, value in values.items():
+            set_attr(name, value)
+
+    def merge(self, **values):
+        """ Write the fields of many uniforms at once. Ex: `uniforms.merge(render={"debug": (1,)})` """
+        for name, fields in values.items():
+            uniform = getattr(self, name)
+            for field_name, value in fields.items():
+                setattr(uniform, field_name, value)
 
-        if name in names:
-            sup.__getattribute__("updated_member_names").add(name)
+        self.updated_member_names.update(values.keys())
 
-        return sup.__getattribute__(name)
+    def touch(self, *names):
+        """ Mark uniforms modified in place as updated """
+        bad_names = [n for n in names if n not in self.uniform_names]
+        if len(bad_names) > 0:
+            raise ValueError(f"Unknown uniforms: {bad_names}")
+
+        self.updated_member_names.update(names)
+
+    def as_dict(self):
+        return _uniforms_as_dict(self)
 
     def __setattr__(self, name, value):
-        sup = super()
-        names = sup.__getattribute__("uniform_names")
+        if name in self.uniform_names:
+            self.updated_member_names.add(name)
 
-        if name in names:
-            sup.__getattribute__("updated_member_names").add(name)
-        
-        sup.__setattr__(name, value)
+        super().__setattr__(name, value)
+
+
+@lru_cache(maxsize=None)
+def bound_uniforms_type(names):
+    """ Generate the bound uniforms class with one slot for each name in `names` """
+    attrs = {'__slots__': names, 'uniform_names': frozenset(names)}
+    return type("BoundUniformsMaps", (BoundUniformsMaps,), attrs)
+
+
+def _uniforms_as_dict(uniforms):
+    d = {}
+    for n in uniforms.uniform_names:
+        uni = getattr(uniforms, n)
+        d[n] = fields = {}
+
+        if hasattr(uni, '_fields_'):
+            for name, ctype in uni._fields_:
+                value = getattr(uni, name)
+                if hasattr(value, '_length_'):
+                    fields[name] = value[::]
+                else:
+                    fields[name] = value
+        else:
+            d[n] = uni
+
+    return d
@@ -46,7 +46,8 @@ class ComputeRunner(object):
         cmds = (cmd,)
         fence = data_compute.fence
         infos = (hvk.submit_info(command_buffers=cmds),)
-        hvk.queue_submit(api, queue.handle, infos, fence)
+        with engine.queue_lock:
+            hvk.queue_submit(api, queue.handle, infos, fence)
 
         if sync:
             f = (fence,)
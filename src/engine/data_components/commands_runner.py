@@ -45,6 +45,9 @@ class CommandsRunner(object):
         data_image.layout = data_image.target_layout
         data_image.access_mask = data_image.target_access_mask
 
+        # The bindless texture tables store the image layouts
+        data_scene.refresh_texture_tables()
+
 
 DEVICE_FUNCTIONS_MAP = {
     DeviceCommandEnum.UpdateImageLayout: CommandsRunner.device_update_image_layout
@@ -20,6 +20,7 @@ class DataCompute(object):
 
         self.descriptor_sets = None
         self.write_sets = None
+        self.uniform_offsets = None         # Set by DataScene._setup_descriptor_sets
 
         self.fence = None
 
@@ -33,6 +34,7 @@ class DataCompute(object):
         engine, api, device = self.ctx
 
         for dset_layout in self.descriptor_set_layouts:
+            dset_layout.update_template.free(api, device)
             hvk.destroy_descriptor_set_layout(api, device, dset_layout.set_layout)
 
         hvk.destroy_pipeline_layout(api, device, self.pipeline_layout)
@@ -4,7 +4,10 @@ class DataGameObject(object):
         self.obj = obj
         self.shader = obj.shader
         self.mesh = obj.mesh
+        self.hidden = obj.hidden
+        self.sort_key = None
         
         self.pipeline = None
         self.descriptor_sets = None
         self.write_sets = None
+        self.uniform_offsets = None
@@ -1,15 +1,17 @@
-from ..public_components import ImageSource, ImageLayout
+from ..public_components import ImageLayout
 from vulkan import vk, helpers as hvk
-from ctypes import c_ubyte
+
+
+# Texel rows in a row of blocks of the ASTC formats. Each block size has an UNORM and a SRGB format.
+ASTC_BLOCK_HEIGHTS = (4, 4, 5, 5, 6, 5, 6, 8, 5, 6, 8, 10, 10, 12)
 
 
 class DataImage(object):
     
-    def __init__(self, engine, image, base_staging_offset):
+    def __init__(self, engine, image):
         self.engine = engine
         self.image = image
 
-        self.base_staging_offset = base_staging_offset
         self.base_offset = 0                            # Set in `DataScene._setup_images_resources`
 
         self.image_handle = None
@@ -36,10 +38,16 @@ class DataImage(object):
         api, device = engine.api, engine.device
         return engine, api, device
 
-    def as_ctypes_array(self):
-        img = self.image
-        data = hvk.array(c_ubyte, img.texture_size, img.texture_data())
-        return data
+    @property
+    def block_height(self):
+        # Number of texel rows in a row of blocks. BC, ETC2 and EAC formats use 4x4 blocks, uncompressed formats use single texels
+        fmt = self.image.format
+        if vk.FORMAT_BC1_RGB_UNORM_BLOCK <= fmt <= vk.FORMAT_EAC_R11G11_SNORM_BLOCK:
+            return 4
+        elif vk.FORMAT_ASTC_4x4_UNORM_BLOCK <= fmt <= vk.FORMAT_ASTC_12x12_SRGB_BLOCK:
+            return ASTC_BLOCK_HEIGHTS[(fmt - vk.FORMAT_ASTC_4x4_UNORM_BLOCK) // 2]
+
+        return 1
 
     def update_layout(self, new_layout=None):
         layout = self.image.layout
@@ -1,4 +1,4 @@
-from ctypes import c_ubyte, c_uint16, c_uint32, memmove, byref
+from ctypes import c_uint16, c_uint32
 from vulkan import vk
 from functools import lru_cache
 
@@ -18,22 +18,19 @@ class DataMesh(object):
         self._cache_indices_type()
         self._map_attribute_offsets()
 
-    def as_ctypes_array(self):
-        offset = 0
+    def iter_data(self):
+        """ Yield the offset (relative to `base_offset`) and a memoryview of the indices and of every attribute """
         mesh = self.mesh
         indices = mesh.indices
-        attributes = mesh.attributes
-        buffer = (c_ubyte * mesh.size())()
+        offset = 0
 
-        memmove(byref(buffer), indices.data_pointer(), indices.size_bytes)
+        yield offset, indices.view()
         offset += indices.size_bytes
 
-        for attr in attributes.values():
-            memmove(byref(buffer, offset), attr.data_pointer(), attr.size_bytes)
+        for attr in mesh.attributes.values():
+            yield offset, attr.view()
             offset += attr.size_bytes
 
-        return buffer
-
     @lru_cache(maxsize=128)
     def attribute_offsets_for_shader(self, data_shader):
         offsets = self.attribute_offsets
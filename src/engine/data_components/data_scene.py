@@ -5,9 +5,15 @@ from .data_mesh import DataMesh
 from .data_sampler import DataSampler
 from .data_image import DataImage
 from .data_game_object import DataGameObject
+from .uniforms_upload import UniformsUpload
+from .descriptor_updates import update_descriptor_sets
+from ..pipeline_cache import pipeline_key
 from ..base_types import UniformsMaps
 from ..public_components import GameObject, Shader, Compute
-from ctypes import sizeof, memset
+from ctypes import sizeof, addressof
+from bisect import bisect_left, insort
+from itertools import groupby
+from time import perf_counter
 
 
 class DataScene(object):
@@ -18,6 +24,18 @@ class DataScene(object):
 
         self.command_pool = None
         self.render_commands = None
+        self.render_commands_versions = None
+        self.render_version = 0
+        self.group_pools = None
+        self.group_commands = None
+        self.group_commands_versions = None
+        self.group_versions = None
+        self.shader_groups = None
+        self.group_order = None
+        self.group_bind_stats = None
+        self.draw_lists = None
+        self.instance_batches = None
+        self.indirect_draws = engine.configuration.get("INDIRECT_DRAWS", False)
         self.compute_pools = None
         self.compute_commands = None
         self.render_cache = {}
@@ -28,9 +46,18 @@ class DataScene(object):
 
         self.pipelines = None
         self.compute_pipelines = None
-        self.pipeline_cache = None
+        self.pipeline_jobs = ()                       # Futures of the pipelines compiled in the background
+        self.compute_pipeline_jobs = ()
+        self.pipelines_ready = False
+        self.pipelines_error = None                   # First error raised while compiling the pipelines
+        self.pipeline_start = 0.0
+        self.pipeline_stats = (0, 0, 0.0)             # Pipelines created, pipelines already in the engine pipeline cache and time until they were available
 
         self.descriptor_pool = None
+        self.pending_descriptor_sets = set()
+        self.texture_tables = []
+        self.texture_count = 0
+        self.descriptor_update_stats = (0, 0.0)      # Sets written and time spent by the last descriptor update
 
         self.shader_objects = None
         self.shader_objects_sorted = False
@@ -38,6 +65,8 @@ class DataScene(object):
         self.meshes_alloc = None
         self.meshes_buffer = None
         self.meshes = None
+        self.shared_meshes = {}                       # Shared layout of the meshes of the instanced shaders, see `_setup_shared_meshes`
+        self.upload_batches = []                      # Uploads of the scene resources, see `UploadManager`
 
         self.samplers = None
 
@@ -46,16 +75,21 @@ class DataScene(object):
 
         self.uniforms_alloc = None
         self.uniforms_buffer = None
+        self.uniforms_slice_size = 0
+        self.uniforms_slice_count = 0
+        self.uniforms_upload = None
 
         self._setup_shaders()
         self._setup_objects()
-        self._setup_uniforms()
         self._setup_pipelines()
         self._setup_compute_pipelines()
         self._setup_descriptor_sets_pool()
         self._setup_descriptor_sets()
+        self._setup_uniforms()
         self._setup_descriptor_write_sets()
         self._setup_render_commands()
+        self._setup_group_commands()
+        self._setup_draw_lists()
         self._setup_compute_commands()
         self._setup_render_cache()
 
@@ -63,6 +97,12 @@ class DataScene(object):
         engine, api, device = self.ctx
         mem = engine.memory_manager
 
+        # Pipelines might still be compiling. A compile error that was not reported yet is raised once the resources are freed
+        compile_error = None
+        if not self.pipelines_ready and self.pipelines_error is None:
+            self._collect_pipelines()
+            compile_error = self.pipelines_error
+
         if self.uniforms_alloc is not None:
             hvk.destroy_buffer(api, device, self.uniforms_buffer)
             mem.free_alloc(self.uniforms_alloc)
@@ -70,13 +110,10 @@ class DataScene(object):
         if self.descriptor_pool is not None:
             hvk.destroy_descriptor_pool(api, device, self.descriptor_pool)
 
-        for pipeline in self.pipelines:
-            hvk.destroy_pipeline(api, device, pipeline)
-        
-        for pipeline in self.compute_pipelines:
-            hvk.destroy_pipeline(api, device, pipeline)
-
-        hvk.destroy_pipeline_cache(api, device, self.pipeline_cache)
+        # Pipelines that failed to compile are None
+        for pipeline in self.pipelines + self.compute_pipelines:
+            if pipeline is not None:
+                hvk.destroy_pipeline(api, device, pipeline)
 
         if self.meshes_buffer is not None:
             hvk.destroy_buffer(api, device, self.meshes_buffer)
@@ -102,6 +139,9 @@ class DataScene(object):
 
         hvk.destroy_command_pool(api, device, self.command_pool)
 
+        for pool in self.group_pools:
+            hvk.destroy_command_pool(api, device, pool)
+
         for _, pool in self.compute_pools:
             hvk.destroy_command_pool(api, device, pool)
 
@@ -110,30 +150,100 @@ class DataScene(object):
         del self.scene
         del self.shaders
 
+        if compile_error is not None:
+            raise compile_error
+
     @property
     def ctx(self):
         engine = self.engine
         api, device = engine.api, engine.device
         return engine, api, device
 
-    def record(self, framebuffer_index):
-        # Caching things locally to improve lookup speed
-        h = hvk
+    def invalidate_render_commands(self, shader_index=None):
+        """
+            Force the render commands to be recorded again the next time they are used.
+            If `shader_index` is set, only the commands of the objects using this shader are recorded again.
+        """
+        group_versions = self.group_versions
+        if shader_index is None:
+            for group_index in range(len(group_versions)):
+                group_versions[group_index] += 1
+        else:
+            group_versions[self.shader_groups[shader_index]] += 1
 
-        engine, api, device = self.ctx
-        cmd = self.render_commands[framebuffer_index]
-        rc = self.render_cache
+        self.render_version += 1
 
-        pipelines = self.pipelines
-        pipeline_index = None
+    def poll_pipelines(self, wait=False):
+        """
+            Collect the pipelines compiled in the background. Return True if every pipeline of the scene is available.
+            If `wait` is True, block until they are compiled and raise the compile error, if any.
 
-        shaders = self.shaders
-        current_shader_index = None
-        current_shader = None
+            Otherwise, compile errors are only stored in `pipelines_error` and the scene is never ready. This is
+            called while recording a frame, where raising would leave the frame fence unsignaled.
+        """
+        if self.pipelines_ready:
+            return True
+
+        if self.pipelines_error is None:
+            jobs = self.pipeline_jobs + self.compute_pipeline_jobs
+            if not wait and not all(job.done() for job in jobs):
+                return False
+
+            self._collect_pipelines()
+
+        if self.pipelines_error is not None:
+            if wait:
+                raise self.pipelines_error
+            return False
+
+        self.pipelines_ready = True
+
+        count, cached, _ = self.pipeline_stats
+        self.pipeline_stats = (count, cached, perf_counter() - self.pipeline_start)
+
+        # Frames recorded while the pipelines were compiling were empty
+        if self.group_versions is not None:
+            self.invalidate_render_commands()
+
+        return True
+
+    def _collect_pipelines(self):
+        # Keep the pipelines that compiled, even if another one failed, so that they can be destroyed
+        pipeline_jobs, compute_pipeline_jobs = self.pipeline_jobs, self.compute_pipeline_jobs
+        errors = [job.exception() for job in pipeline_jobs + compute_pipeline_jobs]
+        result = lambda job: job.result() if job.exception() is None else None
+
+        self.pipelines = [result(job) for job in pipeline_jobs]
+        self.compute_pipelines = [result(job) for job in compute_pipeline_jobs]
+        self.pipeline_jobs = self.compute_pipeline_jobs = ()
+        self.pipelines_error = next((e for e in errors if e is not None), None)
+
+        self.engine.pipeline_cache.merge()
+
+    def record(self, frame_index, framebuffer_index):
+        """
+            Return the render command buffer for the frame slot `frame_index` and the framebuffer `framebuffer_index`.
+            The command buffer is only recorded if the scene structure changed since the last time it was used.
+            Until the pipelines of the scene are compiled, the render pass only clears the framebuffer.
+        """
+        engine = self.engine
+        ready = self.poll_pipelines()
+        cmd_index = frame_index * engine.render_target.framebuffer_count + framebuffer_index
+        cmd = self.render_commands[cmd_index]
+
+        if self.render_commands_versions[cmd_index] == self.render_version:
+            return cmd
+
+        _, api, device = self.ctx
+        rc = self.render_cache
+
+        # Recording a secondary command buffer invalidates the primary command buffers executing it,
+        # so the groups must be up to date before the primary command buffer is recorded
+        group_commands = ()
+        if ready:
+            group_commands = self._record_groups(frame_index)
+            group_commands = [group_commands[i] for i in self.group_order]
 
-        meshes = self.meshes
-        meshes_buffer = self.meshes_buffer
-        
         # Render pass begin setup
         render_pass_begin = rc["render_pass_begin_info"]
         render_pass_begin.framebuffer = engine.render_target.framebuffers[framebuffer_index]
@@ -141,47 +251,188 @@ class DataScene(object):
         extent = rc["render_area_extent"]
         extent.width, extent.height = engine.info["swapchain_extent"].values()
 
-        viewports = rc["viewports"]
-        scissors = rc["scissors"]
-
         # Recording
-        h.begin_command_buffer(api, cmd, rc["begin_info"])
-        h.begin_render_pass(api, cmd, render_pass_begin, vk.SUBPASS_CONTENTS_INLINE)
+        hvk.begin_command_buffer(api, cmd, rc["begin_info"])
+        hvk.begin_render_pass(api, cmd, render_pass_begin, vk.SUBPASS_CONTENTS_SECONDARY_COMMAND_BUFFERS)
+
+        if len(group_commands) > 0:
+            hvk.execute_commands(api, cmd, group_commands)
+
+        hvk.end_render_pass(api, cmd)
+        hvk.end_command_buffer(api, cmd)
 
-        for data_obj in self.objects:
-            obj = data_obj.obj
+        self.render_commands_versions[cmd_index] = self.render_version
 
-            if data_obj.pipeline is not None and pipeline_index != data_obj.pipeline:
-                pipeline_index = data_obj.pipeline
-                hvk.bind_pipeline(api, cmd, pipelines[pipeline_index], vk.PIPELINE_BIND_POINT_GRAPHICS)
-                hvk.set_viewport(api, cmd, viewports)
-                hvk.set_scissor(api, cmd, scissors)
+        return cmd
+
+    def _record_groups(self, frame_index):
+        # Find the groups that changed since the last time their command buffer was recorded
+        group_commands = self.group_commands[frame_index]
+        recorded_versions = self.group_commands_versions[frame_index]
+        group_versions = self.group_versions
+        dirty_groups = [i for i, version in enumerate(group_versions) if recorded_versions[i] != version]
+
+        groups = self._group_objects_by_shaders()
+        executor = self.engine.renderer.record_executor
+        if executor is None or len(dirty_groups) < 2:
+            for group_index in dirty_groups:
+                self._record_group(frame_index, group_index, groups[group_index])
+        else:
+            # Groups are statically assigned to a worker: the group `i` is recorded by the worker `i % worker_count`,
+            # the owner of the command pool of its command buffers. A worker only uses its own command pool.
+            worker_count = len(self.group_pools)
+            worker_groups = [[g for g in dirty_groups if g % worker_count == i] for i in range(worker_count)]
+            record = lambda assigned: [self._record_group(frame_index, g, groups[g]) for g in assigned]
 
-            if data_obj.shader is not None and current_shader_index != data_obj.shader:
-                current_shader_index = data_obj.shader
-                current_shader = shaders[data_obj.shader]
+            jobs = [executor.submit(record, assigned) for assigned in worker_groups if len(assigned) > 0]
+            for job in jobs:
+                job.result()
 
-                if len(current_shader.descriptor_sets) > 0:
-                    hvk.bind_descriptor_sets(api, cmd, vk.PIPELINE_BIND_POINT_GRAPHICS, current_shader.pipeline_layout, current_shader.descriptor_sets)
+        for group_index in dirty_groups:
+            recorded_versions[group_index] = group_versions[group_index]
+
+        return group_commands
+
+    def _record_group(self, frame_index, group_index, group):
+        # Caching things locally to improve lookup speed
+        h = hvk
+
+        _, api, device = self.ctx
+        cmd = self.group_commands[frame_index][group_index]
+        rc = self.render_cache
+
+        shader_index, objects = group
+        pipeline_index = objects[0].pipeline
+
+        if shader_index is None:
+            h.begin_command_buffer(api, cmd, rc["group_begin_info"])
+            h.end_command_buffer(api, cmd)
+            return
+
+        shader = self.shaders[shader_index]
+        pipeline_layout = shader.pipeline_layout
+        push_constant_ranges = shader.push_constant_ranges
+        global_sets_count = len(shader.descriptor_sets)
+
+        data_objects = self.objects
+        meshes = self.meshes
+        meshes_buffer = self.meshes_buffer
+        current_mesh_index = None
+        binds = saved_binds = 0
 
-            if data_obj.descriptor_sets is not None and len(data_obj.descriptor_sets) > 0:
-                hvk.bind_descriptor_sets(api, cmd, vk.PIPELINE_BIND_POINT_GRAPHICS, current_shader.pipeline_layout, data_obj.descriptor_sets, firstSet=len(current_shader.descriptor_sets))
+        # Every uniform buffer of the scene is dynamic and offset into the slice of the current frame
+        slice_offset = self.uniforms_slice_size * frame_index
+        local_dynamic_offsets = (slice_offset,) * shader.local_dynamic_count
 
-            if data_obj.mesh is not None and not obj.hidden:
-                mesh = meshes[data_obj.mesh]
-                shader = shaders[data_obj.shader]
+        # Recording. Dynamic states are not inherited from the primary command buffer
+        h.begin_command_buffer(api, cmd, rc["group_begin_info"])
+        
+        if pipeline_index is not None:
+            h.bind_pipeline(api, cmd, self.pipelines[pipeline_index], vk.PIPELINE_BIND_POINT_GRAPHICS)
+            h.set_viewport(api, cmd, rc["viewports"])
+            h.set_scissor(api, cmd, rc["scissors"])
+            binds += 1
+
+        if global_sets_count > 0:
+            dynamic_offsets = (slice_offset,) * shader.global_dynamic_count
+            h.bind_descriptor_sets(api, cmd, vk.PIPELINE_BIND_POINT_GRAPHICS, pipeline_layout, shader.descriptor_sets, dynamic_offsets)
+            binds += 1
+
+        # With indirect draws, the draw parameters are read from the uniforms buffer. This way, showing or
+        # hiding an object only updates the buffer instead of recording the commands again.
+        indirect_draws = self.indirect_draws
+        uniforms_buffer = self.uniforms_buffer
+        indirect_offset = slice_offset + shader.indirect_offset
+        indirect_stride = sizeof(vk.DrawIndexedIndirectCommand)
+
+        if shader.instanced:
+            # The instance data is stored in the draw list order, so every run of objects sharing a mesh is a single draw
+            instance_offset = slice_offset + shader.instance_offset
+            instance_stride = sizeof(shader.instance_struct)
+            batches = self.instance_batches[group_index]
+            shared_meshes = self._shared_meshes_layout(shader_index, batches) if indirect_draws else None
+
+            if not indirect_draws or shared_meshes is not None:
+                h.bind_vertex_buffers(api, cmd, (uniforms_buffer,), (instance_offset,), first_binding=shader.instance_binding)
+                binds += 1
+
+            if shared_meshes is not None:
+                # Every batch is drawn from the shared layout of the group meshes: one multi draw for the whole group
+                attributes_buffer = [meshes_buffer] * len(shared_meshes["attribute_offsets"])
+                h.bind_index_buffer(api, cmd, meshes_buffer, shared_meshes["indices_offset"], shared_meshes["indices_type"])
+                h.bind_vertex_buffers(api, cmd, attributes_buffer, shared_meshes["attribute_offsets"])
+                h.draw_indexed_indirect(api, cmd, uniforms_buffer, indirect_offset, len(batches), indirect_stride)
+                binds += 2
+                saved_binds += max(2 * sum(instance_count for _, _, instance_count in batches) - 2, 0)
+                batches = ()
+
+            for batch_index, (mesh_index, first_instance, instance_count) in enumerate(batches):
+                mesh = meshes[mesh_index]
 
                 attributes_buffer = [meshes_buffer] * len(mesh.attribute_offsets)
                 attribute_offsets = mesh.attribute_offsets_for_shader(shader)
 
                 h.bind_index_buffer(api, cmd, meshes_buffer, mesh.indices_offset, mesh.indices_type)
                 h.bind_vertex_buffers(api, cmd, attributes_buffer, attribute_offsets)
+                binds += 2
+                saved_binds += 2 * max(instance_count - 1, 0)
+
+                if indirect_draws:
+                    # `drawIndirectFirstInstance` is an optional feature. Bind the instance data at the first instance of the batch instead.
+                    batch_instance_offset = (instance_offset + first_instance * instance_stride,)
+                    h.bind_vertex_buffers(api, cmd, (uniforms_buffer,), batch_instance_offset, first_binding=shader.instance_binding)
+                    h.draw_indexed_indirect(api, cmd, uniforms_buffer, indirect_offset + batch_index * indirect_stride, 1, indirect_stride)
+                    binds += 1
+                else:
+                    h.draw_indexed(api, cmd, mesh.indices_count, instance_count, first_instance=first_instance)
+
+        else:
+            # The draw list only holds the visible objects (or every object with indirect draws), sorted by mesh.
+            # The index and vertex buffers are only bound when the mesh changes.
+            for position, (_, object_index) in enumerate(self.draw_lists[group_index]):
+                data_obj = data_objects[object_index]
+
+                if data_obj.descriptor_sets:
+                    h.bind_descriptor_sets(api, cmd, vk.PIPELINE_BIND_POINT_GRAPHICS, pipeline_layout, data_obj.descriptor_sets, local_dynamic_offsets, firstSet=global_sets_count)
+                    binds += 1
+
+                # The push constants are copied in the command buffer when they are recorded
+                if push_constant_ranges:
+                    uniforms = data_obj.obj.uniforms
+                    for name, stage_flags, offset, size in push_constant_ranges:
+                        h.push_constants(api, cmd, pipeline_layout, stage_flags, offset, size, addressof(getattr(uniforms, name)))
+
+                mesh_index = int(data_obj.mesh)
+                mesh = meshes[mesh_index]
 
-                h.draw_indexed(api, cmd, mesh.indices_count)
+                if mesh_index != current_mesh_index:
+                    current_mesh_index = mesh_index
+
+                    attributes_buffer = [meshes_buffer] * len(mesh.attribute_offsets)
+                    attribute_offsets = mesh.attribute_offsets_for_shader(shader)
+
+                    h.bind_index_buffer(api, cmd, meshes_buffer, mesh.indices_offset, mesh.indices_type)
+                    h.bind_vertex_buffers(api, cmd, attributes_buffer, attribute_offsets)
+                    binds += 2
+                else:
+                    saved_binds += 2
+
+                if indirect_draws:
+                    h.draw_indexed_indirect(api, cmd, uniforms_buffer, indirect_offset + position * indirect_stride, 1, indirect_stride)
+                else:
+                    h.draw_indexed(api, cmd, mesh.indices_count)
 
-        h.end_render_pass(api, cmd)
         h.end_command_buffer(api, cmd)
 
+        self.group_bind_stats[group_index] = (binds, saved_binds)
+
+    @property
+    def bind_stats(self):
+        """ Number of binds issued and number of binds skipped in the last recording of the render commands """
+        binds = sum(b for b, _ in self.group_bind_stats)
+        saved_binds = sum(s for _, s in self.group_bind_stats)
+        return binds, saved_binds
+
     def apply_updates(self):
         scene = self.scene
         obj_update, shader_update = [], []
@@ -193,8 +444,10 @@ class DataScene(object):
             else:
                 raise RuntimeError(f"Unkown object type {t.__qualname__} in object update list")
 
+            dobj = data_objs[obj.id]
+            self._update_object_state(obj, dobj)
+
             if len(obj.uniforms.updated_member_names) > 0:
-                dobj = data_objs[obj.id]
                 obj_update.append((obj, dobj))
 
         for shader in scene.update_shader_set:
@@ -212,8 +465,42 @@ class DataScene(object):
 
         if len(obj_update) > 0 or len(shader_update) > 0:
             self._update_uniforms(obj_update, shader_update)
-            scene.update_obj_set.clear()
-            scene.update_shader_set.clear()
+
+        if len(scene.textures) != self.texture_count:
+            self.refresh_texture_tables()
+
+        if len(self.pending_descriptor_sets) > 0:
+            self._update_descriptor_sets()
+
+        scene.update_obj_set.clear()
+        scene.update_shader_set.clear()
+
+    def refresh_texture_tables(self):
+        """
+            Rewrite the bindless texture tables from the scene textures. Called when textures are added to the scene
+            and when the layout of an image changes. The tables are written with the next updates.
+        """
+        for set_data, name, obj in self.texture_tables:
+            self._write_texture_table(getattr(set_data.data, name), obj)
+            self.pending_descriptor_sets.add(set_data)
+
+        self.texture_count = len(self.scene.textures)
+
+    def flush_uniforms(self, slice_index):
+        """
+            Write the uniforms updated since the last time the slice `slice_index` was used.
+            Must be called once the GPU is done reading the slice (after its fence was waited on).
+        """
+        if self.uniforms_alloc is None:
+            return
+
+        upload = self.uniforms_upload
+        if upload.pending_count(slice_index) == 0:
+            return
+
+        mem = self.engine.memory_manager
+        with mem.map_alloc(self.uniforms_alloc, self.uniforms_slice_size * slice_index, self.uniforms_slice_size) as mapping:
+            upload.flush(slice_index, mapping.view(self.uniforms_slice_size))
 
     #
     # Setup things
@@ -235,13 +522,12 @@ class DataScene(object):
 
     def _setup_objects(self):
         engine, api, device = self.ctx
-        mem = engine.memory_manager
 
         scene = self.scene
         meshes = scene.meshes
         images = scene.images
 
-        staging_mesh_offset = 0
+        mesh_offset = 0
         data_meshes, data_objects, data_images, data_samplers = [], [], [], []
 
         # Objects setup
@@ -254,27 +540,29 @@ class DataScene(object):
 
         # Meshes setup
         for mesh in meshes:
-            data_mesh = DataMesh(mesh, staging_mesh_offset)
+            data_mesh = DataMesh(mesh, mesh_offset)
             data_meshes.append(data_mesh)
-            staging_mesh_offset += mesh.size()
+            mesh_offset += mesh.size()
 
-        # Images
-        staging_image_offset = (staging_mesh_offset + 256) & ~255   # staging_image_offset must be aligned to 256 bits for uploading purpose
+        self.shared_meshes, mesh_offset = self._setup_shared_meshes(data_objects, data_meshes, mesh_offset)
 
+        # Images
         for image in images:
-            data_image = DataImage(engine, image, staging_image_offset)
+            data_image = DataImage(engine, image)
             data_images.append(data_image)
-            staging_image_offset += image.size()
 
-        if len(meshes) == 0 and len(images) == 0:
-            staging_alloc = staging_buffer = meshes_alloc = meshes_buffer = images_alloc = None
-        else:
-            staging_alloc, staging_buffer = self._setup_objects_staging(staging_image_offset, data_meshes, data_images)
-            meshes_alloc = meshes_buffer = images_alloc = None
+        meshes_alloc = meshes_buffer = images_alloc = None
+        if len(meshes) > 0 or len(images) > 0:
+            # Every resource of the scene is uploaded in a single batch, streamed through the staging ring of the upload manager
+            upload = engine.upload_manager
+            batch = upload.begin()
+
             if len(meshes) > 0:
-                meshes_alloc, meshes_buffer = self._setup_meshes_resources(staging_alloc, staging_buffer, staging_mesh_offset)
+                meshes_alloc, meshes_buffer = self._setup_meshes_resources(batch, data_meshes, mesh_offset)
             if len(images) > 0:
-                images_alloc = self._setup_images_resources(staging_alloc, staging_buffer, data_images)
+                images_alloc = self._setup_images_resources(batch, data_images)
+
+            self.upload_batches.append(upload.submit(batch))
 
         self.meshes_alloc = meshes_alloc
         self.meshes_buffer = meshes_buffer
@@ -284,37 +572,9 @@ class DataScene(object):
         self.samplers = data_samplers
         self.objects = data_objects
 
-        if staging_buffer is not None:
-            hvk.destroy_buffer(api, device, staging_buffer)
-            mem.free_alloc(staging_alloc)
-
-    def _setup_objects_staging(self, staging_size, data_meshes, data_images):
-        engine, api, device = self.ctx
-        mem = engine.memory_manager
-
-        staging_buffer = hvk.create_buffer(api, device, hvk.buffer_create_info(
-            size = staging_size,
-            usage = vk.BUFFER_USAGE_TRANSFER_SRC_BIT
-        ))
-        staging_alloc = mem.alloc(
-            staging_buffer, 
-            vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO, 
-            (vk.MEMORY_PROPERTY_HOST_COHERENT_BIT | vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT,)
-        )
-
-        with mem.map_alloc(staging_alloc) as alloc:
-            for dm in data_meshes:
-                alloc.write_bytes(dm.base_offset, dm.as_ctypes_array())
-            
-            for di in data_images:
-                alloc.write_bytes(di.base_staging_offset, di.as_ctypes_array())
-  
-        return staging_alloc, staging_buffer
-
-    def _setup_meshes_resources(self, staging_alloc, staging_buffer, mesh_buffer_size):
+    def _setup_meshes_resources(self, batch, data_meshes, mesh_buffer_size):
         engine, api, device = self.ctx
         mem = engine.memory_manager
-        cmd = engine.setup_command_buffer
 
         # Final buffer allocation
         mesh_buffer = hvk.create_buffer(api, device, hvk.buffer_create_info(
@@ -324,25 +584,94 @@ class DataScene(object):
         mesh_alloc = mem.alloc(mesh_buffer, vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO, (vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT,))
 
         # Uploading commands
-        region = vk.BufferCopy(src_offset=0, dst_offset=0, size=mesh_buffer_size)
-        regions = (region,)
+        for dm in data_meshes:
+            for offset, data in dm.iter_data():
+                batch.write_buffer(mesh_buffer, dm.base_offset + offset, data)
 
-        hvk.begin_command_buffer(api, cmd, hvk.command_buffer_begin_info())
-        hvk.copy_buffer(api, cmd, staging_buffer, mesh_buffer, regions)
-        hvk.end_command_buffer(api, cmd)
+        for shader_index, layout in self.shared_meshes.items():
+            shader = self.shaders[shader_index]
+            attributes = tuple(zip(shader.ordered_attribute_names, shader.ordered_attribute_strides, layout["attribute_offsets"]))
+
+            for mesh_index, (first_index, vertex_offset) in layout["draws"].items():
+                mesh = data_meshes[mesh_index].mesh
+                batch.write_buffer(mesh_buffer, layout["indices_offset"] + first_index * sizeof(mesh.indices.fmt), mesh.indices.view())
+                for name, stride, offset in attributes:
+                    batch.write_buffer(mesh_buffer, offset + vertex_offset * stride, mesh.attributes[name].view())
 
-        # Submitting
-        engine.submit_setup_command(wait=True)
+        batch.release_buffer(mesh_buffer, vk.ACCESS_VERTEX_ATTRIBUTE_READ_BIT | vk.ACCESS_INDEX_READ_BIT)
 
         return mesh_alloc, mesh_buffer
 
-    def _setup_images_resources(self, staging_alloc, staging_buffer, data_images):
+    def _setup_shared_meshes(self, data_objects, data_meshes, offset):
+        """
+            With indirect draws and multi draw indirect, the meshes of an instanced shader are copied once more in
+            a layout shared by the whole group: the indices of every mesh follow each other, and so do every attribute.
+            A mesh is drawn from this layout with its first index and its vertex offset, so all the batches of the
+            group are drawn with a single indirect draw, without binding their mesh.
+
+            Return the layouts by shader index and the size of the meshes buffer. Shaders whose meshes do not have
+            the same index type, or not the same vertex count in every attribute, are drawn batch by batch.
+        """
+        engine = self.engine
+        if not (self.indirect_draws and engine.info["multi_draw_indirect"]):
+            return {}, offset
+
+        layouts = {}
+        for shader_index, shader in enumerate(self.shaders):
+            if not shader.instanced:
+                continue
+
+            mesh_indices = sorted({int(o.mesh) for o in data_objects if int(o.shader) == shader_index and o.mesh is not None})
+            group_meshes = [data_meshes[i] for i in mesh_indices]
+            if len(group_meshes) < 2 or len({dm.indices_type for dm in group_meshes}) > 1:
+                continue
+
+            vertex_counts = [_vertex_count(shader, dm.mesh) for dm in group_meshes]
+            if None in vertex_counts:
+                continue
+
+            draws, index_count, vertex_count = {}, 0, 0
+            for mesh_index, dm, count in zip(mesh_indices, group_meshes, vertex_counts):
+                draws[mesh_index] = (index_count, vertex_count)
+                index_count += dm.indices_count
+                vertex_count += count
+
+            # Index buffers must be bound at a multiple of the index size
+            offset = _align(offset, 16)
+            indices_offset = offset
+            offset += index_count * sizeof(group_meshes[0].mesh.indices.fmt)
+
+            attribute_offsets = []
+            for stride in shader.ordered_attribute_strides:
+                offset = _align(offset, 16)
+                attribute_offsets.append(offset)
+                offset += vertex_count * stride
+
+            layouts[shader_index] = {
+                "indices_offset": indices_offset,
+                "indices_type": group_meshes[0].indices_type,
+                "attribute_offsets": attribute_offsets,
+                "draws": draws,
+            }
+
+        return layouts, offset
+
+    def _shared_meshes_layout(self, shader_index, batches):
+        # The shared layout of a shader can only be used if every batch mesh is in it. A mesh might have been assigned at runtime.
+        layout = self.shared_meshes.get(shader_index)
+        if layout is None or any(mesh_index not in layout["draws"] for mesh_index, _, _ in batches):
+            return None
+
+        return layout
+
+    def _setup_images_resources(self, batch, data_images):
         engine, api, device = self.ctx
         mem = engine.memory_manager
 
         # Allocate final images memory 
 
         total_images_alloc = 0
+        max_alignment = 1
 
         for data_image in data_images:
             req = hvk.image_memory_requirements(api, device, data_image.image_handle)
@@ -352,77 +681,36 @@ class DataScene(object):
 
             data_image.base_offset = aligned
             total_images_alloc = aligned + req.size
+            max_alignment = max(max_alignment, req.alignment)
 
-        image_alloc = mem.shared_alloc(total_images_alloc, (vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT,))
+        image_alloc = mem.shared_alloc(total_images_alloc, (vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT,), alignment=max_alignment)
 
         # Bind image to memory & create image views
         for data_image in data_images:
             image_handle = data_image.image_handle
-            hvk.bind_image_memory(api, device, image_handle, image_alloc.device_memory, data_image.base_offset)
+            hvk.bind_image_memory(api, device, image_handle, image_alloc.device_memory, image_alloc.offset + data_image.base_offset)
             data_image._setup_views()
             
         # Update the image layouts to match the requested parameters
-        self._setup_image_layouts(staging_buffer, data_images)
+        self._setup_image_layouts(batch, data_images)
 
         return image_alloc
 
-    def _setup_image_layouts(self, staging_buffer, data_images):
-        engine, api, device = self.ctx
+    def _setup_image_layouts(self, batch, data_images):
+        for data_image in data_images:
+            image = data_image.image
 
-        to_transfer = hvk.image_memory_barrier(
-            image = 0,
-            new_layout = vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
-            dst_access_mask = vk.ACCESS_TRANSFER_WRITE_BIT,
             subresource_range = hvk.image_subresource_range(
-                level_count = 0
+                level_count = image.mipmaps_levels,
+                layer_count = image.array_layers
             )
-        )
 
-        to_final_layout = hvk.image_memory_barrier(
-            image = 0,
-            old_layout = vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
-            new_layout = 0,
-            src_access_mask = vk.ACCESS_TRANSFER_WRITE_BIT,
-            dst_access_mask = 0,
-            subresource_range = hvk.image_subresource_range(
-                level_count = 0
+            batch.write_image(
+                data_image.image_handle, image.iter_mipmaps_data(), data_image.block_height,
+                subresource_range, data_image.target_layout, data_image.target_access_mask
             )
-        )
-
-        cmd = engine.setup_command_buffer
-        hvk.begin_command_buffer(api, cmd, hvk.command_buffer_begin_info())
-
-        for data_image in data_images:
-            image = data_image.image
-            image_handle = data_image.image_handle
-            regions = []
-
-            for m in image.iter_mipmaps():
-                r = hvk.buffer_image_copy(
-                    image_subresource = hvk.image_subresource_layers( mip_level = m.level, base_array_layer = m.layer ),
-                    image_extent = vk.Extent3D(m.width, m.height, 1),
-                    buffer_offset =  data_image.base_staging_offset + m.offset
-                )
-                regions.append(r)
-
-            to_transfer.image = image_handle
-            to_transfer.subresource_range.level_count = image.mipmaps_levels
-            to_transfer.subresource_range.layer_count = image.array_layers
-
-            to_final_layout.image = image_handle
-            to_final_layout.new_layout = data_image.target_layout
-            to_final_layout.dst_access_mask = data_image.target_access_mask
-            to_final_layout.subresource_range.level_count = image.mipmaps_levels
-            to_final_layout.subresource_range.layer_count = image.array_layers
-            
-            hvk.pipeline_barrier(api, cmd, (to_transfer,), dst_stage_mask=vk.PIPELINE_STAGE_TRANSFER_BIT)
-            hvk.copy_buffer_to_image(api, cmd, staging_buffer, image_handle, vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, regions)
-            hvk.pipeline_barrier(api, cmd, (to_final_layout,), dst_stage_mask=hvk.dst_stage_mask_for_access_mask(to_final_layout.dst_access_mask))
 
-        hvk.end_command_buffer(api, cmd)
-
-        # Sumbit the images and update the layer values in the images
-        engine.submit_setup_command(wait=True)
+        # The images are in their final layout once the batch is acquired by the render queue, before the scene is used
         for img in data_images:
             img.layout = img.target_layout
             img.access_mask = img.target_access_mask
@@ -432,10 +720,14 @@ class DataScene(object):
         data_shaders, data_computes = self.shaders, self.computes
         
         filters_names = UniformsMaps._NON_UNIFORM_NAMES
+        upload = self.uniforms_upload
 
-        def map_layouts(obj, layouts):
+        def map_layouts(obj, data_obj, layouts, standalone_struct_map=None):
+            offsets = data_obj.uniform_offsets
             uniforms = obj.uniforms
             uniforms_members = [f for f in dir(uniforms) if f[0] != "_" and f not in filters_names]
+            struct_maps = []
+            values, updated = {}, set()
             
             for layout in layouts:
                 # Image based uniforms are specified in `images`
@@ -447,41 +739,61 @@ class DataScene(object):
                     else:
                         uniforms_members.remove(name)
 
-                    uniforms.uniform_names.append(name)
+                    values[name] = default
+
+                struct_maps.append((layout.struct_map, True))
+
+            # Per instance data of instanced shaders and push constants are mapped like local uniforms.
+            # The instances are moved around when the draw lists change and the push constants are recorded
+            # in the command buffers, so they are not views in the shadow copy
+            if standalone_struct_map is not None:
+                struct_maps.append((standalone_struct_map, False))
+
+            # Buffer based uniforms are specified in `struct_map`. They are views into the shadow copy of the
+            # uniforms buffer, so writing a field writes directly in the data uploaded to the device
+            for struct_map, shadowed in struct_maps:
+                for name, struct in struct_map.items():
+                    value = upload.view(struct, offsets[name]) if shadowed else struct()
 
-                # Buffer based uniforms are specified in `struct_map`
-                for name, struct in layout.struct_map.items():
                     default = getattr(uniforms, name, None)
                     if default is not None:
-                        value = struct(**default)
+                        value.__init__(**default)
                         uniforms_members.remove(name)
-                        uniforms.updated_member_names.add(name)
-                    else:
-                        value = struct()
+                        updated.add(name)
 
-                    setattr(uniforms, name, value)
-                    uniforms.uniform_names.append(name)
+                    values[name] = value
 
             if len(uniforms_members) != 0:
                 print(f"WARNING: uniforms for object {obj.name} contains member(s) that do not map with the associated shader: {uniforms_members}")
 
+            obj.uniforms = uniforms.bind(values, updated)
+
         # Shaders global uniforms
         for shader, data_shader in zip(scene.shaders, data_shaders):
-            map_layouts(shader, data_shader.global_layouts)
-            shader.uniforms.bound = True
+            map_layouts(shader, data_shader, data_shader.global_layouts)
 
         # Compute shaders global uniforms
         for compute, data_compute in zip(scene.computes, data_computes):
-            map_layouts(compute, data_compute.global_layouts)
-            compute.uniforms.bound = True
+            map_layouts(compute, data_compute, data_compute.global_layouts)
 
         # Objects local uniforms
-        for obj in scene.objects:
+        for obj, data_obj in zip(scene.objects, self.objects):
             if obj.shader is not None:
                 data_shader = data_shaders[obj.shader]
-                map_layouts(obj, data_shader.local_layouts)
-
-            obj.uniforms.bound = True
+                standalone_struct_map = {**data_shader.instance_struct_map, **data_shader.push_constant_struct_map}
+                map_layouts(obj, data_obj, data_shader.local_layouts, standalone_struct_map)
+            else:
+                obj.uniforms = obj.uniforms.bind({}, ())
+
+        # The shadow copy now holds the default value of every uniform. Copy it in every slice of the ring
+        if upload is not None:
+            mem = self.engine.memory_manager
+            slice_size, slice_count = self.uniforms_slice_size, self.uniforms_slice_count
+            with mem.map_alloc(self.uniforms_alloc) as mapping:
+                dst = mapping.view(slice_size * slice_count)
+                for slice_index in range(slice_count):
+                    offset = slice_index * slice_size
+                    dst[offset:offset+slice_size] = upload.shadow_view
 
     def _setup_pipelines(self):
         engine, api, device = self.ctx
@@ -506,9 +818,10 @@ class DataScene(object):
             dynamic_states = (vk.DYNAMIC_STATE_VIEWPORT, vk.DYNAMIC_STATE_SCISSOR)
         )
 
-        pipeline_infos = []
+        pipeline_infos, pipeline_keys = [], []
         for shader_index, objects in self._group_objects_by_shaders():
             shader = shaders[shader_index]
+            pipeline_keys.append(pipeline_key(shader.shader.vert, shader.shader.frag, mapping=shader.shader.mapping))
 
             for obj in objects:
                 obj.pipeline = shader_index
@@ -529,19 +842,22 @@ class DataScene(object):
 
             pipeline_infos.append(info)
 
-        self.pipeline_cache = hvk.create_pipeline_cache(api, device, hvk.pipeline_cache_create_info())
+        # The pipeline cache is owned by the engine, so pipelines compiled by another scene or a previous run are reused.
+        # Pipelines are compiled in the background and collected by `poll_pipelines`.
+        cache = engine.pipeline_cache
+        cached = cache.track(pipeline_keys)
 
-        if len(pipeline_infos) > 0:
-            self.pipelines = hvk.create_graphics_pipelines(api, device, pipeline_infos, self.pipeline_cache)
-        else:
-            self.pipelines = []
+        self.pipeline_start = perf_counter()
+        self.pipeline_jobs = tuple(cache.create_graphics_pipelines(pipeline_infos))
+        self.pipeline_stats = (len(pipeline_infos), cached, 0.0)
 
     def _setup_compute_pipelines(self):
         engine, api, device = self.ctx
 
-        pipeline_infos = []
+        pipeline_infos, pipeline_keys = [], []
         for compute_index, data_compute in enumerate(self.computes):
             data_compute.pipeline = compute_index
+            pipeline_keys.append(pipeline_key(data_compute.compute.src, mapping=data_compute.compute.mapping))
             
             info = hvk.compute_pipeline_create_info(
                 flags = 0,
@@ -551,10 +867,13 @@ class DataScene(object):
 
             pipeline_infos.append(info)
 
-        if len(pipeline_infos) > 0:
-            self.compute_pipelines = hvk.create_compute_pipelines(api, device, pipeline_infos, self.pipeline_cache)
-        else:
-            self.compute_pipelines = []
+        cache = engine.pipeline_cache
+        cached = cache.track(pipeline_keys)
+
+        self.compute_pipeline_jobs = tuple(cache.create_compute_pipelines(pipeline_infos))
+
+        count, total_cached, _ = self.pipeline_stats
+        self.pipeline_stats = (count + len(pipeline_infos), total_cached + cached, 0.0)
 
     def _setup_descriptor_sets_pool(self):
         _, api, device = self.ctx
@@ -624,12 +943,26 @@ class DataScene(object):
         shaders, computes = self.shaders, self.computes
         descriptor_pool = self.descriptor_pool
         mem = engine.memory_manager
+
+        alignment = engine.info["limits"].min_uniform_buffer_offset_alignment
        
         uniforms_buffer_size = 0
+        instanced = False
+
+        def map_offsets(layouts):
+            # Offsets of the buffer uniforms of a component in a slice of the uniforms buffer
+            nonlocal uniforms_buffer_size
+            offsets = {}
+            for layout in layouts:
+                for name, struct in layout.struct_map.items():
+                    offsets[name] = uniforms_buffer_size
+                    uniforms_buffer_size += _align(sizeof(struct), alignment)
+
+            return offsets
 
         # Allocate shader global descriptor sets
         for data_shader in shaders:
-            uniforms_buffer_size += sum( l.struct_map_size_bytes for l in data_shader.global_layouts )
+            data_shader.uniform_offsets = map_offsets(data_shader.global_layouts)
             set_layouts_global = [ l.set_layout for l in data_shader.global_layouts ]
 
             if len(set_layouts_global) == 0:
@@ -645,7 +978,7 @@ class DataScene(object):
 
         # Allocate compute shader global descriptor sets
         for data_compute in computes:
-            uniforms_buffer_size += sum( l.struct_map_size_bytes for l in data_compute.global_layouts )
+            data_compute.uniform_offsets = map_offsets(data_compute.global_layouts)
             set_layouts_global = [ l.set_layout for l in data_compute.global_layouts ]
 
             if len(set_layouts_global) == 0:
@@ -665,7 +998,19 @@ class DataScene(object):
             objlen = len(objects)
             
             # Uniforms buffer size
-            uniforms_buffer_size += sum( l.struct_map_size_bytes for l in shader.local_layouts ) * objlen
+            for obj in objects:
+                obj.uniform_offsets = map_offsets(shader.local_layouts)
+
+            # Instanced shaders store the per instance data of their objects next to each other
+            if shader.instanced:
+                shader.instance_offset = uniforms_buffer_size
+                uniforms_buffer_size += _align(sizeof(shader.instance_struct) * objlen, alignment)
+                instanced = True
+
+            # Indirect draw commands. There is at most one command per object
+            if self.indirect_draws:
+                shader.indirect_offset = uniforms_buffer_size
+                uniforms_buffer_size += _align(sizeof(vk.DrawIndexedIndirectCommand) * objlen, alignment)
             
             # Descriptor sets allocations
             set_layouts_local = [ l.set_layout for l in shader.local_layouts ] * objlen
@@ -695,9 +1040,20 @@ class DataScene(object):
             self.uniforms_alloc = self.uniforms_buffer = None
             return
 
+        # The uniforms buffer is a ring of slices, one for each frame in flight.
+        # The uniforms of a frame are written in its own slice, so a frame never overwrites data the GPU is still reading
+        slice_size = _align(uniforms_buffer_size, alignment)
+        slice_count = engine.renderer.frames_in_flight
+
+        usage = vk.BUFFER_USAGE_UNIFORM_BUFFER_BIT
+        if instanced:
+            usage |= vk.BUFFER_USAGE_VERTEX_BUFFER_BIT
+        if self.indirect_draws:
+            usage |= vk.BUFFER_USAGE_INDIRECT_BUFFER_BIT
+
         uniforms_buffer = hvk.create_buffer(api, device, hvk.buffer_create_info(
-            size = uniforms_buffer_size, 
-            usage = vk.BUFFER_USAGE_UNIFORM_BUFFER_BIT
+            size = slice_size * slice_count, 
+            usage = usage
         ))
         uniforms_alloc = mem.alloc(
             uniforms_buffer,
@@ -705,88 +1061,51 @@ class DataScene(object):
             (vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT | vk.MEMORY_PROPERTY_HOST_COHERENT_BIT,)
         )
 
-        # Make sure the uniforms are zeroed
-        with mem.map_alloc(uniforms_alloc) as mapping:
-            memset(mapping.pointer2, 0, uniforms_alloc.size)
-
         self.uniforms_alloc = uniforms_alloc
         self.uniforms_buffer = uniforms_buffer
+        self.uniforms_slice_size = slice_size
+        self.uniforms_slice_count = slice_count
+        self.uniforms_upload = UniformsUpload(slice_size, slice_count)
         
     def _setup_descriptor_write_sets(self):
-        _, api, device = self.ctx
-        shaders, computes, data_samplers, data_images = self.shaders, self.computes, self.samplers, self.images
+        engine, api, device = self.ctx
+        shaders, computes = self.shaders, self.computes
         uniform_buffer = self.uniforms_buffer
-        uniform_offset = 0
         
-        write_sets_to_update = []
-
-        def generate_write_set(obj, wst, descriptor_set):
-            nonlocal uniform_buffer, uniform_offset
-            name, dtype, drange, binding = wst['name'], wst['descriptor_type'], wst['range'], wst['binding']
-
-            if dtype == vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER:
-                buffer_info = vk.DescriptorBufferInfo(
-                    buffer = uniform_buffer,
-                    offset = uniform_offset,
-                    range = drange
-                )
-
-                write_set = hvk.write_descriptor_set(
-                    dst_set = descriptor_set,
-                    dst_binding = binding,
-                    descriptor_type = dtype,
-                    buffer_info = (buffer_info,)
-                )
-
-                uniform_offset += drange
-
-            elif dtype in (vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER, vk.DESCRIPTOR_TYPE_STORAGE_IMAGE):
-                image_id, view_name, sampler_id = getattr(obj.uniforms, name)
-
-                data_image = data_images[image_id]
-                data_sampler = data_samplers[sampler_id]
-                data_view = data_image.views.get(view_name, None)
-
-                if data_view is None:
-                    raise ValueError(f"No view named \"{view_name}\" for image \"{data_image.image.name}\"")
-
-                image_info = vk.DescriptorImageInfo(
-                    sampler = data_sampler.sampler_handle,
-                    image_view = data_view,
-                    image_layout = data_image.layout
-                )
-
-                write_set = hvk.write_descriptor_set(
-                    dst_set = descriptor_set,
-                    dst_binding = binding,
-                    descriptor_type = dtype,
-                    image_info = (image_info,)
-                )
-
-                # Clear the accessed uniforms names for images because we don't actually need to mark them as updated
-                obj.uniforms.updated_member_names.remove(name)
-
-            else:
-                raise ValueError(f"Unknown descriptor type: {dtype}")
-
-            return write_set
+        sets_to_update = []
 
         def map_write_sets(data_obj, obj, layouts):
             write_sets = {}
 
+            # The descriptors of a set are packed in a single struct and written with the update template of its layout
             for descriptor_set, descriptor_layout in zip(data_obj.descriptor_sets, layouts):
+                set_data = descriptor_layout.update_template.new_set_data(descriptor_set)
+                sets_to_update.append(set_data)
+
                 for wst in descriptor_layout.write_set_templates:
-                    name = wst["name"]
+                    name, dtype = wst["name"], wst["descriptor_type"]
+                    info = getattr(set_data.data, name)
                     buffer_offset_range = None
 
-                    if wst["buffer"]:
+                    if dtype in (vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER, vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC):
+                        uniform_offset = data_obj.uniform_offsets[name]
                         buffer_offset_range = (uniform_offset, wst["range"])
+                        info.buffer = uniform_buffer
+                        info.offset = uniform_offset
+                        info.range = wst["range"]
+                    elif wst["bindless"]:
+                        self._write_texture_table(info, obj)
+                        self.texture_tables.append((set_data, name, obj))
+                    elif dtype in (vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER, vk.DESCRIPTOR_TYPE_STORAGE_IMAGE):
+                        self._write_image_info(info, getattr(obj.uniforms, name), obj)
+                    else:
+                        raise ValueError(f"Unknown descriptor type: {dtype}")
 
-                    write_set = generate_write_set(obj, wst, descriptor_set)
-                    write_sets_to_update.append(write_set)
                     write_sets[name] = {
                         "buffer_offset_range": buffer_offset_range,
-                        "write_set": write_set
+                        "dynamic": dtype == vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC,
+                        "set_data": set_data,
+                        "push_constant": False
                     }
 
             return write_sets
@@ -804,7 +1123,41 @@ class DataScene(object):
             for data_obj in objects:
                 data_obj.write_sets = map_write_sets(data_obj, data_obj.obj, data_shader.local_layouts)
 
-        hvk.update_descriptor_sets(api, device, write_sets_to_update, ())
+                # Push constants have no descriptor
+                for name in data_shader.push_constant_struct_map:
+                    data_obj.write_sets[name] = {
+                        "buffer_offset_range": None,
+                        "dynamic": False,
+                        "set_data": None,
+                        "push_constant": True
+                    }
+
+        update_descriptor_sets(api, device, sets_to_update)
+        self.texture_count = len(self.scene.textures)
+
+    def _write_texture_table(self, image_infos, obj):
+        textures = self.scene.textures
+        if len(textures) == 0:
+            raise ValueError(f"Component {obj.name} uses a bindless texture table, but the scene has no textures")
+        elif len(textures) > len(image_infos):
+            raise ValueError(f"The scene has {len(textures)} textures, but the texture table of component {obj.name} can only hold {len(image_infos)}")
+
+        # Unused slots repeat the first texture, so that every descriptor of the table is valid
+        for index, image_info in enumerate(image_infos):
+            texture = textures[index] if index < len(textures) else textures[0]
+            self._write_image_info(image_info, texture, obj)
+
+    def _write_image_info(self, image_info, image_sampler, obj):
+        data_image = self.images[image_sampler.image_id]
+        data_sampler = self.samplers[image_sampler.sampler_id]
+        data_view = data_image.views.get(image_sampler.view_name, None)
+
+        if data_view is None:
+            raise ValueError(f"No view named \"{image_sampler.view_name}\" for image \"{data_image.image.name}\" of component {obj.name}")
+
+        image_info.sampler = data_sampler.sampler_handle
+        image_info.image_view = data_view
+        image_info.image_layout = data_image.layout
 
     def _group_objects_by_shaders(self):
         if self.shader_objects_sorted:
@@ -829,21 +1182,182 @@ class DataScene(object):
     def _setup_render_commands(self):
         engine, api, device = self.ctx
         render_queue = engine.render_queue
-        render_target = engine.render_target
 
         command_pool = hvk.create_command_pool(api, device, hvk.command_pool_create_info(
             queue_family_index = render_queue.family.index,
             flags = vk.COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT
         ))
 
+        # One command buffer for each frame slot / framebuffer pair. Once recorded, a command buffer
+        # can be submitted again as long as the structure of the scene does not change
+        command_buffer_count = engine.renderer.frames_in_flight * engine.render_target.framebuffer_count
         cmd_draw = hvk.allocate_command_buffers(api, device, hvk.command_buffer_allocate_info(
             command_pool = command_pool,
-            command_buffer_count = render_target.framebuffer_count,
+            command_buffer_count = command_buffer_count,
             level = vk.COMMAND_BUFFER_LEVEL_PRIMARY
         ))
 
         self.command_pool = command_pool
         self.render_commands = cmd_draw
+        self.render_commands_versions = [None] * command_buffer_count
+
+    def _setup_group_commands(self):
+        engine, api, device = self.ctx
+        render_queue = engine.render_queue
+        frames_in_flight = engine.renderer.frames_in_flight
+        groups = self._group_objects_by_shaders()
+        group_count = len(groups)
+
+        # One command pool per recording thread. Command pools cannot be used by more than one thread at a time.
+        worker_count = max(1, min(engine.renderer.record_threads, group_count))
+        pool_create_info = hvk.command_pool_create_info(
+            queue_family_index = render_queue.family.index,
+            flags = vk.COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT
+        )
+        pools = tuple(hvk.create_command_pool(api, device, pool_create_info) for _ in range(worker_count))
+
+        # One secondary command buffer per frame slot and per group. Group `i` is recorded by the worker `i % worker_count`
+        group_commands = [[None] * group_count for _ in range(frames_in_flight)]
+        for worker_index, pool in enumerate(pools):
+            worker_groups = range(worker_index, group_count, worker_count)
+            if len(worker_groups) == 0:
+                continue
+
+            buffers = iter(hvk.allocate_command_buffers(api, device, hvk.command_buffer_allocate_info(
+                command_pool = pool,
+                command_buffer_count = len(worker_groups) * frames_in_flight,
+                level = vk.COMMAND_BUFFER_LEVEL_SECONDARY
+            )))
+
+            for frame_commands in group_commands:
+                for group_index in worker_groups:
+                    frame_commands[group_index] = next(buffers)
+
+        self.group_pools = pools
+        self.group_commands = group_commands
+        self.group_commands_versions = [[None] * group_count for _ in range(frames_in_flight)]
+        self.group_versions = [0] * group_count
+        self.shader_groups = { shader_index: group_index for group_index, (shader_index, _) in enumerate(groups) }
+        self.group_bind_stats = [(0, 0)] * group_count
+
+    def _setup_draw_lists(self):
+        groups = self._group_objects_by_shaders()
+        draw_lists = []
+
+        for _, objects in groups:
+            draw_list = []
+            for data_obj in objects:
+                data_obj.sort_key = self._draw_key(data_obj)
+                if data_obj.sort_key is not None:
+                    draw_list.append((data_obj.sort_key, int(data_obj.obj.id)))
+
+            draw_list.sort()
+            draw_lists.append(draw_list)
+
+        self.draw_lists = draw_lists
+        self.instance_batches = [() for _ in groups]
+
+        for group_index in range(len(groups)):
+            self._update_instances(group_index)
+            self._update_indirect_commands(group_index)
+
+        # Groups are executed in pipeline order. The draw key of a group is the key of its objects without the mesh and material bits
+        group_key = lambda i: _draw_key_bits(groups[i][1][0].pipeline, groups[i][0], 0, 0)
+        self.group_order = sorted(range(len(groups)), key=group_key)
+
+    def _update_instances(self, group_index):
+        """
+            Place the instance data of the objects of an instanced group in the draw list order and split the
+            draw list in `(mesh_index, first_instance, instance_count)` batches. In a batch, the hidden objects
+            are placed after the visible ones. The objects that are not in the draw list are placed last.
+        """
+        shader_index, objects = self._group_objects_by_shaders()[group_index]
+        if shader_index is None or not self.shaders[shader_index].instanced:
+            return
+
+        shader = self.shaders[shader_index]
+        name, stride = shader.instance_name, sizeof(shader.instance_struct)
+        data_objects = self.objects
+        batches, ordered_objects = [], []
+
+        mesh_of = lambda item: int(data_objects[item[1]].mesh)
+        for mesh_index, items in groupby(self.draw_lists[group_index], key=mesh_of):
+            batch_objects = [data_objects[object_index] for _, object_index in items]
+            visible_objects = [data_obj for data_obj in batch_objects if not data_obj.hidden]
+
+            batches.append((mesh_index, len(ordered_objects), len(visible_objects)))
+            ordered_objects.extend(visible_objects)
+            ordered_objects.extend(data_obj for data_obj in batch_objects if data_obj.hidden)
+
+        ordered_objects.extend(data_obj for data_obj in objects if data_obj.sort_key is None)
+
+        for position, data_obj in enumerate(ordered_objects):
+            offset = shader.instance_offset + position * stride
+            data_obj.write_sets[name] = {
+                "buffer_offset_range": (offset, stride),
+                "dynamic": True,
+                "set_data": None,
+                "push_constant": False
+            }
+
+            self.uniforms_upload.write(offset, getattr(data_obj.obj.uniforms, name))
+
+        self.instance_batches[group_index] = batches
+
+    def _update_indirect_commands(self, group_index):
+        """
+            Write the indirect draw commands of a group. Instanced groups have one command per batch,
+            other groups have one command per object in the draw list. Hidden objects have an instance count of 0.
+            The commands of a group are written consecutively, so a group drawn from its shared meshes layout
+            is a single multi draw.
+        """
+        shader_index, _ = self._group_objects_by_shaders()[group_index]
+        if not self.indirect_draws or shader_index is None:
+            return
+
+        shader = self.shaders[shader_index]
+        meshes, data_objects = self.meshes, self.objects
+        stride = sizeof(vk.DrawIndexedIndirectCommand)
+
+        shared_meshes = None
+        if shader.instanced:
+            draws = self.instance_batches[group_index]
+            shared_meshes = self._shared_meshes_layout(shader_index, draws)
+        else:
+            draws = []
+            for _, object_index in self.draw_lists[group_index]:
+                data_obj = data_objects[object_index]
+                draws.append((int(data_obj.mesh), 0, 0 if data_obj.hidden else 1))
+
+        # Draws from the shared layout start at the mesh first index and vertex and at the batch first instance.
+        # Otherwise, the mesh and the instance data are bound at the start of the draw.
+        for index, (mesh_index, first_instance, instance_count) in enumerate(draws):
+            first_index = vertex_offset = 0
+            if shared_meshes is not None:
+                first_index, vertex_offset = shared_meshes["draws"][mesh_index]
+            else:
+                first_instance = 0
+
+            command = vk.DrawIndexedIndirectCommand(
+                index_count = meshes[mesh_index].indices_count,
+                instance_count = instance_count,
+                first_index = first_index,
+                vertex_offset = vertex_offset,
+                first_instance = first_instance
+            )
+
+            self.uniforms_upload.write(shader.indirect_offset + index * stride, command)
+
+    def _draw_key(self, data_obj):
+        """
+            Pack the state of an object in a 64 bits sort key: pipeline, shader, mesh, material.
+            The local descriptor sets of an object are never shared, so the object index is used as the material.
+            Objects that are not drawn have no key. With indirect draws, hidden objects keep their key.
+        """
+        if data_obj.mesh is None or (data_obj.hidden and not self.indirect_draws):
+            return None
+
+        return _draw_key_bits(data_obj.pipeline, data_obj.shader, data_obj.mesh, data_obj.obj.id)
 
     def _setup_compute_commands(self):
         engine, api, device = self.ctx
@@ -898,6 +1412,17 @@ class DataScene(object):
         self.compute_commands = command_buffers
 
     def _setup_render_cache(self):
+        engine, api, device = self.ctx
+
+        # The swapchain was recreated with a different number of images. Commands are not in use at this point
+        command_buffer_count = engine.renderer.frames_in_flight * engine.render_target.framebuffer_count
+        if len(self.render_commands) != command_buffer_count:
+            hvk.destroy_command_pool(api, device, self.command_pool)
+            self._setup_render_commands()
+
+        # Framebuffers and viewports are baked in the recorded commands
+        self.invalidate_render_commands()
+
         rc = self.render_cache
         width, height = self.engine.info["swapchain_extent"].values()
         viewport = hvk.viewport(width=width, height=height)
@@ -914,6 +1439,13 @@ class DataScene(object):
         )
 
         rc["begin_info"] = hvk.command_buffer_begin_info()
+        rc["group_begin_info"] = hvk.command_buffer_begin_info(
+            flags = vk.COMMAND_BUFFER_USAGE_RENDER_PASS_CONTINUE_BIT,
+            inheritance_info = hvk.command_buffer_inheritance_info(
+                render_pass = self.engine.render_target.render_pass,
+                subpass = 0
+            )
+        )
         rc["viewports"] = (viewport,)
         rc["scissors"] = (scissor,)
         rc["render_pass_begin_info"] = render_pass_begin
@@ -923,63 +1455,96 @@ class DataScene(object):
     # Update things
     #
 
+    def _update_object_state(self, obj, data_obj):
+        if obj.shader != data_obj.shader:
+            raise RuntimeError(f"The shader of object {obj.name} cannot be changed once the object is loaded")
+
+        if obj.hidden != data_obj.hidden or obj.mesh != data_obj.mesh:
+            group_index = self.shader_groups[data_obj.shader]
+            draw_list = self.draw_lists[group_index]
+            object_index = int(obj.id)
+
+            # With indirect draws, the visibility of an object is only stored in the draw commands
+            if self.indirect_draws and obj.mesh == data_obj.mesh and data_obj.mesh is not None:
+                data_obj.hidden = obj.hidden
+                self._update_instances(group_index)
+                self._update_indirect_commands(group_index)
+                return
+
+            if data_obj.sort_key is not None:
+                del draw_list[bisect_left(draw_list, (data_obj.sort_key, object_index))]
+
+            data_obj.hidden = obj.hidden
+            data_obj.mesh = obj.mesh
+            data_obj.sort_key = self._draw_key(data_obj)
+
+            if data_obj.sort_key is not None:
+                insort(draw_list, (data_obj.sort_key, object_index))
+
+            self._update_instances(group_index)
+            self._update_indirect_commands(group_index)
+            self.invalidate_render_commands(data_obj.shader)
+
+    def _update_descriptor_sets(self):
+        # Descriptor sets cannot be updated while they are used by the GPU, and
+        # updating them invalidates the command buffers they were bound in.
+        # Only the frames in flight bind the sets: compute shaders run synchronously and uploads do not use them
+        engine, api, device = self.ctx
+        pending_sets = self.pending_descriptor_sets
+        engine.renderer.wait_frames_in_flight()
+
+        update_start = perf_counter()
+        set_count = update_descriptor_sets(api, device, pending_sets)
+        self.descriptor_update_stats = (set_count, perf_counter() - update_start)
+
+        pending_sets.clear()
+        self.invalidate_render_commands()
+
     def _update_uniforms(self, objects, shaders):
         uniforms_alloc = self.uniforms_alloc
-        base_offset = map_size = None
-        buffer_update_list = []
+        uniforms_upload = self.uniforms_upload
+        static_ranges = []
         
-        data_samplers, data_images = self.samplers, self.images
-        image_write_sets = []
+        pending_sets = self.pending_descriptor_sets
+        pushed_shaders = set()
 
         def read_buffer_offets(uniforms, dobj, obj, uniform_name):
-            nonlocal buffer_update_list, base_offset, map_size
-
             # Skips image uniforms
-            buffer_offset_range = dobj.write_sets[uniform_name]["buffer_offset_range"]
+            write_set_info = dobj.write_sets[uniform_name]
+            buffer_offset_range = write_set_info["buffer_offset_range"]
             if buffer_offset_range is None:
                 return
 
-            # Fetch the new uniform value
+            # Buffer uniforms are views in the shadow copy of the uniforms buffer, so their new value is already in place
+            # and only their pages are marked as dirty. A struct that was replaced by assignment is copied in the shadow copy.
             buffer_value = getattr(uniforms, uniform_name)
+            offset, _ = buffer_offset_range
 
-            # Update the mapping info from the size and offset of the uniforms value
-            offset, size = buffer_offset_range
-            offset_size = offset+size
-            if base_offset is None or offset < base_offset:
-                base_offset = offset 
-
-            if map_size is None or offset_size > map_size:
-                map_size = size
-
-            buffer_update_list.append( (buffer_value, offset) )
-
-        def read_image_write_sets(uniforms, dobj, obj, uniform_name):
-            nonlocal image_write_sets, data_images, data_samplers
+            # Dynamic uniforms are written in each slice of the ring the next time the slice is used.
+            # Static uniforms (compute shaders) only live in the first slice and are written right away
+            dynamic = write_set_info["dynamic"]
+            written = uniforms_upload.write(offset, buffer_value, dynamic)
+            if not dynamic:
+                static_ranges.append(written)
 
+        def read_image_descriptors(uniforms, dobj, obj, uniform_name):
             write_set_info = dobj.write_sets[uniform_name]
-            if write_set_info["buffer_offset_range"] is not None:
+            if write_set_info["buffer_offset_range"] is not None or write_set_info["push_constant"]:
                 return
 
-            # Fetch the new image CombinedSampler value
-            image_sampler = getattr(uniforms, uniform_name)
-            data_sampler = data_samplers[image_sampler.sampler_id]
-            data_image = data_images[image_sampler.image_id]
-            data_view = data_image.views.get(image_sampler.view_name, None)
+            # Update the image info in the packed descriptors of the set. The set is written once per frame,
+            # no matter how many of its images changed
+            set_data = write_set_info["set_data"]
+            image_info = getattr(set_data.data, uniform_name)
+            self._write_image_info(image_info, getattr(uniforms, uniform_name), obj)
 
-            if data_view is None:
-                raise ValueError(f"No view named \"{view_name}\" for image \"{data_image.image.name}\" of component {obj.name}")
-
-            # Fetch the write set associated with the updated uniform value
-            write_set = write_set_info["write_set"]
+            pending_sets.add(set_data)
             
-            # Update the image info
-            image_info = write_set.image_info[0]
-            image_info.sampler = data_sampler.sampler_handle
-            image_info.image_layout = data_image.layout
-            image_info.image_view = data_view
+        def read_push_constants(dobj, uniform_name):
+            # Push constants are recorded in the command buffers. The commands of the object group are recorded again
+            if dobj.write_sets[uniform_name]["push_constant"]:
+                pushed_shaders.add(dobj.shader)
 
-            image_write_sets.append(write_set)
-            
         def process_uniforms(items):
             for obj, data_obj in items:
                 uniforms = obj.uniforms
@@ -987,20 +1552,45 @@ class DataScene(object):
                     # Find the offsets in the uniforms buffer for the updated buffer uniforms
                     read_buffer_offets(uniforms, data_obj, obj, uniform_name)
 
-                    # Fetch the write sets for the updated image uniforms
-                    read_image_write_sets(uniforms, data_obj, obj, uniform_name)
+                    # Write the updated image uniforms in the packed descriptors of their set
+                    read_image_descriptors(uniforms, data_obj, obj, uniform_name)
+
+                    # Find the groups that must record the updated push constants
+                    read_push_constants(data_obj, uniform_name)
                 
                 uniforms.updated_member_names.clear()
 
         process_uniforms(objects)
         process_uniforms(shaders)
 
-        # Update the image uniforms
-        _, api, device = self.ctx
-        hvk.update_descriptor_sets(api, device, image_write_sets, ())
+        for shader_index in pushed_shaders:
+            self.invalidate_render_commands(shader_index)
 
-        # Update the uniform buffers
-        mem = self.engine.memory_manager
-        with mem.map_alloc(uniforms_alloc, base_offset, map_size) as mapping:
-            for value, offset in buffer_update_list:
-                mapping.write_typed_data(value, offset-base_offset)
+        # Update the static uniform buffers
+        if len(static_ranges) > 0:
+            mem = self.engine.memory_manager
+            with mem.map_alloc(uniforms_alloc) as mapping:
+                uniforms_upload.copy(static_ranges, mapping.view(self.uniforms_slice_size))
+
+
+def _draw_key_bits(pipeline, shader, mesh, material):
+    pipeline = 0xFFFF if pipeline is None else int(pipeline) & 0xFFFF
+    shader = 0xFFFF if shader is None else int(shader) & 0xFFFF
+    return pipeline << 48 | shader << 32 | (int(mesh) & 0xFFFF) << 16 | (int(material) & 0xFFFF)
+
+
+def _align(size, alignment):
+    return (size + alignment - 1) & ~(alignment - 1)
+
+
+def _vertex_count(shader, mesh):
+    # Number of vertices of a mesh if every attribute read by the shader has the same one
+    counts = set()
+    for name, stride in zip(shader.ordered_attribute_names, shader.ordered_attribute_strides):
+        attribute = mesh.attributes.get(name)
+        if attribute is None or attribute.size_bytes % stride != 0:
+            return None
+
+        counts.add(attribute.size_bytes // stride)
+
+    return counts.pop() if len(counts) == 1 else None
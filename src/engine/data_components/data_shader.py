@@ -1,5 +1,6 @@
 from vulkan import vk, helpers as hvk
-from .shared import ShaderScope, setup_descriptor_layouts
+from .shared import ShaderScope, setup_descriptor_layouts, uniform_struct
+from ctypes import sizeof
 
 
 class DataShader(object):
@@ -13,22 +14,38 @@ class DataShader(object):
 
         self.vertex_input_state = None
         self.ordered_attribute_names = None
+        self.ordered_attribute_strides = None
+
+        self.instance_name = None
+        self.instance_struct = None
+        self.instance_binding = None
+        self.instance_offset = 0
+        self.indirect_offset = 0
+
+        self.push_constant_ranges = ()
+        self.push_constant_struct_map = {}
 
         self.descriptor_set_layouts = None
         self.pipeline_layout = None
+        self.global_dynamic_count = 0
+        self.local_dynamic_count = 0
 
         self.descriptor_sets = None
         self.write_sets = None
+        self.uniform_offsets = None
 
         self._compile_shader()
         self._setup_vertex_state()
+        self._setup_instance_data()
+        self._setup_push_constants()
         self._setup_descriptor_layouts()
         self._setup_pipeline_layout()
 
     def free(self):
         engine, api, device = self.ctx
 
-        for dset_layout in self.descriptor_set_layouts:
+        for dset_layout in self.descriptor_set_layouts or ():
+            dset_layout.update_template.free(api, device)
             hvk.destroy_descriptor_set_layout(api, device, dset_layout.set_layout)
 
         hvk.destroy_pipeline_layout(api, device, self.pipeline_layout)
@@ -46,11 +63,21 @@ class DataShader(object):
 
     @property
     def local_layouts(self):
-        return (l for l in self.descriptor_set_layouts if l.scope is ShaderScope.LOCAL)
+        return (l for l in self.descriptor_set_layouts or () if l.scope is ShaderScope.LOCAL)
 
     @property
     def global_layouts(self):
-        return (l for l in self.descriptor_set_layouts if l.scope is ShaderScope.GLOBAL)
+        return (l for l in self.descriptor_set_layouts or () if l.scope is ShaderScope.GLOBAL)
+
+    @property
+    def instanced(self):
+        return self.instance_struct is not None
+
+    @property
+    def instance_struct_map(self):
+        if self.instance_struct is None:
+            return {}
+        return {self.instance_name: self.instance_struct}
 
     def _compile_shader(self):
         engine, api, device = self.ctx
@@ -90,7 +117,8 @@ class DataShader(object):
         for binding in mapping["bindings"]:
             bindings.append(hvk.vertex_input_binding_description(
                 binding = binding["id"],
-                stride = binding["stride"]
+                stride = binding["stride"],
+                input_rate = binding.get("rate", vk.VERTEX_INPUT_RATE_VERTEX)
             ))
 
         for attr in mapping["attributes"]:
@@ -101,17 +129,77 @@ class DataShader(object):
                 offset = attr.get("offset", 0)
             ))
 
-        self.ordered_attribute_names = tuple(a["name"] for a in sorted(mapping["attributes"], key = lambda i: i["binding"]))
+        # Per instance attributes are not read from the mesh buffers
+        instance_bindings = [b["id"] for b in mapping["bindings"] if b.get("rate") == vk.VERTEX_INPUT_RATE_INSTANCE]
+        mesh_attributes = [a for a in mapping["attributes"] if a["binding"] not in instance_bindings]
+        mesh_attributes = sorted(mesh_attributes, key = lambda i: i["binding"])
+        strides = {b["id"]: b["stride"] for b in mapping["bindings"]}
+        self.ordered_attribute_names = tuple(a["name"] for a in mesh_attributes)
+        self.ordered_attribute_strides = tuple(strides[a["binding"]] for a in mesh_attributes)
 
         self.vertex_input_state = hvk.pipeline_vertex_input_state_create_info(
             vertex_binding_descriptions = bindings,
             vertex_attribute_descriptions = attributes
         )
 
+    def _setup_instance_data(self):
+        # Instanced shaders read the per object data from a per instance vertex buffer instead of a local uniform buffer.
+        # The mapping "instance" entry describes the per instance struct and the vertex binding it is read from.
+        mapping = self.shader.mapping
+        instance = mapping.get("instance")
+        if instance is None:
+            return
+
+        name, binding_id = instance["name"], instance["binding"]
+        binding = next((b for b in mapping["bindings"] if b["id"] == binding_id), None)
+        if binding is None or binding.get("rate") != vk.VERTEX_INPUT_RATE_INSTANCE:
+            raise ValueError(f"Instance data of shader \"{self.shader.name}\" must be read from a binding with an instance input rate")
+
+        if any(s["scope"] == ShaderScope.LOCAL.value for s in mapping["sets"]):
+            raise ValueError(f"Instanced shader \"{self.shader.name}\" cannot have local descriptor sets")
+
+        struct = uniform_struct(name, instance["fields"])
+        if sizeof(struct) != binding["stride"]:
+            raise ValueError(f"Instance stride of shader \"{self.shader.name}\" must be {sizeof(struct)}, got {binding['stride']}")
+
+        self.instance_name = name
+        self.instance_struct = struct
+        self.instance_binding = binding_id
+
+    def _setup_push_constants(self):
+        # Small per object data can be pushed in the command buffers instead of being read from a uniform buffer.
+        # Each entry of the mapping "push_constants" is a struct placed right after the previous one.
+        mapping = self.shader.mapping
+        push_constants = mapping.get("push_constants", ())
+        if len(push_constants) == 0:
+            return
+
+        if self.instanced:
+            raise ValueError(f"Instanced shader \"{self.shader.name}\" cannot have push constants")
+
+        ranges, structs, offset = [], {}, 0
+        for push_constant in push_constants:
+            name = push_constant["name"]
+            struct = uniform_struct(name, push_constant["fields"])
+            ranges.append((name, push_constant["stage"], offset, sizeof(struct)))
+            structs[name] = struct
+            offset += sizeof(struct)
+
+        max_size = self.engine.info["limits"].max_push_constants_size
+        if offset > max_size:
+            raise ValueError(f"Push constants of shader \"{self.shader.name}\" use {offset} bytes, but the device supports at most {max_size} bytes")
+
+        self.push_constant_ranges = tuple(ranges)
+        self.push_constant_struct_map = structs
+
     def _setup_descriptor_layouts(self):
         engine, api, device = self.ctx
         mappings = self.shader.mapping
-        self.descriptor_set_layouts = setup_descriptor_layouts(self, engine, api, device, mappings)
+        self.descriptor_set_layouts = layouts = setup_descriptor_layouts(self, engine, api, device, mappings, dynamic_uniforms=True)
+
+        if layouts is not None:
+            self.global_dynamic_count = sum(l.dynamic_count for l in self.global_layouts)
+            self.local_dynamic_count = sum(l.dynamic_count for l in self.local_layouts)
 
     def _setup_pipeline_layout(self):
         _, api, device = self.ctx
@@ -119,6 +207,12 @@ class DataShader(object):
         set_layouts = self.descriptor_set_layouts or ()
         set_layouts = [l.set_layout for l in set_layouts]
 
+        push_constant_ranges = [
+            vk.PushConstantRange(stage_flags=stage, offset=offset, size=size)
+            for _, stage, offset, size in self.push_constant_ranges
+        ]
+
         self.pipeline_layout = hvk.create_pipeline_layout(api, device, hvk.pipeline_layout_create_info(
-            set_layouts = set_layouts
+            set_layouts = set_layouts,
+            push_constant_ranges = push_constant_ranges
         ))
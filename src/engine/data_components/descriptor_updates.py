@@ -0,0 +1,118 @@
+from vulkan import vk, helpers as hvk
+from ctypes import Structure, POINTER, addressof, pointer, cast
+
+
+class DescriptorUpdateTemplate(object):
+    """
+        Write every descriptor of a descriptor set from a packed struct (`data_struct`) with one field
+        per binding: a `DescriptorBufferInfo` for the uniform buffers and a `DescriptorImageInfo` for the images.
+        Bindless texture tables are arrays of `DescriptorImageInfo`.
+
+        If the device supports descriptor update templates (core in Vulkan 1.1, `VK_KHR_descriptor_update_template` before),
+        a set is written with a single `vkUpdateDescriptorSetWithTemplate` call. Otherwise, the template is emulated
+        with write sets that point to the fields of the packed struct (see `DescriptorSetData`).
+    """
+
+    __slots__ = ('handle', 'data_struct', 'write_set_templates')
+
+    def __init__(self, api, device, set_layout, write_set_templates, native):
+        fields = []
+        for wst in write_set_templates:
+            info_type = vk.DescriptorBufferInfo if wst["buffer"] else vk.DescriptorImageInfo
+            if wst["bindless"]:
+                info_type = info_type * wst["count"]
+
+            fields.append((wst["name"], info_type))
+
+        self.data_struct = type("DescriptorSetData", (Structure,), {'_fields_': fields})
+        self.write_set_templates = write_set_templates
+        self.handle = None
+
+        if native:
+            entries = []
+            for wst in write_set_templates:
+                field = getattr(self.data_struct, wst["name"])
+                entries.append(hvk.descriptor_update_template_entry(
+                    dst_binding = wst["binding"],
+                    descriptor_type = wst["descriptor_type"],
+                    descriptor_count = wst["count"],
+                    offset = field.offset,
+                    stride = field.size // wst["count"]
+                ))
+
+            self.handle = hvk.create_descriptor_update_template(api, device, hvk.descriptor_update_template_create_info(
+                descriptor_update_entries = entries,
+                descriptor_set_layout = set_layout
+            ))
+
+    def free(self, api, device):
+        if self.handle is not None:
+            hvk.destroy_descriptor_update_template(api, device, self.handle)
+
+    def new_set_data(self, descriptor_set):
+        return DescriptorSetData(self, descriptor_set)
+
+
+class DescriptorSetData(object):
+    """
+        The packed descriptors of a descriptor set. The fields of `data` are edited in place and written to the
+        descriptor set by `update_descriptor_sets`. When the template is emulated, `writes` holds the write sets
+        pointing to the fields of `data`, so they are built once.
+    """
+
+    __slots__ = ('template', 'descriptor_set', 'data', 'data_address', 'writes')
+
+    def __init__(self, template, descriptor_set):
+        self.template = template
+        self.descriptor_set = descriptor_set
+        self.data = data = template.data_struct()
+        self.data_address = addressof(data)
+        self.writes = None
+
+        if template.handle is None:
+            writes = []
+            for wst in template.write_set_templates:
+                info = getattr(data, wst["name"])
+                if wst["bindless"]:
+                    info = cast(info, POINTER(info._type_))
+                else:
+                    info = pointer(info)
+
+                writes.append(vk.WriteDescriptorSet(
+                    type = vk.STRUCTURE_TYPE_WRITE_DESCRIPTOR_SET,
+                    next = None,
+                    dst_set = descriptor_set,
+                    dst_binding = wst["binding"],
+                    dst_array_element = 0,
+                    descriptor_count = wst["count"],
+                    descriptor_type = wst["descriptor_type"],
+                    buffer_info = info if wst["buffer"] else None,
+                    image_info = None if wst["buffer"] else info,
+                    texel_buffer_view = None
+                ))
+
+            self.writes = tuple(writes)
+
+
+def update_descriptor_sets(api, device, set_datas):
+    """
+        Write the descriptors of `set_datas` (an iterable of `DescriptorSetData`). Native templates use one call per set.
+        The write sets of emulated templates are packed in a single array and written with one `vkUpdateDescriptorSets` call.
+        Return the number of sets updated.
+    """
+    # This is called with every set that changed in a frame, so the template function is looked up once
+    update_with_template = getattr(api, "UpdateDescriptorSetWithTemplate", None)
+    emulated, count = [], 0
+
+    for set_data in set_datas:
+        count += 1
+        handle = set_data.template.handle
+        if handle is not None:
+            update_with_template(device, set_data.descriptor_set, handle, set_data.data_address)
+        else:
+            emulated.extend(set_data.writes)
+
+    if len(emulated) > 0:
+        hvk.update_descriptor_sets(api, device, emulated, ())
+
+    return count
@@ -1,5 +1,6 @@
 from ctypes import Structure, sizeof, c_uint8, c_int32, c_float
 from vulkan import vk, helpers as hvk
+from .descriptor_updates import DescriptorUpdateTemplate
 from functools import lru_cache
 from enum import Enum
 from io import BytesIO
@@ -7,13 +8,15 @@ from io import BytesIO
 
 class DescriptorSetLayout(object):
 
-    def __init__(self, set_layout, scope, struct_map, images, pool_size_counts, write_set_templates):
+    def __init__(self, set_layout, scope, struct_map, images, pool_size_counts, write_set_templates, update_template, dynamic_count=0):
         self.set_layout = set_layout
         self.scope = ShaderScope(scope)
         self.struct_map = struct_map
         self.images = images
         self.pool_size_counts = pool_size_counts
         self.write_set_templates = write_set_templates
+        self.update_template = update_template
+        self.dynamic_count = dynamic_count
 
         self.struct_map_size_bytes = sum( sizeof(s) for s in struct_map.values() )
 
@@ -44,7 +47,12 @@ class ShaderScope(Enum):
     LOCAL = 1
 
 
-def setup_descriptor_layouts(shader, engine, api, device, mappings):
+def setup_descriptor_layouts(shader, engine, api, device, mappings, dynamic_uniforms=False):
+    """
+        Create the descriptor set layouts of a shader from its mapping.
+        If `dynamic_uniforms` is True, uniform buffers are declared as dynamic uniform buffers so that
+        the uniforms of every frame in flight can live in their own slice of the scene uniforms buffer.
+    """
 
     if len(mappings["uniforms"]) == 0:
             return
@@ -58,33 +66,20 @@ def setup_descriptor_layouts(shader, engine, api, device, mappings):
 
     layouts = []
 
-    def init_fn(me, **defaults):
-        me_cls = type(me)
-        members = [name for name, _ in me_cls._fields_]
-        bad_members = [m for m in defaults.keys() if not m in members]
-        if len(bad_members) > 0:
-            print(f"WARNING: some unkown members were found when creating uniform \"{me_cls.__qualname__}\": {bad_members}")
-
-        super(me_cls, me).__init__(**defaults)
-
-    def repr_fn(me):
-        type_name = type(me).__qualname__
-        fields = {}
-        for name, ctype in me._fields_:
-            value = getattr(me, name)
-            if hasattr(value, '_length_'):
-                fields[name] = value[::]
-            else:
-                fields[name] = value
-                
-        return f"Uniform(name={type_name}, fields={repr(fields)})"
-
     for dset, uniforms in group_uniforms_by_sets(mappings):
         counts, structs, images, bindings, wst = {}, {}, [], [], []
+        dynamic_count = 0
 
         for uniform in uniforms:
             uniform_name, dtype, dcount, ubinding = uniform["name"], uniform["type"], uniform["count"], uniform["binding"]
             buffer = True
+            bindless = uniform.get("bindless", False)
+
+            if dynamic_uniforms and dtype == vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER:
+                dtype = vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC
+
+            if dtype == vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC:
+                dynamic_count += dcount
 
             # Counts used for the descriptor pool max capacity
             if dtype in counts:
@@ -95,21 +90,12 @@ def setup_descriptor_layouts(shader, engine, api, device, mappings):
             # ctypes Struct used when allocating uniforms buffers
             struct_size = None
             if dtype in (vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER, vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC):
-                size_of = 0
-                args = []
-                for field in uniform["fields"]:
-                    field_name = field["name"]
-                    field_ctype = uniform_member_as_ctype(field["type"], field["count"])
-                    size_of += sizeof(field_ctype)
-                    args.append((field_name, field_ctype))
-
-                padding = (-size_of & (uniform_buffer_align - 1))
-                if padding > 0:
-                    args.append(("PADDING", c_uint8*padding))
-
-                struct = type(uniform_name, (Structure,), {'_pack_': 16, '_fields_': args,  '__init__': init_fn, '__repr__': repr_fn})
+                struct = uniform_struct(uniform_name, uniform["fields"], uniform_buffer_align)
                 struct_size = sizeof(struct)
                 structs[uniform_name] = struct
+            elif bindless:
+                check_texture_table(engine, dset, uniform)
+                buffer = False
             elif dtype in (vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER, vk.DESCRIPTOR_TYPE_STORAGE_IMAGE):
                 images.append(uniform_name)
                 buffer = False
@@ -132,18 +118,23 @@ def setup_descriptor_layouts(shader, engine, api, device, mappings):
                 "descriptor_type": dtype,
                 "range": struct_size,
                 "binding": ubinding,
-                "buffer": buffer
+                "buffer": buffer,
+                "bindless": bindless,
+                "count": dcount if bindless else 1
             })
 
         # Associate the values to the descriptor set layout wrapper
         info = hvk.descriptor_set_layout_create_info(bindings = bindings)
+        set_layout = hvk.create_descriptor_set_layout(api, device, info)
         dset_layout = DescriptorSetLayout(
-            set_layout = hvk.create_descriptor_set_layout(api, device, info),
+            set_layout = set_layout,
             scope = dset["scope"],
             struct_map = structs,
             images = images,
             pool_size_counts = tuple(counts.items()),
             write_set_templates = wst,
+            update_template = DescriptorUpdateTemplate(api, device, set_layout, wst, engine.info["descriptor_update_templates"]),
+            dynamic_count = dynamic_count
         )
 
         layouts.append(dset_layout)
@@ -151,6 +142,68 @@ def setup_descriptor_layouts(shader, engine, api, device, mappings):
     return layouts
 
 
+def check_texture_table(engine, dset, uniform):
+    """
+        A bindless uniform is an array of combined image samplers filled with the textures of the scene (`Scene.textures`).
+        The shader selects a texture with an index read from a uniform, so the index is the same for a whole draw.
+    """
+    name, count = uniform["name"], uniform["count"]
+
+    if uniform["type"] != vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER:
+        raise ValueError(f"Bindless uniform \"{name}\" must be a combined image sampler array")
+
+    if ShaderScope(dset["scope"]) is not ShaderScope.GLOBAL:
+        raise ValueError(f"Bindless uniform \"{name}\" must be in a global descriptor set")
+
+    if not engine.info["bindless_textures"]:
+        raise RuntimeError("Bindless textures require the \"shaderSampledImageArrayDynamicIndexing\" feature, which is not supported by the device")
+
+    limits = engine.info["limits"]
+    max_count = min(limits.max_per_stage_descriptor_samplers, limits.max_per_stage_descriptor_sampled_images)
+    if count > max_count:
+        raise ValueError(f"Bindless uniform \"{name}\" has {count} textures, but the device supports at most {max_count}")
+
+
+def uniform_struct(name, fields, alignment=1):
+    """ Create the ctypes Structure of a uniform from its fields. The structure size is padded to `alignment` """
+    size_of = 0
+    args = []
+    for field in fields:
+        field_name = field["name"]
+        field_ctype = uniform_member_as_ctype(field["type"], field["count"])
+        size_of += sizeof(field_ctype)
+        args.append((field_name, field_ctype))
+
+    padding = (-size_of & (alignment - 1))
+    if padding > 0:
+        args.append(("PADDING", c_uint8*padding))
+
+    return type(name, (Structure,), {'_pack_': 16, '_fields_': args,  '__init__': _uniform_init, '__repr__': _uniform_repr})
+
+
+def _uniform_init(me, **defaults):
+    me_cls = type(me)
+    members = [name for name, _ in me_cls._fields_]
+    bad_members = [m for m in defaults.keys() if not m in members]
+    if len(bad_members) > 0:
+        print(f"WARNING: some unkown members were found when creating uniform \"{me_cls.__qualname__}\": {bad_members}")
+
+    super(me_cls, me).__init__(**defaults)
+
+
+def _uniform_repr(me):
+    type_name = type(me).__qualname__
+    fields = {}
+    for name, ctype in me._fields_:
+        value = getattr(me, name)
+        if hasattr(value, '_length_'):
+            fields[name] = value[::]
+        else:
+            fields[name] = value
+            
+    return f"Uniform(name={type_name}, fields={repr(fields)})"
+
+
 def group_uniforms_by_sets(mappings):
     sets = mappings["sets"]
     uniforms = mappings["uniforms"]
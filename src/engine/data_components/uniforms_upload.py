@@ -0,0 +1,107 @@
+from ctypes import c_uint8, sizeof, addressof
+
+
+# The shadow copy is tracked in pages of 256 bytes. A page is the smallest range copied to the device.
+PAGE_SHIFT = 8
+PAGE_SIZE = 1 << PAGE_SHIFT
+
+
+class UniformsUpload(object):
+    """
+        CPU side copy of a slice of the uniforms buffer ring (`shadow`), laid out exactly like the slice.
+
+        Uniform structs are `from_buffer` views into the shadow copy (see `view`), so writing a uniform field writes
+        directly in the shadow copy. Each slice of the ring keeps the pages written since it was last flushed.
+        When a slice is flushed, its dirty pages are merged in runs and each run is copied to the mapped memory
+        with a single slice assignment (a memcpy).
+    """
+
+    __slots__ = ('shadow', 'shadow_view', 'shadow_address', 'pending')
+
+    def __init__(self, size, slice_count):
+        self.shadow = bytearray(size)
+        self.shadow_view = memoryview(self.shadow)
+        self.shadow_address = addressof(c_uint8.from_buffer(self.shadow)) if size > 0 else 0
+        self.pending = tuple(set() for _ in range(slice_count))
+
+    def view(self, struct, offset):
+        """ Return an instance of the ctypes type `struct` that lives in the shadow copy at `offset` """
+        return struct.from_buffer(self.shadow, offset)
+
+    def write(self, offset, value, dynamic=True):
+        """
+            Mark the range of `value` at `offset` as dirty. If `value` is not a view in the shadow copy at `offset`,
+            it is copied first. If `dynamic` is True, the range is uploaded to every slice the next time they are
+            flushed. Otherwise the caller must `copy` it. Return the written range.
+        """
+        size = sizeof(value)
+        if addressof(value) != self.shadow_address + offset:
+            self.shadow[offset:offset+size] = value
+
+        if dynamic:
+            first, last = offset >> PAGE_SHIFT, (offset + size - 1) >> PAGE_SHIFT
+            for pending in self.pending:
+                if first == last:
+                    pending.add(first)
+                else:
+                    pending.update(range(first, last+1))
+
+        return offset, size
+
+    def pending_count(self, slice_index):
+        return len(self.pending[slice_index])
+
+    def plan(self, slice_index):
+        """ Return the `(offset, size)` runs that will be copied by the next flush of `slice_index` """
+        return page_runs(self.pending[slice_index], len(self.shadow))
+
+    def flush(self, slice_index, dst):
+        """
+            Copy the pages written since the last flush of `slice_index` to `dst` (a writable memoryview of the slice).
+            Return the copied runs.
+        """
+        pending = self.pending[slice_index]
+        if len(pending) == 0:
+            return ()
+
+        runs = self._copy_runs(page_runs(pending, len(self.shadow)), dst)
+        pending.clear()
+
+        return runs
+
+    def copy(self, ranges, dst):
+        """ Copy the pages covered by the `(offset, size)` ranges of the shadow copy to `dst`. Return the copied runs. """
+        pages = set()
+        for offset, size in ranges:
+            pages.update(range(offset >> PAGE_SHIFT, ((offset + size - 1) >> PAGE_SHIFT) + 1))
+
+        return self._copy_runs(page_runs(pages, len(self.shadow)), dst)
+
+    def _copy_runs(self, runs, dst):
+        src = self.shadow_view
+        for offset, size in runs:
+            end = offset + size
+            dst[offset:end] = src[offset:end]
+
+        return runs
+
+
+def page_runs(pages, size):
+    """ Merge the consecutive page indices of `pages` in `(offset, size)` byte runs clamped to `size` """
+    runs = []
+    start = end = None
+
+    for page in sorted(pages):
+        if page == end:
+            end += 1
+            continue
+
+        if start is not None:
+            runs.append((start << PAGE_SHIFT, (end - start) << PAGE_SHIFT))
+
+        start, end = page, page + 1
+
+    if start is not None:
+        runs.append((start << PAGE_SHIFT, min(end << PAGE_SHIFT, size) - (start << PAGE_SHIFT)))
+
+    return runs
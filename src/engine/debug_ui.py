@@ -106,6 +106,7 @@ class DebugUI(object):
             uni = getattr(com.uniforms, message["uniform"])
             field = getattr(uni, message["field"])
             field[::] = message["value"]
+            com.uniforms.touch(message["uniform"])
             comset.add(com)
         except Exception as e:
             print(f"Failed to associate new uniform value: {e}")
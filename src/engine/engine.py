@@ -1,13 +1,17 @@
 from enum import IntFlag
 from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, Future
 from system import Window, events as evt
 from vulkan import vk, helpers as hvk
 from . import Queue, ImageAndView
 from .memory_manager import MemoryManager
+from .pipeline_cache import PipelineCache
+from .upload_manager import UploadManager
 from .render_target import RenderTarget
 from .renderer import Renderer
 from .compute_runner import ComputeRunner
 from .data_components import DataScene
+import threading
 
 
 # Tells the engine to instantiate a Debugger object that will logs various vulkan information 
@@ -49,21 +53,29 @@ class Engine(object):
         self.api = self.instance = self.device = self.physical_device = None
         self.debugger = self.debug_ui = self.surface = self.render_queue = None
         self.queues = self.swapchain = self.swapchain_images = None
-        self.command_pool = self.setup_command_buffer = self.setup_fence = None
         self.info = {}
 
         self.graph = []
         self.current_scene_index = None
 
+        # Scenes are loaded one at a time in the background. `loading` holds the `(scene, job, future)` of the scenes being loaded.
+        self.load_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="load")
+        self.loading = []
+        self.pending_activation = None     # Scene activated by `poll_loads` once it is loaded, see `load_async`
+
+        # Vulkan queues are externally synchronized. Every queue submit, present and wait idle must hold this lock.
+        self.queue_lock = threading.RLock()
+
         self._setup_instance()
         self._setup_debugger()
         self._setup_surface()
         self._setup_device()
         self._setup_device_info()
         self._setup_swapchain()
-        self._setup_setup_commands()
 
         self.memory_manager = MemoryManager(self)
+        self.pipeline_cache = PipelineCache(self)
+        self.upload_manager = UploadManager(self)
         self.render_target = RenderTarget(self)
 
         self.renderer = Renderer(self)
@@ -72,17 +84,27 @@ class Engine(object):
     def free(self):
         api, i, d = self.api, self.instance, self.device
 
-        hvk.device_wait_idle(api, d)
+        self.load_executor.shutdown()
+
+        with self.queue_lock:
+            hvk.device_wait_idle(api, d)
 
-        hvk.destroy_command_pool(api, d, self.command_pool)
-        hvk.destroy_fence(api, d, self.setup_fence)
+        if self.debug:
+            print(self.renderer.stats)
 
         for scene in self.graph:
             scene.free()
 
+        # Scenes loaded in the background that were never registered
+        for _, job, _ in self.loading:
+            if job.exception() is None:
+                job.result().free()
+
         self.compute_runner.free()
         self.renderer.free()
         self.render_target.free()
+        self.upload_manager.free()
+        self.pipeline_cache.free()
         self.memory_manager.free()
 
         hvk.destroy_swapchain(api, d, self.swapchain)
@@ -101,16 +123,70 @@ class Engine(object):
         self.window.destroy()
 
     def load(self, scene):
+        """ Load `scene` and block until it is ready """
+        future = self.load_async(scene)
+        self._wait_load(scene)
+        future.result()
+
+    def load_async(self, scene, activate=False):
+        """
+            Load `scene` in the background and return a future resolved with the scene once it is loaded.
+            The scene resources are created and uploaded on a worker thread while the current scene is still rendered.
+            The scene is registered and `on_initialized` is called by the main thread, in `update`. The done callbacks
+            of the future are also called by the main thread.
+
+            If `activate` is True, the scene is activated by `update` once it is loaded. If the load fails, the error
+            is raised by `update`. Only the last scene requested with `activate` is activated.
+        """
         if scene.loaded:
-            return
+            if activate:
+                self.pending_activation = None
+                self.activate(scene)
 
-        scene_data = DataScene(self, scene)
-        scene.id = len(self.graph)
-        self.graph.append(scene_data)
+            future = Future()
+            future.set_result(scene)
+            return future
 
-        scene.on_initialized()
+        if activate:
+            self.pending_activation = scene
+
+        loading = next((l for l in self.loading if l[0] is scene), None)
+        if loading is not None:
+            return loading[2]
+
+        job = self.load_executor.submit(DataScene, self, scene)
+        future = Future()
+        self.loading.append((scene, job, future))
+
+        return future
+
+    def poll_loads(self):
+        """ Register the scenes loaded in the background since the last call. Called by `update`. """
+        upload = self.upload_manager
+        for loading in tuple(self.loading):
+            job = loading[1]
+            if not job.done():
+                continue
+
+            # The scene is registered once its resources are uploaded and acquired by the render queue
+            if job.exception() is None and not upload.acquire(job.result().upload_batches, wait=False):
+                continue
+
+            self._finish_load(loading)
+
+            scene, _, future = loading
+            if scene is self.pending_activation:
+                self.pending_activation = None
+                if future.exception() is not None:
+                    raise future.exception()
+
+                self.activate(scene)
 
     def activate(self, scene):
+        self._wait_load(scene)
+        if scene is self.pending_activation:
+            self.pending_activation = None
+
         assert scene.id is not None, "Scene was not loaded in engine"
 
         # Skip any setup events in the system event queue
@@ -122,12 +198,26 @@ class Engine(object):
         self.running = True
         self.current_scene_index = scene.id
 
+        # The swapchain might have been resized while the scene was not active
+        self.graph[scene.id]._setup_render_cache()
+
         if self.debug_ui is not None:
             scene_data = self.graph[scene.id]
             self.debug_ui.load_scene(scene_data)
 
     def update(self):
+        if len(self.loading) > 0:
+            self.poll_loads()
+
+        self.upload_manager.collect()
+
         scene_data = self.graph[self.current_scene_index]
+
+        # Errors of the pipelines compiled in the background are raised here, outside of the frame recording
+        if not scene_data.poll_pipelines() and scene_data.pipelines_error is not None:
+            raise scene_data.pipelines_error
+
+        scene_data.scene.on_update()
         scene_data.apply_updates()
 
     def events(self):
@@ -170,22 +260,36 @@ class Engine(object):
 
         data_scene = self.graph[scene.id]
         data_compute = data_scene.computes[compute.id]
+        data_scene.poll_pipelines(wait=True)
+
+        # Uploads are acquired by the render queue. Other queues cannot rely on the submission order.
+        if data_compute.queue.family.index != self.render_queue.family.index:
+            self.upload_manager.wait(data_scene.upload_batches)
         self.compute_runner.run(data_scene, data_compute, group, sync=sync, before=before, after=after, callback=callback)
 
-    def submit_setup_command(self, wait=False):
-        api, device = self.api, self.device
-        fence = 0
+    def _wait_load(self, scene):
+        loading = next((l for l in self.loading if l[0] is scene), None)
+        if loading is not None:
+            self._finish_load(loading)
+
+    def _finish_load(self, loading):
+        # Block until the scene is loaded, then register it. Errors raised by the load are set on the future
+        scene, job, future = loading
+        self.loading.remove(loading)
+
+        try:
+            scene_data = job.result()
+        except BaseException as e:
+            future.set_exception(e)
+            return
 
-        if wait:
-            fence = self.setup_fence
+        self.upload_manager.acquire(scene_data.upload_batches)
 
-        infos = (hvk.submit_info(command_buffers=(self.setup_command_buffer,)),)
-        hvk.queue_submit(api, self.render_queue.handle, infos, fence)
+        scene.id = len(self.graph)
+        self.graph.append(scene_data)
 
-        if wait:
-            f = (fence,)
-            hvk.wait_for_fences(api, device, f)
-            hvk.reset_fences(api, device, f)
+        scene.on_initialized()
+        future.set_result(scene)
 
     # Setup functions
 
@@ -255,12 +359,22 @@ class Engine(object):
                     failure_reasons.append(f"No queue family matches the required configuration {qconf} on device #{index}")
                     break
 
-                # Update the queue create info array
-                new_info = {"queue_family_index": queue_family.index, "queue_count": 0}
-                queue_create_info = next((qc for qc in queue_create_infos if qc["queue_family_index"] == queue_family.index), new_info)
-                queue_create_infos.append(queue_create_info)
+                # Optional queue configurations without a matching family are not available in `Engine.queues`
+                if queue_family is None:
+                    continue
+
+                # Update the queue create info array. A family can only appear once in the array.
+                queue_create_info = next((qc for qc in queue_create_infos if qc["queue_family_index"] == queue_family.index), None)
+                if queue_create_info is None:
+                    queue_create_info = {"queue_family_index": queue_family.index, "queue_count": 0}
+                    queue_create_infos.append(queue_create_info)
+
+                # If the family has no queue left, the configuration shares the last queue of the family
                 queue_local_index = queue_create_info["queue_count"]
-                queue_create_info["queue_count"] += 1
+                if queue_local_index < queue_family.properties.queue_count:
+                    queue_create_info["queue_count"] += 1
+                else:
+                    queue_local_index -= 1
             
                 # Save the index of the required graphics queue that will be used by the renderer
                 if render_queue_data is None and QueueType.Graphics in qconf.type:
@@ -283,10 +397,32 @@ class Engine(object):
 
         # Device creation
         queue_create_infos = [hvk.queue_create_info(**args) for args in queue_create_infos]
-        extensions = ("VK_KHR_swapchain",)
+        extensions = ["VK_KHR_swapchain"]
         features = vk.PhysicalDeviceFeatures(texture_compression_BC = 1)
+
+        # Bindless texture tables are indexed with a value that is the same for a whole draw
+        bindless_textures = "shader_sampled_image_array_dynamic_indexing" in supported_features
+        if bindless_textures:
+            features.shader_sampled_image_array_dynamic_indexing = 1
+
+        # Instanced groups draw all their batches with a single indirect draw. The batches start at their first instance
+        multi_draw_indirect = "multi_draw_indirect" in supported_features and "draw_indirect_first_instance" in supported_features
+        if multi_draw_indirect:
+            features.multi_draw_indirect = 1
+            features.draw_indirect_first_instance = 1
+
+        # Descriptor update templates are core in Vulkan 1.1, but the instance targets Vulkan 1.0, so the extension is used
+        supported_extensions = [name for name, _ in hvk.enumerate_device_extensions(api, physical_device)]
+        if "VK_KHR_descriptor_update_template" in supported_extensions:
+            extensions.append("VK_KHR_descriptor_update_template")
+
         device = hvk.create_device(api, physical_device, extensions, queue_create_infos, features)
 
+        if "VK_KHR_descriptor_update_template" in extensions:
+            api.CreateDescriptorUpdateTemplate = api.CreateDescriptorUpdateTemplateKHR
+            api.DestroyDescriptorUpdateTemplate = api.DestroyDescriptorUpdateTemplateKHR
+            api.UpdateDescriptorSetWithTemplate = api.UpdateDescriptorSetWithTemplateKHR
+
         # Fetching queues
         # First, fetch the render queue
         render_queue_family, render_family_local_index = render_queue_data
@@ -304,6 +440,9 @@ class Engine(object):
         self.device = device
         self.render_queue = render_queue
         self.queues = queues
+        self.info["device_extensions"] = tuple(extensions)
+        self.info["bindless_textures"] = bindless_textures
+        self.info["multi_draw_indirect"] = multi_draw_indirect
 
     def _setup_device_info(self):
         api, physical_device = self.api, self.physical_device
@@ -312,6 +451,10 @@ class Engine(object):
         properties = hvk.physical_device_properties(api, physical_device)
         info["limits"] = properties.limits
 
+        # Descriptor sets are updated with emulated templates if the device does not support them (or if they are disabled)
+        templates = self.configuration.get("DESCRIPTOR_UPDATE_TEMPLATES", True)
+        info["descriptor_update_templates"] = templates and "VK_KHR_descriptor_update_template" in info["device_extensions"]
+
         depth_formats = (vk.FORMAT_D32_SFLOAT_S8_UINT, vk.FORMAT_D24_UNORM_S8_UINT, vk.FORMAT_D16_UNORM_S8_UINT)
         for fmt in depth_formats:
             prop = hvk.physical_device_format_properties(api, physical_device, fmt)
@@ -394,32 +537,11 @@ class Engine(object):
         self.info["swapchain_extent"] = OrderedDict(width=extent.width, height=extent.height)
         self.info["swapchain_format"] = swapchain_image_format
 
-    def _setup_setup_commands(self):
-        api, device = self.api, self.device
-        render_queue = self.render_queue
-
-        command_pool = hvk.create_command_pool(api, device, hvk.command_pool_create_info(
-            queue_family_index = render_queue.family.index,
-            flags = vk.COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT
-        ))
-
-        cmds = hvk.allocate_command_buffers(api, device, hvk.command_buffer_allocate_info(
-            command_pool = command_pool,
-            command_buffer_count = 1
-        ))
-
-        fence_info = hvk.fence_create_info()
-        fence = hvk.create_fence(api, device, fence_info)
-
-
-        self.command_pool = command_pool
-        self.setup_command_buffer = cmds[0]
-        self.setup_fence = fence
-
     # Update functions
 
     def _update_swapchain(self, resize_data):
-        hvk.device_wait_idle(self.api, self.device)
+        with self.queue_lock:
+            hvk.device_wait_idle(self.api, self.device)
         self._setup_swapchain()
         self.render_target._update_swapchain()
         self.renderer._setup_render_cache()
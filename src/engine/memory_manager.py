@@ -1,8 +1,14 @@
 from vulkan import vk, helpers as hvk
 from enum import IntFlag
 from functools import lru_cache
-from ctypes import memmove, byref, c_void_p, POINTER
-import weakref
+from bisect import bisect_left
+from ctypes import memmove, byref, sizeof, c_uint8, c_void_p, POINTER
+import weakref, threading
+
+
+# Size of the device memory blocks allocated by the memory manager.
+# Resources bigger than this get their own dedicated block.
+DEFAULT_MEMORY_BLOCK_SIZE = 64 * 1024 * 1024
 
 
 class MemoryManager(object):
@@ -11,16 +17,26 @@ class MemoryManager(object):
         self.engine = engine
         self.memory_info = {}
         self.allocations = []
+        self.blocks = []
+        self.block_size = engine.configuration.get("MEMORY_BLOCK_SIZE", DEFAULT_MEMORY_BLOCK_SIZE)
+
+        # Scenes are loaded in the background while the current scene allocates and frees memory
+        self.lock = threading.RLock()
         self._setup_memory_info()
 
     def free(self):
         _, api, device = self.ctx
 
-        for alloc in self.allocations:
-            hvk.free_memory(api, device, alloc.device_memory)
+        for block in self.blocks:
+            if block.pointer is not None:
+                hvk.unmap_memory(api, device, block.device_memory)
+            hvk.free_memory(api, device, block.device_memory)
+
+        self.blocks.clear()
+        self.allocations.clear()
 
         del self.engine
-    
+
     @property
     def ctx(self):
         ctx = self.engine
@@ -32,51 +48,63 @@ class MemoryManager(object):
 
         requirements = self.get_resource_requirements(resource, resource_type)
         memory_type_index = self._get_memory_type_index(types)
+        linear = resource_type == vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO
 
-        device_memory = hvk.allocate_memory(api, device, hvk.memory_allocate_info(
-            allocation_size = requirements.size,
-            memory_type_index = memory_type_index
-        ))
+        with self.lock:
+            block, offset = self._suballocate(memory_type_index, linear, requirements.size, requirements.alignment)
+            alloc = Alloc(resource, block, offset, requirements.size)
+            self.allocations.append(alloc)
 
         if resource_type == vk.STRUCTURE_TYPE_IMAGE_CREATE_INFO:
-            hvk.bind_image_memory(api, device, resource, device_memory)
-        elif resource_type == vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO:
-            hvk.bind_buffer_memory(api, device, resource, device_memory, 0)
+            hvk.bind_image_memory(api, device, resource, block.device_memory, offset)
         else:
-            raise ValueError("value of argument \"resource_type\" must be STRUCTURE_TYPE_IMAGE_CREATE_INFO or STRUCTURE_TYPE_BUFFER_CREATE_INFO")
-
-        alloc = Alloc(resource, device_memory, requirements.size)
-        self.allocations.append(alloc)
+            hvk.bind_buffer_memory(api, device, resource, block.device_memory, offset)
 
         return weakref.proxy(alloc)
 
-    def shared_alloc(self, size, types):
-        _, api, device = self.ctx
-
+    def shared_alloc(self, size, types, alignment=1, linear=False):
+        """
+            Allocate a range of memory that will be shared by many resources. The caller is responsible
+            for binding the resources at `alloc.offset + resource_offset`.
+            `linear` must be True if the memory will hold buffers and False if it will hold optimal images.
+        """
         memory_type_index = self._get_memory_type_index(types)
 
-        device_memory = hvk.allocate_memory(api, device, hvk.memory_allocate_info(
-            allocation_size = size,
-            memory_type_index = memory_type_index
-        ))
-
-        alloc = SharedAlloc(device_memory, size)
-        self.allocations.append(alloc)
+        with self.lock:
+            block, offset = self._suballocate(memory_type_index, linear, size, alignment)
+            alloc = SharedAlloc(block, offset, size)
+            self.allocations.append(alloc)
 
         return weakref.proxy(alloc)
 
     def free_alloc(self, alloc):
-        _, api, device = self.ctx
-        hvk.free_memory(api, device, alloc.device_memory)
-        self.allocations.remove(alloc)
+        with self.lock:
+            block = alloc.block
+            block.release(alloc.offset, alloc.size)
+            self.allocations.remove(alloc)
+
+            if block.empty:
+                self._release_block(block)
 
     def map_alloc(self, alloc, offset=None, size=None):
         engine, api, device = self.ctx
         offset = offset or 0
         size = size or alloc.size
 
-        pointer = hvk.map_memory(api, device, alloc.device_memory, offset, size)
-        unmap = lambda: hvk.unmap_memory(api, device, alloc.device_memory)
+        # Host visible blocks are mapped once when they are allocated. Hand out views into the existing mapping.
+        block = alloc.block
+        if block.pointer is not None:
+            if offset == 0:
+                mapping = alloc.mapping
+                if mapping is None:
+                    mapping = alloc.mapping = MappedDeviceMemory(alloc, c_void_p(block.pointer + alloc.offset), _persistent_unmap)
+                return mapping
+
+            return MappedDeviceMemory(alloc, c_void_p(block.pointer + alloc.offset + offset), _persistent_unmap)
+
+        device_memory = alloc.device_memory
+        pointer = hvk.map_memory(api, device, device_memory, alloc.offset + offset, size)
+        unmap = lambda: hvk.unmap_memory(api, device, device_memory)
 
         return MappedDeviceMemory(alloc, pointer, unmap)
 
@@ -93,6 +121,56 @@ class MemoryManager(object):
 
         return requirements
 
+    def _suballocate(self, memory_type_index, linear, size, alignment):
+        # Linear (buffers) and optimal (images) resources never share a block. This way
+        # `bufferImageGranularity` never has to be taken into account when placing the resources.
+        for block in self.blocks:
+            if block.memory_type_index != memory_type_index or block.linear != linear:
+                continue
+
+            offset = block.allocate(size, alignment)
+            if offset is not None:
+                return block, offset
+
+        block = self._allocate_block(memory_type_index, linear, max(size, self.block_size))
+        offset = block.allocate(size, alignment)
+
+        return block, offset
+
+    def _allocate_block(self, memory_type_index, linear, size):
+        _, api, device = self.ctx
+
+        device_memory = hvk.allocate_memory(api, device, hvk.memory_allocate_info(
+            allocation_size = size,
+            memory_type_index = memory_type_index
+        ))
+
+        block = MemoryBlock(device_memory, memory_type_index, linear, size, dedicated=size > self.block_size)
+        self.blocks.append(block)
+
+        # Host visible memory stays mapped for the whole lifetime of the block
+        property_flags = self.memory_info["memory_types"][memory_type_index].property_flags
+        if property_flags & vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT:
+            block.pointer = hvk.map_memory(api, device, device_memory, 0, size).value
+
+        return block
+
+    def _release_block(self, block):
+        # Keep a single empty block of each kind around to avoid reallocating memory on every scene load
+        _, api, device = self.ctx
+        keep = not block.dedicated
+        if keep:
+            for other in self.blocks:
+                if other is not block and other.empty and other.memory_type_index == block.memory_type_index and other.linear == block.linear:
+                    keep = False
+                    break
+
+        if not keep:
+            if block.pointer is not None:
+                hvk.unmap_memory(api, device, block.device_memory)
+            hvk.free_memory(api, device, block.device_memory)
+            self.blocks.remove(block)
+
     def _setup_memory_info(self):
         ctx = self.engine
         api, physical_device = ctx.api, ctx.physical_device
@@ -116,21 +194,109 @@ class MemoryManager(object):
 
         raise ValueError(f"No memory type matches the requested flags: {memory_type_flags}")
 
-   
+
+class MemoryBlock(object):
+    """
+        A single device memory allocation divided between many resources.
+        Free space is tracked using a list of `(offset, size)` ranges sorted by offset.
+    """
+
+    __slots__ = ("device_memory", "memory_type_index", "linear", "size", "dedicated", "free_ranges", "used", "pointer")
+
+    def __init__(self, device_memory, memory_type_index, linear, size, dedicated=False):
+        self.device_memory = device_memory
+        self.memory_type_index = memory_type_index
+        self.linear = linear
+        self.size = size
+        self.dedicated = dedicated
+        self.free_ranges = [(0, size)]
+        self.used = 0
+        self.pointer = None
+
+    @property
+    def empty(self):
+        return self.used == 0
+
+    def allocate(self, size, alignment):
+        """ Find the first free range that can hold `size` bytes. Return the aligned offset or None """
+        free_ranges = self.free_ranges
+        a = alignment - 1
+
+        for index, (offset, free_size) in enumerate(free_ranges):
+            aligned = (offset + a) & ~a
+            end = aligned + size
+            free_end = offset + free_size
+            if end > free_end:
+                continue
+
+            split = []
+            if aligned > offset:
+                split.append((offset, aligned - offset))
+            if free_end > end:
+                split.append((end, free_end - end))
+
+            free_ranges[index:index+1] = split
+            self.used += size
+            return aligned
+
+        return None
+
+    def release(self, offset, size):
+        """ Return a range to the free list, merging it with its neighbours """
+        free_ranges = self.free_ranges
+        index = bisect_left(free_ranges, (offset, size))
+        end = offset + size
+
+        # Merge with the next range
+        if index < len(free_ranges) and free_ranges[index][0] == end:
+            _, next_size = free_ranges.pop(index)
+            size += next_size
+
+        # Merge with the previous range
+        if index > 0:
+            prev_offset, prev_size = free_ranges[index-1]
+            if prev_offset + prev_size == offset:
+                free_ranges[index-1] = (prev_offset, prev_size + size)
+                self.used -= end - offset
+                return
+
+        free_ranges.insert(index, (offset, size))
+        self.used -= end - offset
+
+
 class Alloc(object):
-    __slots__ = ("resource", "device_memory", "size", "__weakref__")
+    __slots__ = ("resource", "block", "offset", "size", "mapping", "__weakref__")
 
-    def __init__(self, resource, device_memory, size):
+    def __init__(self, resource, block, offset, size):
         self.resource = resource
-        self.device_memory = device_memory
+        self.block = block
+        self.offset = offset
         self.size = size
+        self.mapping = None
+
+    @property
+    def device_memory(self):
+        return self.block.device_memory
+
 
 class SharedAlloc(object):
-    __slots__ = ("device_memory", "size", "__weakref__")
+    __slots__ = ("block", "offset", "size", "mapping", "__weakref__")
 
-    def __init__(self, device_memory, size):
-        self.device_memory = device_memory
+    def __init__(self, block, offset, size):
+        self.block = block
+        self.offset = offset
         self.size = size
+        self.mapping = None
+
+    @property
+    def device_memory(self):
+        return self.block.device_memory
+
+
+def _persistent_unmap():
+    # Persistently mapped memory is unmapped when its block is freed
+    pass
+
 
 class MappedDeviceMemory(object):
     __slots__ = ("alloc", "pointer", "pointer2", "unmap")
@@ -146,8 +312,11 @@ class MappedDeviceMemory(object):
         memmove(offset_pointer, byref(data), len(data))
 
     def write_typed_data(self, src, offset):
-        dst = (type(src)*1).from_address(self.pointer2 + offset)
-        dst[0] = src
+        memmove(self.pointer2 + offset, byref(src), sizeof(src))
+
+    def view(self, size):
+        """ Return a writable memoryview of the first `size` bytes of the mapping """
+        return memoryview((c_uint8 * size).from_address(self.pointer2)).cast('B')
 
     def __enter__(self):
         return self
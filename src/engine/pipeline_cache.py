@@ -0,0 +1,221 @@
+from vulkan import vk, helpers as hvk
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from ctypes import c_uint8, addressof
+import hashlib, json, os, struct, threading
+
+
+# Default directory of the pipeline cache files. Set "PIPELINE_CACHE_PATH" to None to keep the cache in memory.
+DEFAULT_PIPELINE_CACHE_PATH = Path.home() / ".cache" / "panic-panda"
+
+# Number of threads compiling the pipelines in the background. With 0, pipelines are compiled when they are requested.
+DEFAULT_PIPELINE_THREADS = min(4, os.cpu_count() or 1)
+
+# VkPipelineCacheHeaderVersionOne: header length, header version, vendor id, device id, pipeline cache UUID
+CACHE_HEADER = struct.Struct("<IIII16s")
+
+
+def pipeline_key(*codes, mapping):
+    """ Identify a pipeline by its SPIR-V modules and its mapping (the mapping includes the specialization constants) """
+    h = hashlib.sha1()
+    for code in codes:
+        h.update(code)
+
+    h.update(json.dumps(mapping, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class PipelineCache(object):
+    """
+        The `VkPipelineCache` shared by every scene loaded in the engine.
+
+        The cache data is loaded at startup from a file named after the device and the driver version
+        (`pipelines_{vendor}_{device}_{driver}_{uuid}.bin`) and written back when the engine is freed.
+        The keys of the pipelines (see `pipeline_key`) stored in the cache are saved next to it in a json file.
+        They are used to tell if a pipeline was already compiled and to skip the write if nothing new was compiled.
+
+        Pipelines are compiled by a pool of worker threads (`create_graphics_pipelines`, `create_compute_pipelines`).
+        Each worker compiles with its own pipeline cache, seeded with the content of the shared cache. The worker caches
+        are merged into the shared cache with `vkMergePipelineCaches` (see `merge`).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.handle = None
+        self.path = None
+        self.keys = set()
+        self.new_keys = set()
+        self.loaded_size = 0
+        self.vendor_id = self.device_id = self.uuid = None
+
+        # The shared cache is the destination of the merges, so it must not be used by two threads at the same time
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.worker_caches = []
+        self.executor = None
+
+        path = engine.configuration.get("PIPELINE_CACHE_PATH", DEFAULT_PIPELINE_CACHE_PATH)
+        self._setup_path(path)
+        self._setup_cache()
+        self._setup_executor()
+
+    def free(self):
+        _, api, device = self.ctx
+
+        if self.executor is not None:
+            self.executor.shutdown()
+
+        self.save()
+
+        for cache in self.worker_caches:
+            hvk.destroy_pipeline_cache(api, device, cache)
+
+        hvk.destroy_pipeline_cache(api, device, self.handle)
+
+        del self.engine
+
+    @property
+    def ctx(self):
+        ctx = self.engine
+        api, device = ctx.api, ctx.device
+        return ctx, api, device
+
+    def track(self, keys):
+        """ Register the keys of pipelines about to be created with the cache. Return the number of keys already in the cache. """
+        hits = 0
+        for key in keys:
+            if key in self.keys:
+                hits += 1
+            else:
+                self.new_keys.add(key)
+
+        return hits
+
+    def create_graphics_pipelines(self, infos):
+        """ Compile the graphics pipelines of `infos` in the background. Return a future per pipeline. """
+        return self._submit(hvk.create_graphics_pipelines, infos)
+
+    def create_compute_pipelines(self, infos):
+        """ Compile the compute pipelines of `infos` in the background. Return a future per pipeline. """
+        return self._submit(hvk.create_compute_pipelines, infos)
+
+    def merge(self):
+        """ Merge the caches of the workers into the shared cache """
+        _, api, device = self.ctx
+        with self.lock:
+            if len(self.worker_caches) > 0:
+                hvk.merge_pipeline_caches(api, device, self.handle, self.worker_caches)
+
+    def save(self):
+        """ Write the cache data to disk if new pipelines were compiled since it was loaded. Return True if the file was written. """
+        _, api, device = self.ctx
+        if self.path is None or len(self.new_keys) == 0:
+            return False
+
+        self.merge()
+        with self.lock:
+            data = hvk.get_pipeline_cache_data(api, device, self.handle)
+
+        keys = sorted(self.keys | self.new_keys)
+        index_path = self.path.with_suffix(".json")
+
+        # Write to temporary files first so that an interrupted save does not leave a truncated cache behind
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path, tmp_index_path = self.path.with_suffix(".bin.tmp"), index_path.with_suffix(".json.tmp")
+            tmp_path.write_bytes(data)
+            tmp_index_path.write_text(json.dumps(keys))
+            os.replace(tmp_path, self.path)
+            os.replace(tmp_index_path, index_path)
+        except OSError as e:
+            print(f"Failed to save the pipeline cache to \"{self.path}\": {e}")
+            return False
+
+        self.keys.update(self.new_keys)
+        self.new_keys.clear()
+
+        return True
+
+    def _setup_path(self, path):
+        engine, api, _ = self.ctx
+        if path is None:
+            return
+
+        properties = hvk.physical_device_properties(api, engine.physical_device)
+        uuid = bytes(properties.pipeline_cache_UUID).hex()
+        name = f"pipelines_{properties.vendor_ID:04x}_{properties.device_ID:04x}_{properties.driver_version:08x}_{uuid}.bin"
+
+        self.path = Path(path) / name
+        self.uuid = bytes(properties.pipeline_cache_UUID)
+        self.vendor_id, self.device_id = properties.vendor_ID, properties.device_ID
+
+    def _load(self):
+        path = self.path
+        if path is None:
+            return None
+
+        try:
+            data = path.read_bytes()
+            keys = json.loads(path.with_suffix(".json").read_text())
+        except (OSError, ValueError):
+            return None
+
+        # Some drivers do not validate the initial data, so a cache written by another device is discarded here
+        if len(data) < CACHE_HEADER.size:
+            return None
+
+        length, version, vendor_id, device_id, uuid = CACHE_HEADER.unpack_from(data)
+        if version != vk.PIPELINE_CACHE_HEADER_VERSION_ONE or (vendor_id, device_id, uuid) != (self.vendor_id, self.device_id, self.uuid):
+            return None
+
+        self.keys = set(keys)
+        self.loaded_size = len(data)
+
+        return data
+
+    def _setup_cache(self):
+        _, api, device = self.ctx
+
+        data = self._load()
+        if data is None:
+            self.handle = hvk.create_pipeline_cache(api, device, hvk.pipeline_cache_create_info())
+            return
+
+        initial_data = (c_uint8 * len(data)).from_buffer_copy(data)
+        info = hvk.pipeline_cache_create_info(initial_data_size=len(data), initial_data=addressof(initial_data))
+        self.handle = hvk.create_pipeline_cache(api, device, info)
+
+    def _setup_executor(self):
+        threads = self.engine.configuration.get("PIPELINE_THREADS", DEFAULT_PIPELINE_THREADS)
+        if threads > 0:
+            self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pipelines")
+
+    def _submit(self, create, infos):
+        executor = self.executor
+        if executor is not None:
+            return [executor.submit(self._create, create, info) for info in infos]
+
+        # No worker: compile with the shared cache right away
+        _, api, device = self.ctx
+        jobs = []
+        for pipeline in (create(api, device, infos, self.handle) if len(infos) > 0 else ()):
+            job = Future()
+            job.set_result(pipeline)
+            jobs.append(job)
+
+        return jobs
+
+    def _create(self, create, info):
+        # Runs in a worker thread. The vulkan calls release the GIL, so the workers compile in parallel.
+        _, api, device = self.ctx
+        cache = getattr(self.local, "cache", None)
+
+        if cache is None:
+            with self.lock:
+                data = hvk.get_pipeline_cache_data(api, device, self.handle)
+                initial_data = (c_uint8 * len(data)).from_buffer_copy(data)
+                cache_info = hvk.pipeline_cache_create_info(initial_data_size=len(data), initial_data=addressof(initial_data))
+                cache = self.local.cache = hvk.create_pipeline_cache(api, device, cache_info)
+                self.worker_caches.append(cache)
+
+        return create(api, device, (info,), cache)[0]
@@ -4,6 +4,10 @@ obj_name = name_generator("Object")
 
 
 class GameObject(object):
+    """
+        Changes to `hidden` or `mesh` after the object is loaded are applied when the object
+        is passed to `Scene.update_objects`.
+    """
 
     def __init__(self, **kwargs):
         self._id = Id()
@@ -207,6 +207,17 @@ class Image(object):
         else:
             raise NotImplementedError(f"Mipmaps function not implemented for image of type {st}")
 
+    def iter_mipmaps_data(self):
+        """ Yield the mipmaps (see `iter_mipmaps`) with a memoryview of their data. The data is not copied. """
+        if self.source_type is ImageSource.Ktx:
+            src = self.source
+            for m, mipmap in zip(self.iter_mipmaps(), src.mipmaps):
+                yield m, src.mipmap_data(mipmap)
+        else:
+            data = memoryview(self.texture_data()).cast('B')
+            for m in self.iter_mipmaps():
+                yield m, data[m.offset:m.offset+m.size]
+
     def size(self):
         return self.texture_size
 
@@ -1,4 +1,4 @@
-from . import Shader, Mesh, GameObject, Image, Sampler, Compute
+from . import Shader, Mesh, GameObject, Image, Sampler, Compute, CombinedImageSampler
 from ..base_types import Id
 
 
@@ -12,12 +12,14 @@ class Scene(object):
         self.objects = ComponentArray(GameObject)
         self.samplers = ComponentArray(Sampler)
         self.images = ComponentArray(Image)
+        self.textures = TextureArray()
         self.update_obj_set = set()
         self.update_shader_set = set()
 
         empty = lambda: None
         empty_w_events = lambda x, y: None
         self.on_initialized = empty
+        self.on_update = empty
         self.on_window_resized = empty_w_events
         self.on_mouse_move = empty_w_events
         self.on_mouse_click = empty_w_events
@@ -74,3 +76,20 @@ class ComponentArray(list):
     def __repr__(self):
         return f"{self.component_type.__qualname__}({super().__repr__()})"
 
+
+class TextureArray(list):
+    """
+        The textures of the bindless texture table of a scene. The index of a texture in the array is its index in the table.
+        Textures can be added after the scene is loaded, but they must not be removed or reordered.
+    """
+
+    def add(self, texture):
+        """ Add `texture` (a `CombinedImageSampler`) to the table if it is not already in it. Return its index. """
+        if not isinstance(texture, CombinedImageSampler):
+            raise TypeError(f"Item type must be CombinedImageSampler, got {type(texture)}")
+
+        if texture in self:
+            return self.index(texture)
+
+        self.append(texture)
+        return len(self) - 1
@@ -26,10 +26,14 @@ class TypedArray(object):
         if src is TypedArraySource.Array:
             raw_data  = self.data
         else:
-            raw_data = (c_uint8 * self.size_bytes)(*self.data.tobytes())
+            raw_data = (c_uint8 * self.size_bytes).from_buffer_copy(self.data)
 
         return byref(raw_data)
 
+    def view(self):
+        """ Return a bytes memoryview over the array data. The data is not copied. """
+        return memoryview(self.data).cast('B')[:self.size_bytes]
+
     @classmethod
     def from_array(cls, fmt, array):
         arr = super().__new__(cls)
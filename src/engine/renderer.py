@@ -1,4 +1,14 @@
 from vulkan import vk, helpers as hvk
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import os
+
+
+# Number of frames that can be recorded by the CPU while the GPU is still rendering the previous ones
+DEFAULT_FRAMES_IN_FLIGHT = 2
+
+# Number of threads used to record the render commands of the scenes
+DEFAULT_RECORD_THREADS = min(4, os.cpu_count() or 1)
 
 
 class Renderer(object):
@@ -6,11 +16,21 @@ class Renderer(object):
     def __init__(self, engine):
         self.engine = engine
 
-        self.image_ready = None
-        self.rendering_done = None
+        self.frames_in_flight = engine.configuration.get("FRAMES_IN_FLIGHT", DEFAULT_FRAMES_IN_FLIGHT)
+        self.frame_index = 0
+
+        self.record_threads = engine.configuration.get("RECORD_THREADS", DEFAULT_RECORD_THREADS)
+        self.record_executor = None
+        if self.record_threads > 1:
+            self.record_executor = ThreadPoolExecutor(max_workers=self.record_threads, thread_name_prefix="record")
+
+        self.image_ready = ()
+        self.rendering_done = ()
         self.render_fences = ()
+        self.images_fences = []
         self.render_cache = {}
 
+        self.stats = RenderStats()
         self.enabled = True
 
         self._setup_sync()
@@ -18,12 +38,19 @@ class Renderer(object):
 
     def free(self):
         engine, api, device = self.ctx
-        hvk.destroy_semaphore(api, device, self.image_ready)
-        hvk.destroy_semaphore(api, device, self.rendering_done)
+
+        for s in self.image_ready:
+            hvk.destroy_semaphore(api, device, s)
+
+        for s in self.rendering_done:
+            hvk.destroy_semaphore(api, device, s)
 
         for f in self.render_fences:
             hvk.destroy_fence(api, device, f)
 
+        if self.record_executor is not None:
+            self.record_executor.shutdown()
+
         del self.engine
 
     @property
@@ -40,56 +67,128 @@ class Renderer(object):
         engine, api, device = self.ctx
         render_queue = engine.render_queue.handle
         rc = self.render_cache
+        stats = self.stats
 
-        image_index, result = h.acquire_next_image(api, device, engine.swapchain, semaphore = self.image_ready)
+        frame_index = self.frame_index
+        frame_start = perf_counter()
 
-        fence = self.render_fences[image_index]
+        # Wait until the GPU is done with the resources of this frame slot (command buffer, uniforms slice, semaphores)
+        fence = self.render_fences[frame_index]
         h.wait_for_fences(api, device, (fence,))
-        h.reset_fences(api, device, (fence,))
 
-        scene_data.record(image_index)
+        image_index, result = h.acquire_next_image(api, device, engine.swapchain, semaphore = self.image_ready[frame_index])
 
-        submit = rc["submit_info"]
-        submit.command_buffers[0] = scene_data.render_commands[image_index]
-        h.queue_submit(api, render_queue, (submit,), fence = fence)
+        # If there are more frames in flight than swapchain images, an image might still be used by another frame
+        image_fence = self.images_fences[image_index]
+        if image_fence is not None and image_fence != fence:
+            h.wait_for_fences(api, device, (image_fence,))
 
-        present = rc["present_info"]
+        self.images_fences[image_index] = fence
+        wait_end = perf_counter()
+
+        h.reset_fences(api, device, (fence,))
+
+        scene_data.flush_uniforms(frame_index)
+        cmd = scene_data.record(frame_index, image_index)
+
+        submit = rc["submit_infos"][frame_index]
+        submit.command_buffers[0] = cmd
+        present = rc["present_infos"][frame_index]
         present.image_indices[0] = image_index
-        h.queue_present(api, render_queue, present)
+
+        # Scenes loaded in the background submit their uploads on the same queue
+        with engine.queue_lock:
+            h.queue_submit(api, render_queue, (submit,), fence = fence)
+            h.queue_present(api, render_queue, present)
+
+        self.frame_index = (frame_index + 1) % self.frames_in_flight
+
+        frame_end = perf_counter()
+        stats.add_frame(wait_end - frame_start, frame_end - wait_end)
+
+    def wait_frames_in_flight(self):
+        """
+            Wait until the GPU is done with the frames in flight. Cheaper than a device wait idle: the upload queue
+            and the scenes loaded in the background are not stalled.
+        """
+        _, api, device = self.ctx
+        hvk.wait_for_fences(api, device, self.render_fences)
 
     def enable(self):
         self.enabled = True
 
     def disable(self):
-        _, api, device = self.ctx
-        hvk.device_wait_idle(api, device)
+        engine, api, device = self.ctx
+        with engine.queue_lock:
+            hvk.device_wait_idle(api, device)
         self.enabled = False
 
     def _setup_sync(self):
-        engine, api, device = self.ctx
+        _, api, device = self.ctx
+        frames = range(self.frames_in_flight)
+
         info = hvk.semaphore_create_info()
-        
-        self.image_ready = hvk.create_semaphore(api, device, info)
-        self.rendering_done = hvk.create_semaphore(api, device, info)
+        self.image_ready = tuple(hvk.create_semaphore(api, device, info) for _ in frames)
+        self.rendering_done = tuple(hvk.create_semaphore(api, device, info) for _ in frames)
 
-        self.render_fences = []
         info = hvk.fence_create_info(flags=vk.FENCE_CREATE_SIGNALED_BIT)
-        for _ in range(len(engine.render_target.swapchain_images)):
-            self.render_fences.append(hvk.create_fence(api, device, info))
+        self.render_fences = tuple(hvk.create_fence(api, device, info) for _ in frames)
 
     def _setup_render_cache(self):
         engine = self.engine
 
-        self.render_cache["submit_info"] = hvk.submit_info(
-            wait_dst_stage_mask = (vk.PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,),
-            wait_semaphores = (self.image_ready,),
-            signal_semaphores = (self.rendering_done,),
-            command_buffers = (0,)
+        # The swapchain might have been recreated with a different number of images
+        self.images_fences = [None] * len(engine.render_target.swapchain_images)
+
+        self.render_cache["submit_infos"] = tuple(
+            hvk.submit_info(
+                wait_dst_stage_mask = (vk.PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,),
+                wait_semaphores = (image_ready,),
+                signal_semaphores = (rendering_done,),
+                command_buffers = (0,)
+            )
+            for image_ready, rendering_done in zip(self.image_ready, self.rendering_done)
         )
 
-        self.render_cache["present_info"] = hvk.present_info(
-            swapchains = (engine.swapchain,),
-            image_indices = (0,),
-            wait_semaphores = (self.rendering_done,)
+        self.render_cache["present_infos"] = tuple(
+            hvk.present_info(
+                swapchains = (engine.swapchain,),
+                image_indices = (0,),
+                wait_semaphores = (rendering_done,)
+            )
+            for rendering_done in self.rendering_done
         )
-    
\ No newline at end of file
+
+
+class RenderStats(object):
+    """
+        Frame timings of the renderer. `wait_time` is the time spent waiting for the GPU to release a frame
+        and `cpu_time` is the time spent updating, recording and submitting the frame. With enough frames in flight,
+        `wait_time` should stay close to zero.
+    """
+
+    __slots__ = ("frame_count", "wait_time", "cpu_time")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frame_count = 0
+        self.wait_time = 0.0
+        self.cpu_time = 0.0
+
+    def add_frame(self, wait_time, cpu_time):
+        self.frame_count += 1
+        self.wait_time += wait_time
+        self.cpu_time += cpu_time
+
+    @property
+    def average_wait_time(self):
+        return self.wait_time / max(self.frame_count, 1)
+
+    @property
+    def average_cpu_time(self):
+        return self.cpu_time / max(self.frame_count, 1)
+
+    def __repr__(self):
+        return f"RenderStats(frames={self.frame_count}, wait={self.average_wait_time*1000:.3f}ms, cpu={self.average_cpu_time*1000:.3f}ms)"
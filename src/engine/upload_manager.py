@@ -0,0 +1,490 @@
+from vulkan import vk, helpers as hvk
+from collections import deque
+import threading
+
+
+# Name of the engine queue (see `QueueConf`) used for the uploads. Without this queue, uploads use the render queue.
+DEFAULT_UPLOAD_QUEUE = "transfer"
+
+# Size of the host visible buffer used to stream the resources to the device. See `StagingRing`.
+DEFAULT_STAGING_RING_SIZE = 32 * 1024 * 1024
+
+# Alignment of the staging offsets. Image copies must be aligned on the texel block size (16 bytes for BC formats).
+BUFFER_COPY_ALIGNMENT = 16
+IMAGE_COPY_ALIGNMENT = 256
+
+
+class UploadManager(object):
+    """
+        Copy data to device local resources without stalling the device.
+
+        Copies are recorded in an `UploadBatch` (see `begin`) and submitted to the transfer queue. If the transfer queue
+        belongs to another family than the render queue, the resources are released by the transfer queue and acquired
+        by the render queue (queue family ownership transfer). Otherwise, the batch is submitted to the render queue.
+
+        A batch goes through two steps, both tracked by its fence:
+        1. Transfer: the copies and the release barriers run on the transfer queue. See `acquire`.
+        2. Acquire: once the transfer fence is signaled, the acquire barriers are submitted to the render queue.
+           Finished batches are released by `collect`: their command pools and fence are destroyed.
+
+        The render queue never waits on the transfer queue: the acquire is only submitted when the copies are done,
+        so a scene loaded in the background does not stall the scene being rendered.
+
+        The data is staged in a fixed size ring buffer (see `StagingRing`) shared by every batch, so the host visible
+        memory used by the uploads does not depend on the size of the resources.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.queue = None
+        self.ownership_transfer = False
+        self.pending = []
+        self.lock = threading.Lock()
+        self.ring = None
+        self._setup_queue()
+        self._setup_ring()
+
+    def free(self):
+        # The device is idle when the engine is freed. Batches that were never acquired are simply released.
+        for batch in self.pending:
+            batch._free()
+
+        self.pending.clear()
+        self.ring.free()
+        del self.engine
+
+    @property
+    def ctx(self):
+        engine = self.engine
+        api, device = engine.api, engine.device
+        return engine, api, device
+
+    def begin(self):
+        """ Return a new batch recording its commands """
+        return UploadBatch(self)
+
+    def submit(self, batch):
+        """ Submit the copies of `batch` """
+        batch._submit()
+
+        with self.lock:
+            self.pending.append(batch)
+
+        return batch
+
+    def acquire(self, batches, wait=True):
+        """
+            Submit the acquire barriers of `batches` to the render queue. If `wait` is True, block until the copies
+            are done on the transfer queue. Otherwise, only the batches with finished copies are acquired.
+            Return True if every batch was acquired. Resources must be acquired before they are used by the render queue.
+        """
+        _, api, device = self.ctx
+        acquired = True
+
+        for batch in batches:
+            if batch.state is not UploadBatch.Transfer:
+                continue
+
+            if wait:
+                hvk.wait_for_fences(api, device, (batch.fence,))
+            elif not hvk.get_fence_status(api, device, batch.fence):
+                acquired = False
+                continue
+
+            batch._submit_acquire()
+
+        return acquired
+
+    def collect(self):
+        """ Release the batches finished by the GPU. Never blocks. Return the number of batches released. """
+        _, api, device = self.ctx
+        if len(self.pending) == 0:
+            return 0
+
+        with self.lock:
+            done = [b for b in self.pending if b.state is UploadBatch.Acquire and hvk.get_fence_status(api, device, b.fence)]
+            for batch in done:
+                self.pending.remove(batch)
+
+        for batch in done:
+            batch._free()
+
+        return len(done)
+
+    def wait(self, batches):
+        """ Acquire `batches` and block until they are finished """
+        _, api, device = self.ctx
+        self.acquire(batches)
+
+        fences = [b.fence for b in batches if b.state is UploadBatch.Acquire]
+        if len(fences) > 0:
+            hvk.wait_for_fences(api, device, fences)
+
+        self.collect()
+
+    def _setup_queue(self):
+        engine = self.engine
+        render_queue = engine.render_queue
+        queue = engine.queues.get(engine.configuration.get("UPLOAD_QUEUE", DEFAULT_UPLOAD_QUEUE))
+
+        # Two queues of the same family would need a semaphore to be ordered, so the render queue is used directly
+        if queue is None or queue.family.index == render_queue.family.index:
+            queue = render_queue
+        else:
+            # Images are copied mipmap by mipmap, so the transfer queue must support copies of any extent
+            g = queue.family.properties.min_image_transfer_granularity
+            if (g.width, g.height, g.depth) != (1, 1, 1):
+                queue = render_queue
+
+        self.queue = queue
+        self.ownership_transfer = queue is not render_queue
+
+    def _setup_ring(self):
+        size = self.engine.configuration.get("STAGING_RING_SIZE", DEFAULT_STAGING_RING_SIZE)
+        self.ring = StagingRing(self, size)
+
+
+class StagingRing(object):
+    """
+        A host visible buffer used as a ring to stream the data of the upload batches.
+
+        The ring is filled in chunks of a quarter of its size. A chunk is submitted to the upload queue with its own fence
+        once it is full, so the device copies a chunk while the next one is written. When the ring has no space left,
+        the oldest chunk fence is waited on and its space is reused.
+
+        The ring is only used by the thread recording the batches (the engine "load" thread).
+    """
+
+    def __init__(self, manager, size):
+        self.manager = manager
+        self.size = size
+        self.chunk_size = size // 4
+        self.buffer = None
+        self.alloc = None
+        self.view = None
+
+        # Live data is between `tail` (oldest chunk in flight) and `head` (end of the chunk being recorded)
+        self.head = 0
+        self.tail = 0
+        self.empty = True
+        self.recorded = 0
+        self.chunks = deque()
+        self.fences = []
+
+        self._setup_buffer()
+
+    def free(self):
+        engine, api, device = self.manager.ctx
+
+        for fence, _ in self.chunks:
+            hvk.destroy_fence(api, device, fence)
+
+        for fence in self.fences:
+            hvk.destroy_fence(api, device, fence)
+
+        hvk.destroy_buffer(api, device, self.buffer)
+        engine.memory_manager.free_alloc(self.alloc)
+
+        self.chunks.clear()
+        self.fences.clear()
+        self.view = None
+
+    def allocate(self, size, alignment):
+        """ Reserve `size` bytes in the chunk being recorded. Return their offset in the ring, or None if the ring is full. """
+        if self.empty:
+            offset = self.tail = 0
+        else:
+            head, tail = self.head, self.tail
+            offset = (head + alignment - 1) & ~(alignment - 1)
+            if head > tail:
+                # Wrap around. The end of the ring is skipped and released with the chunk being recorded.
+                if offset + size > self.size:
+                    offset = 0 if size <= tail else None
+            elif head < tail:
+                if offset + size > tail:
+                    offset = None
+            else:
+                offset = None
+
+        if offset is not None:
+            self.head = offset + size
+            self.empty = False
+            self.recorded += size
+
+        return offset
+
+    def end_chunk(self):
+        """ Close the chunk being recorded. Return the fence that must be signaled by the submit of its commands. """
+        _, api, device = self.manager.ctx
+
+        if len(self.fences) > 0:
+            fence = self.fences.pop()
+            hvk.reset_fences(api, device, (fence,))
+        else:
+            fence = hvk.create_fence(api, device, hvk.fence_create_info())
+
+        self.chunks.append((fence, self.head))
+        self.recorded = 0
+
+        return fence
+
+    def reclaim(self):
+        """ Wait for the oldest chunk submitted and release its space """
+        _, api, device = self.manager.ctx
+
+        fence, end = self.chunks.popleft()
+        hvk.wait_for_fences(api, device, (fence,))
+        self.fences.append(fence)
+        self.tail = end
+
+        if len(self.chunks) == 0 and self.recorded == 0:
+            self.head = self.tail = 0
+            self.empty = True
+
+    def _setup_buffer(self):
+        engine, api, device = self.manager.ctx
+        mem = engine.memory_manager
+
+        if self.chunk_size < IMAGE_COPY_ALIGNMENT:
+            raise ValueError(f"Staging ring size must be at least {IMAGE_COPY_ALIGNMENT*4} bytes, got {self.size}")
+
+        self.buffer = hvk.create_buffer(api, device, hvk.buffer_create_info(
+            size = self.size,
+            usage = vk.BUFFER_USAGE_TRANSFER_SRC_BIT
+        ))
+        self.alloc = mem.alloc(
+            self.buffer,
+            vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO,
+            (vk.MEMORY_PROPERTY_HOST_COHERENT_BIT | vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT,)
+        )
+
+        self.view = mem.map_alloc(self.alloc).view(self.size)
+
+
+class UploadBatch(object):
+    """
+        Copies submitted together by the `UploadManager`. The destination resources are ready for the render queue
+        (in their final layout, with the requested access mask) once the batch is acquired.
+
+        The data is written in the staging ring of the manager. A batch bigger than a ring chunk is submitted in
+        many chunks, so the recording may block until the device has copied the oldest chunks.
+    """
+
+    Recording, Transfer, Acquire, Done = range(4)
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.state = UploadBatch.Recording
+        self.fence = None
+        self.pools = {}
+        self.acquire_barriers = []
+        self.acquire_stage_mask = 0
+        self._setup_pools()
+        self.cmd = self._begin_command()
+
+    def write_buffer(self, dst, dst_offset, data):
+        """ Copy `data` (any bytes-like object) to the buffer `dst` at `dst_offset`. See `release_buffer`. """
+        _, api, _ = self.manager.ctx
+        ring = self.manager.ring
+        data = memoryview(data).cast('B')
+        limit = ring.chunk_size
+
+        for offset in range(0, len(data), limit):
+            piece = data[offset:offset+limit]
+            src_offset = self._stage(piece, BUFFER_COPY_ALIGNMENT)
+            region = vk.BufferCopy(src_offset=src_offset, dst_offset=dst_offset+offset, size=len(piece))
+            hvk.copy_buffer(api, self.cmd, ring.buffer, dst, (region,))
+
+    def release_buffer(self, dst, dst_access_mask):
+        """ Make the data written in `dst` available to the render queue. `dst_access_mask` is how the render queue uses `dst`. """
+        barrier = hvk.buffer_memory_barrier(
+            buffer = dst,
+            src_access_mask = vk.ACCESS_TRANSFER_WRITE_BIT,
+            dst_access_mask = dst_access_mask
+        )
+        self._transfer_barrier(barrier)
+
+    def write_image(self, image, mipmaps, block_height, subresource_range, layout, access_mask):
+        """
+            Copy `mipmaps`, pairs of `MipmapData` and bytes-like data, to `image` and move `image` to `layout`.
+            `access_mask` is how the render queue uses `image`. Mipmaps bigger than a ring chunk are copied in bands of rows.
+            `block_height` is the number of texel rows in a row of blocks (4 for block compressed formats, otherwise 1).
+        """
+        _, api, _ = self.manager.ctx
+        ring = self.manager.ring
+        limit = ring.chunk_size
+
+        to_transfer = hvk.image_memory_barrier(
+            image = image,
+            new_layout = vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+            dst_access_mask = vk.ACCESS_TRANSFER_WRITE_BIT,
+            subresource_range = subresource_range
+        )
+
+        hvk.pipeline_barrier(api, self.cmd, (to_transfer,), dst_stage_mask=vk.PIPELINE_STAGE_TRANSFER_BIT)
+
+        for m, data in mipmaps:
+            data = memoryview(data).cast('B')
+            rows = -(-m.height // block_height)
+            row_size = m.size // rows
+            band_rows = rows if m.size <= limit else limit // row_size
+            if band_rows == 0:
+                raise ValueError(f"A row of the mipmap {m.level} ({row_size} bytes) does not fit in a staging ring chunk ({limit} bytes)")
+
+            for row in range(0, rows, band_rows):
+                count = min(band_rows, rows - row)
+                start = row * row_size
+                size = m.size if count == rows else count * row_size
+                y = row * block_height
+
+                src_offset = self._stage(data[start:start+size], IMAGE_COPY_ALIGNMENT)
+                region = hvk.buffer_image_copy(
+                    image_subresource = hvk.image_subresource_layers(mip_level = m.level, base_array_layer = m.layer),
+                    image_offset = vk.Offset3D(0, y, 0),
+                    image_extent = vk.Extent3D(m.width, min(count * block_height, m.height - y), 1),
+                    buffer_offset = src_offset
+                )
+                hvk.copy_buffer_to_image(api, self.cmd, ring.buffer, image, vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, (region,))
+
+        to_final_layout = hvk.image_memory_barrier(
+            image = image,
+            old_layout = vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+            new_layout = layout,
+            src_access_mask = vk.ACCESS_TRANSFER_WRITE_BIT,
+            dst_access_mask = access_mask,
+            subresource_range = subresource_range
+        )
+        self._transfer_barrier(to_final_layout)
+
+    def _stage(self, data, alignment):
+        # Write `data` in the staging ring and return its offset. The chunk being recorded is submitted when it is full,
+        # and the oldest chunks are waited on when the ring has no space left.
+        ring = self.manager.ring
+        size = len(data)
+
+        if ring.recorded > 0 and ring.recorded + size > ring.chunk_size:
+            self._submit_chunk()
+
+        offset = ring.allocate(size, alignment)
+        while offset is None:
+            if ring.recorded > 0:
+                self._submit_chunk()
+            else:
+                ring.reclaim()
+
+            offset = ring.allocate(size, alignment)
+
+        ring.view[offset:offset+size] = data
+        return offset
+
+    def _transfer_barrier(self, barrier):
+        # Make the copied resource available to the render queue. With an ownership transfer, the barrier is recorded
+        # twice: the release on the transfer queue and the acquire on the render queue.
+        manager = self.manager
+        engine, api, _ = manager.ctx
+        dst_stage_mask = hvk.dst_stage_mask_for_access_mask(barrier.dst_access_mask)
+
+        if not manager.ownership_transfer:
+            hvk.pipeline_barrier(api, self.cmd, (barrier,), src_stage_mask=vk.PIPELINE_STAGE_TRANSFER_BIT, dst_stage_mask=dst_stage_mask)
+            return
+
+        barrier.src_queue_family_index = manager.queue.family.index
+        barrier.dst_queue_family_index = engine.render_queue.family.index
+
+        acquire = type(barrier).from_buffer_copy(barrier)
+        acquire.src_access_mask = 0
+        self.acquire_barriers.append(acquire)
+        self.acquire_stage_mask |= dst_stage_mask
+
+        barrier.dst_access_mask = 0
+        hvk.pipeline_barrier(api, self.cmd, (barrier,), src_stage_mask=vk.PIPELINE_STAGE_TRANSFER_BIT, dst_stage_mask=vk.PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT)
+
+    def _begin_command(self):
+        _, api, _ = self.manager.ctx
+        cmd = self._setup_command(self.manager.queue)
+        hvk.begin_command_buffer(api, cmd, hvk.command_buffer_begin_info(flags=vk.COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT))
+        return cmd
+
+    def _setup_pools(self):
+        # One pool for the upload queue family and, with an ownership transfer, one for the render queue family (acquire).
+        # Every chunk command buffer is allocated from the same pool.
+        manager = self.manager
+        engine, api, device = manager.ctx
+
+        for queue in (manager.queue, engine.render_queue):
+            family_index = queue.family.index
+            if family_index in self.pools:
+                continue
+
+            self.pools[family_index] = hvk.create_command_pool(api, device, hvk.command_pool_create_info(
+                queue_family_index = family_index,
+                flags = vk.COMMAND_POOL_CREATE_TRANSIENT_BIT
+            ))
+
+    def _setup_command(self, queue):
+        _, api, device = self.manager.ctx
+
+        cmds = hvk.allocate_command_buffers(api, device, hvk.command_buffer_allocate_info(
+            command_pool = self.pools[queue.family.index],
+            command_buffer_count = 1
+        ))
+
+        return cmds[0]
+
+    def _submit_chunk(self):
+        manager = self.manager
+        engine, api, _ = manager.ctx
+
+        hvk.end_command_buffer(api, self.cmd)
+        fence = manager.ring.end_chunk()
+
+        with engine.queue_lock:
+            hvk.queue_submit(api, manager.queue.handle, (hvk.submit_info(command_buffers=(self.cmd,)),), fence)
+
+        self.cmd = self._begin_command()
+
+    def _submit(self):
+        manager = self.manager
+        engine, api, device = manager.ctx
+
+        hvk.end_command_buffer(api, self.cmd)
+        chunk_fence = manager.ring.end_chunk()
+        self.fence = hvk.create_fence(api, device, hvk.fence_create_info())
+
+        # The chunk fences are recycled by the ring. The batch fence is signaled by an empty submit, once every
+        # command submitted before it (the chunks of this batch) is done.
+        with engine.queue_lock:
+            hvk.queue_submit(api, manager.queue.handle, (hvk.submit_info(command_buffers=(self.cmd,)),), chunk_fence)
+            hvk.queue_submit(api, manager.queue.handle, (), self.fence)
+
+        # Without an ownership transfer, the resources are ready for the render queue after this submit
+        self.state = UploadBatch.Transfer if manager.ownership_transfer else UploadBatch.Acquire
+
+    def _submit_acquire(self):
+        engine, api, device = self.manager.ctx
+        render_queue = engine.render_queue
+
+        cmd = self._setup_command(render_queue)
+        hvk.begin_command_buffer(api, cmd, hvk.command_buffer_begin_info(flags=vk.COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT))
+        if len(self.acquire_barriers) > 0:
+            hvk.pipeline_barrier(api, cmd, self.acquire_barriers, src_stage_mask=vk.PIPELINE_STAGE_TOP_OF_PIPE_BIT, dst_stage_mask=self.acquire_stage_mask)
+        hvk.end_command_buffer(api, cmd)
+
+        hvk.reset_fences(api, device, (self.fence,))
+        with engine.queue_lock:
+            hvk.queue_submit(api, render_queue.handle, (hvk.submit_info(command_buffers=(cmd,)),), self.fence)
+
+        self.state = UploadBatch.Acquire
+
+    def _free(self):
+        _, api, device = self.manager.ctx
+
+        for pool in self.pools.values():
+            hvk.destroy_command_pool(api, device, pool)
+
+        if self.fence is not None:
+            hvk.destroy_fence(api, device, self.fence)
+
+        self.pools.clear()
+        self.fence = None
+        self.state = UploadBatch.Done
@@ -1,2 +1,3 @@
 from .camera import Camera
 from .look_at_view import LookAtView
+from .transform import Transform, update_transforms
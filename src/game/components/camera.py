@@ -27,14 +27,37 @@ class Camera(object):
 
         proj = Mat4.perspective(radians(fov), width/height, 0.001, 1000.0)
         self.projection = self.clip * proj
+        self.view_projection = self.projection * view
+        self.changed = True
+
+    # The camera matrices are updated in place
 
     def update_perspective(self, fov, width, height):
-        self.projection = Mat4.perspective(radians(fov), width/height, 0.001, 1000.0)
-        self.projection = self.clip * self.projection
-        self.view_projection = self.projection * self.view
+        projection = Mat4.perspective(radians(fov), width/height, 0.001, 1000.0, out=self.projection)
+        Mat4.mul_into(self.clip, projection, projection)
+        Mat4.mul_into(projection, self.view, self.view_projection)
+        self.changed = True
 
     def update_view(self, new_view):
-        self.view = new_view
-        self.camera = cam = new_view.clone().invert()
+        new_view.clone(out=self.view)
+        cam = Mat4.invert_into(new_view, self.camera)
         self.position = cam.get_translation()
-        self.view_projection = self.projection * self.view
+        Mat4.mul_into(self.projection, self.view, self.view_projection)
+        self.changed = True
+
+    def publish(self, scene, *shaders):
+        """
+            Write the view projection matrix in the `camera` uniform of `shaders` if the camera changed
+            since the last call. Meant to be called once per frame from `Scene.on_update`. Return True if the
+            uniforms were updated.
+        """
+        if not self.changed:
+            return False
+
+        for shader in shaders:
+            self.view_projection.clone(out=Mat4.from_buffer(shader.uniforms.camera.view_projection))
+            shader.uniforms.touch("camera")
+
+        scene.update_shaders(*shaders)
+        self.changed = False
+        return True
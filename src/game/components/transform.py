@@ -0,0 +1,88 @@
+from utils import Mat4, Quat, Vec3
+
+
+class Transform(object):
+    """
+        A node of a transform hierarchy. The local transform is stored as a translation, a rotation and a scale.
+
+        The world matrix is computed lazily and cached in `world`. It is updated in place, so it can be
+        assigned to `obj.model` once. Changing a transform marks its whole subtree dirty, and `version`
+        is incremented every time the world matrix is recomputed.
+    """
+
+    __slots__ = ('translation', 'rotation', 'scale', 'world', 'parent', 'children', 'dirty', 'version', 'synced_version')
+
+    def __init__(self, translation=(0,0,0), rotation=None, scale=(1,1,1), parent=None):
+        self.translation = Vec3.from_data(*translation)
+        self.rotation = rotation or Quat()
+        self.scale = Vec3.from_data(*scale)
+        self.world = Mat4()
+        self.parent = None
+        self.children = []
+        self.dirty = True
+        self.version = 0
+        self.synced_version = -1
+
+        if parent is not None:
+            self.set_parent(parent)
+
+    def set_translation(self, x, y, z):
+        self.translation.data[::] = (x, y, z)
+        self.invalidate()
+
+    def set_rotation(self, rotation):
+        self.rotation.data[::] = rotation.data
+        self.invalidate()
+
+    def set_scale(self, x, y, z):
+        self.scale.data[::] = (x, y, z)
+        self.invalidate()
+
+    def set_parent(self, parent):
+        if self.parent is not None:
+            self.parent.children.remove(self)
+
+        self.parent = parent
+        if parent is not None:
+            parent.children.append(self)
+
+        self.invalidate()
+
+    def invalidate(self):
+        # A dirty node always has dirty children, so the propagation can stop at the first dirty node
+        if self.dirty:
+            return
+
+        self.dirty = True
+        for child in self.children:
+            child.invalidate()
+
+    def update(self):
+        """ Recompute the world matrix if the node or one of its parents changed. Return the world matrix. """
+        if not self.dirty:
+            return self.world
+
+        world = Mat4.from_trs(self.translation, self.rotation, self.scale, out=self.world)
+        parent = self.parent
+        if parent is not None:
+            Mat4.mul_into(parent.update(), world, world)
+
+        self.dirty = False
+        self.version += 1
+        return world
+
+
+def update_transforms(objects):
+    """
+        Update the world matrices of `objects` (game objects with a `transform` attribute) and
+        return the objects whose world matrix changed since the last call.
+    """
+    changed = []
+    for obj in objects:
+        transform = obj.transform
+        transform.update()
+        if transform.version != transform.synced_version:
+            transform.synced_version = transform.version
+            changed.append(obj)
+
+    return changed
@@ -4,7 +4,7 @@ from engine.assets import KTXFile, GLTFFile, IMAGE_PATH
 from system import events as evt
 from utils import Mat4
 from vulkan import vk
-from .components import Camera, LookAtView
+from .components import Camera, LookAtView, Transform, update_transforms
 from math import radians, sin, cos
 
 
@@ -24,8 +24,7 @@ class DebugComputeScene(object):
         self.compute_local_size = self._compute_local_size()
 
         self.compute_heightmap = None
-        self.heightmap_texture = None
-        self.heightmap_sampler = None
+        self.heightmap_index = None
         self.heightmap_preview = None
 
         # Camera
@@ -60,37 +59,36 @@ class DebugComputeScene(object):
             callback = self.show_heightmap
         )
 
-        self.update_objects()
+        self.update_objects(view_changed=True)
 
     def show_heightmap(self):
-        heightmap_i = self.heightmap_texture
+        # The preview reads its texture from the scene texture table, so switching textures is an integer write
         heightmap_preview_o = self.heightmap_preview
-
-        heightmap_preview_o.uniforms.color_texture = CombinedImageSampler(image_id=heightmap_i.id, view_name="default", sampler_id=self.heightmap_sampler.id)
+        heightmap_preview_o.uniforms.view.texture_index[0] = self.heightmap_index
+        heightmap_preview_o.uniforms.touch("view")
         self.scene.update_objects(heightmap_preview_o)
 
     def update_perspective(self, event, data):
         width, height = data
         self.camera.update_perspective(60, width, height)
-        self.update_objects()
+        self.update_objects(view_changed=True)
 
-    def update_objects(self):
+    def update_objects(self, view_changed=False):
         objects = self.objects
         view = self.camera.view
         projection = self.camera.projection
 
-        for obj in objects:
-            uview = obj.uniforms.view
-
-            model_view = view * obj.model
-            model_view_projection = projection * model_view
-            model_transpose = obj.model.clone().invert().transpose()
+        # The preview shader only reads the mvp. It changes when an object moves or when the view changes.
+        moved = update_transforms(objects)
+        updated = objects if view_changed else moved
+        for obj in updated:
+            # Write the matrices directly in the uniforms
+            mvp = Mat4.from_buffer(obj.uniforms.view.mvp)
+            Mat4.mul_into(view, obj.model, mvp)
+            Mat4.mul_into(projection, mvp, mvp)
+            obj.uniforms.touch("view")
 
-            uview.mvp = model_view_projection.data
-            uview.model = obj.model.data
-            uview.normal = model_transpose.data
-            
-        self.scene.update_objects(*objects)
+        self.scene.update_objects(*updated)
 
     def handle_keypress(self, event, data):
         if data.key in evt.NumKeys:
@@ -99,7 +97,7 @@ class DebugComputeScene(object):
 
     def handle_mouse(self, event, event_data):
         if self.camera_view(event, event_data):
-            self.update_objects()
+            self.update_objects(view_changed=True)
 
     def _compute_local_size(self):
         # Allocate as much workgroup for invoking compute shaders
@@ -160,9 +158,13 @@ class DebugComputeScene(object):
         )
 
         # Shaders
-        dt = "debug_texture/debug_texture"
+        dt = "debug_texture_bindless/debug_texture_bindless"
         debug_texture_attributes_map = {"POSITION": "pos", "TEXCOORD_0": "uv"}
-        debug_texture_s = Shader.from_files(f"{dt}.vert.spv",  f"{dt}.frag.spv", f"{dt}.map.json", name="DebugTexture")
+        debug_texture_s = Shader.from_files(f"{dt}.vert.spv",  f"{dt}.frag.spv", f"{dt}.map.json", name="DebugTextureBindless")
+
+        # Bindless texture table. The heightmap is sampled once the compute shader is done writing it
+        placeholder_index = scene.textures.add(CombinedImageSampler(image_id=placeholder_i.id, view_name="default", sampler_id=heightmap_sm.id))
+        heightmap_index = scene.textures.add(CombinedImageSampler(image_id=heightmap_i.id, view_name="default", sampler_id=heightmap_sm.id))
 
         # Compute shaders
         compute_queue = "render"
@@ -181,8 +183,9 @@ class DebugComputeScene(object):
         
         # Game objects
         preview_heightmap_o = GameObject.from_components(shader = debug_texture_s.id, mesh = plane_m.id, name = "ObjTexture")
-        preview_heightmap_o.model = Mat4()
-        preview_heightmap_o.uniforms.color_texture = CombinedImageSampler(image_id=placeholder_i.id, view_name="default", sampler_id=heightmap_sm.id)
+        preview_heightmap_o.transform = Transform()
+        preview_heightmap_o.model = preview_heightmap_o.transform.world
+        preview_heightmap_o.uniforms.view = {"texture_index": (placeholder_index,)}
 
         scene.images.extend(heightmap_i, placeholder_i)
         scene.samplers.extend(heightmap_sm)
@@ -194,6 +197,5 @@ class DebugComputeScene(object):
         self.objects = (preview_heightmap_o,)
         self.shaders = ()
         self.compute_heightmap = compute_heightmap_c
-        self.heightmap_texture = heightmap_i
-        self.heightmap_sampler = heightmap_sm
+        self.heightmap_index = heightmap_index
         self.heightmap_preview = preview_heightmap_o
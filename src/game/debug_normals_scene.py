@@ -1,9 +1,9 @@
 from engine import Scene, Mesh, Shader, GameObject, Image, Sampler, CombinedImageSampler
 from engine.assets import GLBFile, GLTFFile, KTXFile
 from system import events as evt
-from utils import Mat4, Mat3
-from .components import Camera, LookAtView
-from math import radians, pi
+from utils import Mat4, Mat3, Quat
+from .components import Camera, LookAtView, Transform, update_transforms
+from math import pi
 
 
 class DebugNormalsScene(object):
@@ -32,13 +32,13 @@ class DebugNormalsScene(object):
         s.on_mouse_move = s.on_mouse_click = s.on_mouse_scroll = self.handle_mouse
 
     def init_scene(self):
-        self.update_objects()
+        self.update_objects(view_changed=True)
         self.scene.update_shaders(*self.shaders)
 
     def update_perspective(self, event, data):
         width, height = data
         self.camera.update_perspective(60, width, height)
-        self.update_objects()
+        self.update_objects(view_changed=True)
 
     def handle_keypress(self, event, data):
         if data.key in evt.NumKeys:
@@ -46,26 +46,30 @@ class DebugNormalsScene(object):
     
     def handle_mouse(self, event, event_data):
         if self.camera_view(event, event_data):
-            self.update_objects()
+            self.update_objects(view_changed=True)
 
-    def update_objects(self):
+    def update_objects(self, view_changed=False):
         objects = self.objects
         view = self.camera.view
         projection = self.camera.projection
 
-        for obj in objects:
+        # Only the objects that moved need new model & normal matrices. Every mvp changes with the view.
+        moved = update_transforms(objects)
+        for obj in moved:
             uview = obj.uniforms.view
-
-            model_view = view * obj.model
-            model_view_projection = projection * model_view
-            model_transpose = obj.model.clone().invert().transpose()
-
-            uview.mvp = model_view_projection.data
             uview.model = obj.model.data
-            uview.normal = model_transpose.data
-            
+            Mat4.inverse_transpose_into(obj.model, Mat4.from_buffer(uview.normal))
+            obj.uniforms.touch("view")
+
+        updated = objects if view_changed else moved
+        for obj in updated:
+            # Write the matrices directly in the uniforms
+            mvp = Mat4.from_buffer(obj.uniforms.view.mvp)
+            Mat4.mul_into(view, obj.model, mvp)
+            Mat4.mul_into(projection, mvp, mvp)
+            obj.uniforms.touch("view")
 
-        self.scene.update_objects(*objects)
+        self.scene.update_objects(*updated)
 
     def _setup_assets(self):
         scene = self.scene
@@ -107,11 +111,13 @@ class DebugNormalsScene(object):
 
         # Objects
         helmet = GameObject.from_components(shader = shader_normals.id, mesh = helmet_m.id, name = "Helmet")
-        helmet.model = Mat4.from_rotation(radians(360), (0, 1, 0)).translate(-1, 0, 0)
+        helmet.transform = Transform(translation=(-1, 0, 0))
+        helmet.model = helmet.transform.world
         helmet.uniforms.normal_maps = CombinedImageSampler(image_id=helmet_maps.id, view_name="default", sampler_id=helmet_sampler.id)
 
         helmet2 = GameObject.from_components(shader = shader2_normals.id, mesh = helmet_m2.id, name = "Helmet")
-        helmet2.model = Mat4().from_rotation(radians(90), (1, 0, 0)).translate(1, 0, 0)
+        helmet2.transform = Transform(translation=(1, 0, 0), rotation=Quat.from_euler(90, 0, 0))
+        helmet2.model = helmet2.transform.world
         helmet2.uniforms.normal_maps = CombinedImageSampler(image_id=helmet_maps.id, view_name="default", sampler_id=helmet_sampler.id)
 
         scene.shaders.extend(shader_normals, shader2_normals)
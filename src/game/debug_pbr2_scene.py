@@ -1,9 +1,9 @@
 from engine import Scene, Shader, Mesh, Image, Sampler, GameObject, CombinedImageSampler
 from engine.assets import KTXFile, GLTFFile, IMAGE_PATH
 from system import events as evt
-from utils import Mat4
+from utils import Mat4, Quat
 from vulkan import vk
-from .components import Camera, LookAtView
+from .components import Camera, LookAtView, Transform, update_transforms
 from math import radians, sin, cos
 
 
@@ -31,6 +31,7 @@ class DebugPBRScene(object):
 
         # Callbacks
         s.on_initialized = self.init_scene
+        s.on_update = self.update_view
         s.on_window_resized = self.update_perspective
         s.on_key_pressed = self.handle_keypress
         s.on_mouse_move = s.on_mouse_click = s.on_mouse_scroll = self.handle_mouse
@@ -38,12 +39,10 @@ class DebugPBRScene(object):
     def init_scene(self):
         self.update_objects()
         self.update_light()
-        self.update_view()
         
     def update_perspective(self, event, data):
         width, height = data
         self.camera.update_perspective(60, width, height)
-        self.update_objects()
 
     def update_light(self):
         light = self.light
@@ -57,31 +56,28 @@ class DebugPBRScene(object):
             cos(rot) * cos(pitch)
         )
 
+        shader.uniforms.touch("render")
         self.scene.update_shaders(shader)
 
     def update_view(self):
+        # Called once per frame. The camera uniform is shared by all the objects of the shader,
+        # so moving the camera does not touch the objects uniforms.
         shader = self.shaders[0]
-        render = shader.uniforms.render
-        render.camera[:3] = self.camera.position
-        self.scene.update_shaders(shader)
+        if self.camera.publish(self.scene, shader):
+            render = shader.uniforms.render
+            render.camera[:3] = self.camera.position
+            shader.uniforms.touch("render")
 
     def update_objects(self):
-        objects = self.objects
-        view = self.camera.view
-        projection = self.camera.projection
-
-        for obj in objects:
+        # Only the objects that moved need new model & normal matrices
+        moved = update_transforms(self.objects)
+        for obj in moved:
             uview = obj.uniforms.view
-
-            model_view = view * obj.model
-            model_view_projection = projection * model_view
-            model_transpose = obj.model.clone().invert().transpose()
-
-            uview.mvp = model_view_projection.data
             uview.model = obj.model.data
-            uview.normal = model_transpose.data
-            
-        self.scene.update_objects(*objects)
+            Mat4.inverse_transpose_into(obj.model, Mat4.from_buffer(uview.normal))
+            obj.uniforms.touch("view")
+
+        self.scene.update_objects(*moved)
 
     def handle_keypress(self, event, data):
         if data.key in evt.NumKeys:
@@ -100,14 +96,13 @@ class DebugPBRScene(object):
 
         helmet_shader = self.shaders[0]
         helmet_shader.uniforms.render.debug[0] = debug
+        helmet_shader.uniforms.touch("render")
 
         self.debug = debug
         self.scene.update_shaders(helmet_shader)
 
     def handle_mouse(self, event, event_data):
-        if self.camera_view(event, event_data):
-            self.update_view()
-            self.update_objects()
+        self.camera_view(event, event_data)
 
     def _setup_assets(self):
         scene = self.scene
@@ -164,7 +159,8 @@ class DebugPBRScene(object):
 
         # Objects
         helmet = GameObject.from_components(shader = shader.id, mesh = helmet_m.id, name = "Helmet")
-        helmet.model = Mat4().from_rotation(radians(90), (1, 0, 0))
+        helmet.transform = Transform(rotation=Quat.from_euler(90, 0, 0))
+        helmet.model = helmet.transform.world
         helmet.uniforms.texture_maps = CombinedImageSampler(image_id=helmet_i.id, view_name="default", sampler_id=helmet_s.id)
 
         # Packing
@@ -44,6 +44,7 @@ class DebugTexturesScene(object):
 
         current_obj = objects[self.visible_index]
         current_obj.uniforms.view.mvp[::] = view_projection * current_obj.model
+        current_obj.uniforms.touch("view")
 
         self.scene.update_objects(current_obj)
 
@@ -80,6 +81,7 @@ class DebugTexturesScene(object):
                 debug.layer[0] += 1
             elif data.key == k.Down and layer > 0:
                 debug.layer[0] -= 1
+            current_object.uniforms.touch("debug_params")
         elif current_object.name == "ObjCubeTexture":
             # Change cubemap mipmap level
             debug = current_object.uniforms.debug_params
@@ -88,8 +90,10 @@ class DebugTexturesScene(object):
                 debug.lod[0] += 1.0
             elif data.key == k.Down and lod > 0:
                 debug.lod[0] -= 1.0
+            current_object.uniforms.touch("debug_params")
 
         objects[visible].hidden = False
+        self.scene.update_objects(objects[self.visible_index])
         self.visible_index = visible
         self.update_objects()
 
@@ -46,6 +46,7 @@ class MainScene(object):
             view.model = obj.model.data
             view.normal = obj.model.data
             view.mvp = (mvp * obj.model).data
+            obj.uniforms.touch("view")
 
         self.scene.update_objects(*objects)
 
@@ -75,6 +76,7 @@ class MainScene(object):
 
                 rstatic = self.shader.uniforms.rstatic
                 rstatic.camera_pos[2] = abs(cam["pos_vec"][2])
+                self.shader.uniforms.touch("rstatic")
                 self.scene.update_shaders(self.shader)
 
                 self.update_objects()
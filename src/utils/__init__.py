@@ -1,4 +1,5 @@
 from .mat4 import Mat4
+from .mat4_array import Mat4Array
 from .mat3 import Mat3
 from .quat import Quat
 from .vec3 import Vec3
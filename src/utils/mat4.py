@@ -1,4 +1,4 @@
-from ctypes import c_float, Structure
+from ctypes import c_float, Structure, memmove, byref, sizeof
 from itertools import chain
 from math import tan, sin, cos, sqrt
 from sys import float_info
@@ -11,24 +11,20 @@ class Mat4(Structure):
     __slots__ = ('data',)
     _fields_ = (('data', buffer_type),)
 
-    def __init__(self):
-        staging = (
-            (1.0, 0.0, 0.0, 0.0),
-            (0.0, 1.0, 0.0, 0.0),
-            (0.0, 0.0, 1.0, 0.0),
-            (0.0, 0.0, 0.0, 1.0),
-        )
+    # Most functions accept an `out` matrix. If it is set, the result is written in it instead of a new matrix.
+    # `out` can also be a view over any 16 floats buffer, ex: `Mat4.from_buffer(uniforms.view.mvp)`
 
-        self.data[::] = buffer_type(*chain(*staging))
+    def __init__(self):
+        self.data[:] = IDENTITY
 
     @classmethod
-    def from_data(cls, data):
-        obj = super(Mat4, cls).__new__(cls)
+    def from_data(cls, data, out=None):
+        obj = out or super(Mat4, cls).__new__(cls)
         obj.data[::] = data
         return obj
 
     @classmethod
-    def look_at(cls, eye, center, up):
+    def look_at(cls, eye, center, up, out=None):
         e = float_info.epsilon
 
         eye_x, eye_y, eye_z = eye
@@ -36,7 +32,9 @@ class Mat4(Structure):
         cx, cy, cz = center
 
         if abs(eye_x - cx) < e and abs(eye_y - cy) < e and abs(eye_z - cz) < e:
-            return Mat4()
+            obj = out or super(Mat4, cls).__new__(cls)
+            obj.data[:] = IDENTITY
+            return obj
 
         z0 = eye_x-cx
         z1 = eye_y-cy
@@ -73,58 +71,51 @@ class Mat4(Structure):
             y1 *= length
             y2 *= length
 
-        staging = (
-            (x0, y0, z0, 0),
-            (x1, y1, z1, 0),
-            (x2, y2, z2, 0),
-            (
-                -(x0 * eye_x + x1 * eye_y + x2 * eye_z),
-                -(y0 * eye_x + y1 * eye_y + y2 * eye_z),
-                -(z0 * eye_x + z1 * eye_y + z2 * eye_z),
-                1
-            )
+        obj = out or super(Mat4, cls).__new__(cls)
+        obj.data[:] = (
+            x0, y0, z0, 0,
+            x1, y1, z1, 0,
+            x2, y2, z2, 0,
+            -(x0 * eye_x + x1 * eye_y + x2 * eye_z),
+            -(y0 * eye_x + y1 * eye_y + y2 * eye_z),
+            -(z0 * eye_x + z1 * eye_y + z2 * eye_z),
+            1
         )
 
-        obj = super(Mat4, cls).__new__(cls)
-        obj.data[::] = buffer_type(*chain(*staging))
         return obj
         
     @classmethod
-    def perspective(cls, fovy, aspect, near, far):
-        obj = super(Mat4, cls).__new__(cls)
+    def perspective(cls, fovy, aspect, near, far, out=None):
+        obj = out or super(Mat4, cls).__new__(cls)
 
         f = 1.0 / tan(fovy / 2)
         nf = 1.0 / (near - far)
 
-        staging = (
-            (f / aspect, 0.0, 0.0, 0.0),
-            (0.0, f, 0.0, 0.0),
-            (0.0, 0.0, (far + near) * nf, -1.0),
-            (0.0, 0.0, (far * near * 2) * nf, 0.0)
+        obj.data[:] = (
+            f / aspect, 0.0, 0.0, 0.0,
+            0.0, f, 0.0, 0.0,
+            0.0, 0.0, (far + near) * nf, -1.0,
+            0.0, 0.0, (far * near * 2) * nf, 0.0
         )
 
-        obj.data[::] = buffer_type(*chain(*staging))
-
         return obj
 
     @classmethod
-    def from_translation(cls, x, y, z):
-        obj = super(Mat4, cls).__new__(cls)
-
-        staging = (
-            (1.0, 0.0, 0.0, 0.0),
-            (0.0, 1.0, 0.0, 0.0),
-            (0.0, 0.0, 1.0, 0.0),
-            (x, y, z, 1.0)
+    def from_translation(cls, x, y, z, out=None):
+        obj = out or super(Mat4, cls).__new__(cls)
+
+        obj.data[:] = (
+            1.0, 0.0, 0.0, 0.0,
+            0.0, 1.0, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            x, y, z, 1.0
         )
 
-        obj.data[::] = buffer_type(*chain(*staging))
-
         return obj
 
     @classmethod
-    def from_rotation(cls, rad, axis):
-        obj = super(Mat4, cls).__new__(cls)
+    def from_rotation(cls, rad, axis, out=None):
+        obj = out or super(Mat4, cls).__new__(cls)
 
         x, y, z = axis
         length = sqrt(x * x + y * y + z * z)
@@ -141,29 +132,18 @@ class Mat4(Structure):
         c = cos(rad)
         t = 1 - c
 
-        r1, r2, r3, r4 = ([0.0]*4 for _ in range(4))
-
-        r1[0] = x * x * t + c
-        r1[1] = y * x * t + z * s
-        r1[2] = z * x * t - y * s
-
-        r2[0] = x * y * t - z * s
-        r2[1] = y * y * t + c
-        r2[2] = z * y * t + x * s
-
-        r3[0] = x * z * t + y * s
-        r3[1] = y * z * t - x * s
-        r3[2] = z * z * t + c
-
-        r4[3] = 1.0
-
-        obj.data[::] = buffer_type(*chain(r1, r2, r3, r4))
+        obj.data[:] = (
+            x * x * t + c, y * x * t + z * s, z * x * t - y * s, 0.0,
+            x * y * t - z * s, y * y * t + c, z * y * t + x * s, 0.0,
+            x * z * t + y * s, y * z * t - x * s, z * z * t + c, 0.0,
+            0.0, 0.0, 0.0, 1.0
+        )
 
         return obj
 
     @classmethod
-    def from_quat(cls, quat):
-        obj = super(Mat4, cls).__new__(cls)
+    def from_quat(cls, quat, out=None):
+        obj = out or super(Mat4, cls).__new__(cls)
         x, y, z, w = quat.data[::]
         x2 = x + x
         y2 = y + y
@@ -174,36 +154,44 @@ class Mat4(Structure):
         zx, zy, zz = z * x2, z * y2, z * z2
         wx, wy, wz = w * x2, w * y2, w * z2
 
-        r1 = (
-            1 - yy - zz,
-            yx + wz,
-            zx - wy,
-            0
+        obj.data[:] = (
+            1 - yy - zz, yx + wz, zx - wy, 0,
+            yx - wz, 1 - xx - zz, zy + wx, 0,
+            zx + wy, zy - wx, 1 - xx - yy, 0,
+            0, 0, 0, 1
         )
 
-        r2 = (
-            yx - wz,
-            1 - xx - zz,
-            zy + wx,
-            0
-        )
+        return obj
 
-        r3 = (
-            zx + wy,
-            zy - wx,
-            1 - xx - yy,
-            0
-        )
+    @classmethod
+    def from_trs(cls, translation, rotation, scale, out=None):
+        """ Build the matrix `T * R * S` from a translation, a rotation quaternion and a scale """
+        obj = out or super(Mat4, cls).__new__(cls)
+        tx, ty, tz = translation
+        x, y, z, w = rotation.data[::]
+        sx, sy, sz = scale
 
-        r4 = (0,0,0,1)
+        x2 = x + x
+        y2 = y + y
+        z2 = z + z
 
-        obj.data[::] = buffer_type(*chain(r1, r2, r3, r4))
+        xx = x * x2
+        yx, yy = y * x2, y * y2
+        zx, zy, zz = z * x2, z * y2, z * z2
+        wx, wy, wz = w * x2, w * y2, w * z2
+
+        obj.data[:] = (
+            (1 - yy - zz) * sx, (yx + wz) * sx, (zx - wy) * sx, 0,
+            (yx - wz) * sy, (1 - xx - zz) * sy, (zy + wx) * sy, 0,
+            (zx + wy) * sz, (zy - wx) * sz, (1 - xx - yy) * sz, 0,
+            tx, ty, tz, 1
+        )
 
         return obj
 
-    def clone(self):
-        mat = Mat4()
-        mat.data[::] = self.data
+    def clone(self, out=None):
+        mat = out or super(Mat4, Mat4).__new__(Mat4)
+        memmove(byref(mat), byref(self), MAT4_SIZE)
         return mat
 
     def translate(self, x, y, z):
@@ -279,53 +267,19 @@ class Mat4(Structure):
         return self
 
     def invert(self):
-        data = self.data
-        a00, a01, a02, a03 = data[0:4]
-        a10, a11, a12, a13 = data[4:8]
-        a20, a21, a22, a23 = data[8:12]
-        a30, a31, a32, a33 = data[12:16]
-
-        b00, b01, b02 = (a00 * a11 - a01 * a10), (a00 * a12 - a02 * a10), (a00 * a13 - a03 * a10)
-        b03, b04, b05 = (a01 * a12 - a02 * a11), (a01 * a13 - a03 * a11), (a02 * a13 - a03 * a12)
-        b06, b07, b08 = (a20 * a31 - a21 * a30), (a20 * a32 - a22 * a30), (a20 * a33 - a23 * a30)
-        b09, b10, b11 = (a21 * a32 - a22 * a31), (a21 * a33 - a23 * a31), (a22 * a33 - a23 * a32)
+        return Mat4.invert_into(self, self)
 
-        det = b00 * b11 - b01 * b10 + b02 * b09 + b03 * b08 - b04 * b07 + b05 * b06
-        if not det:
-            raise ValueError
+    @staticmethod
+    def invert_into(src, out):
+        """ Write the inverse of `src` in `out`. `src` and `out` can be the same matrix """
+        _invert(src.data, out.data, False)
+        return out
 
-        det = 1.0 / det
-
-        staging = (
-            (
-                (a11 * b11 - a12 * b10 + a13 * b09) * det,
-                (a02 * b10 - a01 * b11 - a03 * b09) * det,
-                (a31 * b05 - a32 * b04 + a33 * b03) * det,
-                (a22 * b04 - a21 * b05 - a23 * b03) * det
-            ),
-            (
-                (a12 * b08 - a10 * b11 - a13 * b07) * det,
-                (a00 * b11 - a02 * b08 + a03 * b07) * det,
-                (a32 * b02 - a30 * b05 - a33 * b01) * det,
-                (a20 * b05 - a22 * b02 + a23 * b01) * det
-            ),
-            (
-                (a10 * b10 - a11 * b08 + a13 * b06) * det,
-                (a01 * b08 - a00 * b10 - a03 * b06) * det,
-                (a30 * b04 - a31 * b02 + a33 * b00) * det,
-                (a21 * b02 - a20 * b04 - a23 * b00) * det
-            ),
-            (
-                (a11 * b07 - a10 * b09 - a12 * b06) * det,
-                (a00 * b09 - a01 * b07 + a02 * b06) * det,
-                (a31 * b01 - a30 * b03 - a32 * b00) * det,
-                (a20 * b03 - a21 * b01 + a22 * b00) * det
-            )
-        )
-
-        self.data = buffer_type(*chain(*staging))
-        
-        return self
+    @staticmethod
+    def inverse_transpose_into(src, out):
+        """ Write the transposed inverse of `src` (the normal matrix) in `out`. `src` and `out` can be the same matrix """
+        _invert(src.data, out.data, True)
+        return out
 
     def transpose(self):
         d = self.data
@@ -340,50 +294,26 @@ class Mat4(Structure):
         return self
 
     def __mul__(self, other):
-        a, b = self.data, other.data
+        return Mat4.mul_into(self, other, super(Mat4, Mat4).__new__(Mat4))
+
+    @staticmethod
+    def mul_into(a, b, out):
+        """ Write `a * b` in `out`. `out` can be `a` or `b` """
+        a, b, o = a.data, b.data, out.data
         a00, a01, a02, a03 = a[0:4]
         a10, a11, a12, a13 = a[4:8]
         a20, a21, a22, a23 = a[8:12]
         a30, a31, a32, a33 = a[12:16]
 
-        staging = []
-
-        b0, b1, b2, b3 = b[0:4]
-        staging.append((
-            b0*a00 + b1*a10 + b2*a20 + b3*a30,
-            b0*a01 + b1*a11 + b2*a21 + b3*a31,
-            b0*a02 + b1*a12 + b2*a22 + b3*a32,
-            b0*a03 + b1*a13 + b2*a23 + b3*a33
-        ))
-
-        b0, b1, b2, b3 = b[4:8]
-        staging.append((
-            b0*a00 + b1*a10 + b2*a20 + b3*a30,
-            b0*a01 + b1*a11 + b2*a21 + b3*a31,
-            b0*a02 + b1*a12 + b2*a22 + b3*a32,
-            b0*a03 + b1*a13 + b2*a23 + b3*a33
-        ))
-
-        b0, b1, b2, b3 = b[8:12]
-        staging.append((
-            b0*a00 + b1*a10 + b2*a20 + b3*a30,
-            b0*a01 + b1*a11 + b2*a21 + b3*a31,
-            b0*a02 + b1*a12 + b2*a22 + b3*a32,
-            b0*a03 + b1*a13 + b2*a23 + b3*a33
-        ))
-
-        b0, b1, b2, b3 = b[12:16]
-        staging.append((
-            b0*a00 + b1*a10 + b2*a20 + b3*a30,
-            b0*a01 + b1*a11 + b2*a21 + b3*a31,
-            b0*a02 + b1*a12 + b2*a22 + b3*a32,
-            b0*a03 + b1*a13 + b2*a23 + b3*a33
-        ))
-
-        mat = Mat4()
-        mat.data = buffer_type(*chain(*staging))
-        
-        return mat
+        # Each column of `b` is read before the same column of `out` is written
+        for i in (0, 4, 8, 12):
+            b0, b1, b2, b3 = b[i], b[i+1], b[i+2], b[i+3]
+            o[i] = b0*a00 + b1*a10 + b2*a20 + b3*a30
+            o[i+1] = b0*a01 + b1*a11 + b2*a21 + b3*a31
+            o[i+2] = b0*a02 + b1*a12 + b2*a22 + b3*a32
+            o[i+3] = b0*a03 + b1*a13 + b2*a23 + b3*a33
+
+        return out
 
     def __getitem__(self, key):
         return self.data[key]
@@ -393,3 +323,55 @@ class Mat4(Structure):
 
     def __iter__(self):
         yield from iter(self.data)
+
+
+IDENTITY = (
+    1.0, 0.0, 0.0, 0.0,
+    0.0, 1.0, 0.0, 0.0,
+    0.0, 0.0, 1.0, 0.0,
+    0.0, 0.0, 0.0, 1.0,
+)
+
+MAT4_SIZE = sizeof(Mat4)
+
+
+def _invert(data, out, transpose):
+    a00, a01, a02, a03 = data[0:4]
+    a10, a11, a12, a13 = data[4:8]
+    a20, a21, a22, a23 = data[8:12]
+    a30, a31, a32, a33 = data[12:16]
+
+    b00, b01, b02 = (a00 * a11 - a01 * a10), (a00 * a12 - a02 * a10), (a00 * a13 - a03 * a10)
+    b03, b04, b05 = (a01 * a12 - a02 * a11), (a01 * a13 - a03 * a11), (a02 * a13 - a03 * a12)
+    b06, b07, b08 = (a20 * a31 - a21 * a30), (a20 * a32 - a22 * a30), (a20 * a33 - a23 * a30)
+    b09, b10, b11 = (a21 * a32 - a22 * a31), (a21 * a33 - a23 * a31), (a22 * a33 - a23 * a32)
+
+    det = b00 * b11 - b01 * b10 + b02 * b09 + b03 * b08 - b04 * b07 + b05 * b06
+    if not det:
+        raise ValueError
+
+    det = 1.0 / det
+
+    # Write the values column by column, or row by row for the transposed inverse
+    s0, s1, s2, s3 = (0, 4, 8, 12) if not transpose else (0, 1, 2, 3)
+    i0, i1, i2, i3 = (0, 1, 2, 3) if not transpose else (0, 4, 8, 12)
+
+    out[s0+i0] = (a11 * b11 - a12 * b10 + a13 * b09) * det
+    out[s0+i1] = (a02 * b10 - a01 * b11 - a03 * b09) * det
+    out[s0+i2] = (a31 * b05 - a32 * b04 + a33 * b03) * det
+    out[s0+i3] = (a22 * b04 - a21 * b05 - a23 * b03) * det
+
+    out[s1+i0] = (a12 * b08 - a10 * b11 - a13 * b07) * det
+    out[s1+i1] = (a00 * b11 - a02 * b08 + a03 * b07) * det
+    out[s1+i2] = (a32 * b02 - a30 * b05 - a33 * b01) * det
+    out[s1+i3] = (a20 * b05 - a22 * b02 + a23 * b01) * det
+
+    out[s2+i0] = (a10 * b10 - a11 * b08 + a13 * b06) * det
+    out[s2+i1] = (a01 * b08 - a00 * b10 - a03 * b06) * det
+    out[s2+i2] = (a30 * b04 - a31 * b02 + a33 * b00) * det
+    out[s2+i3] = (a21 * b02 - a20 * b04 - a23 * b00) * det
+
+    out[s3+i0] = (a11 * b07 - a10 * b09 - a12 * b06) * det
+    out[s3+i1] = (a00 * b09 - a01 * b07 + a02 * b06) * det
+    out[s3+i2] = (a31 * b01 - a30 * b03 - a32 * b00) * det
+    out[s3+i3] = (a20 * b03 - a21 * b01 + a22 * b00) * det
@@ -0,0 +1,100 @@
+from .mat4 import Mat4
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Mat4Array(object):
+    """
+        A batch of 4x4 matrices stored in a `float32[N,4,4]` numpy array, using the same memory layout as `Mat4`.
+        Operations are applied over the whole batch at once.
+
+        `Mat4` are stored column by column, so the numpy view of a matrix is its transpose. This is
+        why `a * b` is computed as `b @ a` on the numpy arrays.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, count):
+        if np is None:
+            raise RuntimeError("NumPy is required to use Mat4Array")
+
+        self.data = np.empty((count, 4, 4), dtype=np.float32)
+        self.data[::] = np.identity(4, dtype=np.float32)
+
+    @classmethod
+    def from_matrices(cls, matrices):
+        obj = cls(len(matrices))
+        data = obj.data
+        for index, mat in enumerate(matrices):
+            data[index] = _as_array(mat)
+
+        return obj
+
+    @classmethod
+    def from_array(cls, array):
+        """ Wrap an existing `float32` array of shape (N, 4, 4) or (N, 16) without copying it """
+        obj = super(Mat4Array, cls).__new__(cls)
+        obj.data = array.reshape(-1, 4, 4)
+        return obj
+
+    @staticmethod
+    def mul(a, b, out=None):
+        """
+            Compute `a * b`. `a` and `b` can either be a `Mat4Array` or a `Mat4`. If one of them is a `Mat4`,
+            it is multiplied with every matrix of the other array.
+        """
+        a_data, b_data = _as_array(a), _as_array(b)
+        if out is None:
+            out = Mat4Array.from_array(np.empty(np.broadcast_shapes(a_data.shape, b_data.shape), dtype=np.float32))
+
+        np.matmul(b_data, a_data, out=out.data)
+        return out
+
+    def clone(self):
+        return Mat4Array.from_array(self.data.copy())
+
+    def invert(self):
+        self.data[::] = np.linalg.inv(self.data)
+        return self
+
+    def transpose(self):
+        self.data[::] = self.data.transpose(0, 2, 1)
+        return self
+
+    def inverse_transpose(self, out=None):
+        """ Compute the normal matrices of the batch. The result is written in `out` if set, or in a new array. """
+        if out is None:
+            out = Mat4Array.from_array(np.empty_like(self.data))
+
+        out.data[::] = np.linalg.inv(self.data).transpose(0, 2, 1)
+        return out
+
+    def store(self, buffer, offset=0, stride=64):
+        """
+            Write the matrices in `buffer` (any object supporting the writable buffer protocol, ex: a ctypes array
+            or a mapped memory view). The first matrix is written at `offset` and the next ones every `stride` bytes.
+        """
+        count = len(self.data)
+        dst = np.ndarray((count, 4, 4), dtype=np.float32, buffer=buffer, offset=offset, strides=(stride, 16, 4))
+        dst[::] = self.data
+
+    def __getitem__(self, index):
+        return Mat4.from_data(self.data[index].ravel().tolist())
+
+    def __setitem__(self, index, mat):
+        self.data[index] = _as_array(mat)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def _as_array(value):
+    if isinstance(value, Mat4Array):
+        return value.data
+    elif isinstance(value, Mat4):
+        return np.ctypeslib.as_array(value.data).reshape(4, 4)
+    else:
+        raise TypeError(f"Expected Mat4 or Mat4Array, got {type(value).__qualname__}")
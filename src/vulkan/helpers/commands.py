@@ -102,6 +102,22 @@ def image_memory_barrier(**kwargs):
     )
 
 
+def buffer_memory_barrier(**kwargs):
+    required_members = ('dst_access_mask', 'buffer')
+    check_ctypes_members(vk.BufferMemoryBarrier, required_members, kwargs.keys())
+    return vk.BufferMemoryBarrier(
+        type = vk.STRUCTURE_TYPE_BUFFER_MEMORY_BARRIER,
+        next = None,
+        src_access_mask = kwargs.get('src_access_mask', 0),
+        dst_access_mask = kwargs['dst_access_mask'],
+        src_queue_family_index = kwargs.get('src_queue_family_index', vk.QUEUE_FAMILY_IGNORED),
+        dst_queue_family_index = kwargs.get('dst_queue_family_index', vk.QUEUE_FAMILY_IGNORED),
+        buffer = kwargs['buffer'],
+        offset = kwargs.get('offset', 0),
+        size = kwargs.get('size', vk.WHOLE_SIZE)
+    )
+
+
 def pipeline_barrier(api, cmd, barriers, src_stage_mask=vk.PIPELINE_STAGE_ALL_COMMANDS_BIT, dst_stage_mask=vk.PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT, dependency_flags=0):
   
     mb, bb, ib = vk.MemoryBarrier, vk.BufferMemoryBarrier, vk.ImageMemoryBarrier
@@ -177,7 +193,7 @@ def copy_image(api, cmd, src_image, src_image_layout, dst_image, dst_image_layou
 
 def execute_commands(api, cmd, sub_buffers):
     sub_buffers, sub_buffers_ptr, sub_buffer_count = sequence_to_array(sub_buffers, vk.CommandBuffer)
-    api.CmdCopyImage(cmd, sub_buffer_count, sub_buffers_ptr) 
+    api.CmdExecuteCommands(cmd, sub_buffer_count, sub_buffers_ptr)
 
 
 def clear_attachments(api, cmd, attachments, regions):
@@ -211,10 +227,18 @@ def draw_indexed(api, cmd, index_count, instance_count=1, first_index=0, vertex_
     )
 
 
+def draw_indexed_indirect(api, cmd, buffer, offset, draw_count, stride):
+    api.CmdDrawIndexedIndirect(cmd, buffer, offset, draw_count, stride)
+
+
 def dispatch(api, cmd, x, y, z):
     api.CmdDispatch(cmd, x, y, z)
 
 
+def push_constants(api, cmd, layout, stage_flags, offset, size, data):
+    api.CmdPushConstants(cmd, layout, stage_flags, offset, size, data)
+
+
 def bind_descriptor_sets(api, cmd, pipeline_bind_point, layout, descriptor_sets, dynamic_offsets=None, firstSet=0):
 
     descriptor_sets, descriptor_sets_ptr, descriptor_set_count = sequence_to_array(descriptor_sets, vk.DescriptorSet)
@@ -5,7 +5,8 @@ from ctypes import byref, c_uint32
 
 GRAPHICS_DST_STAGE_MASK = {
     vk.ACCESS_SHADER_READ_BIT: vk.PIPELINE_STAGE_FRAGMENT_SHADER_BIT,
-    vk.ACCESS_TRANSFER_WRITE_BIT: vk.PIPELINE_STAGE_TRANSFER_BIT
+    vk.ACCESS_TRANSFER_WRITE_BIT: vk.PIPELINE_STAGE_TRANSFER_BIT,
+    vk.ACCESS_VERTEX_ATTRIBUTE_READ_BIT | vk.ACCESS_INDEX_READ_BIT: vk.PIPELINE_STAGE_VERTEX_INPUT_BIT
 }
 
 COMPUTE_DST_STAGE_MASK = {
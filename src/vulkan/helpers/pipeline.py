@@ -1,6 +1,6 @@
 from .. import vk
 from .utils import check_ctypes_members, sequence_to_array, array, array_pointer
-from ctypes import byref, c_char_p, c_float, pointer, c_int
+from ctypes import byref, c_char_p, c_float, pointer, c_int, c_size_t, c_uint8, string_at, addressof
 
 
 def pipeline_cache_create_info(**kwargs):
@@ -27,11 +27,32 @@ def destroy_pipeline_cache(api, device, pipeline_cache):
     api.DestroyPipelineCache(device, pipeline_cache, None)
 
 
+def get_pipeline_cache_data(api, device, pipeline_cache):
+    size = c_size_t(0)
+    result = api.GetPipelineCacheData(device, pipeline_cache, byref(size), None)
+    if result != vk.SUCCESS:
+        raise RuntimeError(f"Failed to get the pipeline cache data size: {result}")
+
+    data = array(c_uint8, size.value)()
+    result = api.GetPipelineCacheData(device, pipeline_cache, byref(size), data)
+    if result not in (vk.SUCCESS, vk.INCOMPLETE):
+        raise RuntimeError(f"Failed to get the pipeline cache data: {result}")
+
+    return string_at(addressof(data), size.value)
+
+
+def merge_pipeline_caches(api, device, dst_cache, src_caches):
+    src_caches, src_caches_ptr, src_caches_count = sequence_to_array(src_caches, vk.PipelineCache)
+    result = api.MergePipelineCaches(device, dst_cache, src_caches_count, src_caches_ptr)
+    if result != vk.SUCCESS:
+        raise RuntimeError(f"Failed to merge the pipeline caches: {result}")
+
+
 def pipeline_layout_create_info(**kwargs):
     check_ctypes_members(vk.PipelineLayoutCreateInfo, ('set_layouts',), kwargs.keys())
 
     set_layouts, set_layouts_ptr, set_layout_count = sequence_to_array(kwargs['set_layouts'], vk.DescriptorSetLayout)
-    push_constants, push_constants_ptr, push_constant_count = sequence_to_array(kwargs.get('push_constant_ranges'), vk.DescriptorSetLayout)
+    push_constants, push_constants_ptr, push_constant_count = sequence_to_array(kwargs.get('push_constant_ranges'), vk.PushConstantRange)
 
     return vk.PipelineLayoutCreateInfo(
         type = vk.STRUCTURE_TYPE_PIPELINE_LAYOUT_CREATE_INFO,
@@ -200,3 +200,54 @@ def update_descriptor_sets(api, device, write, copy):
     writes, writes_ptr, write_count = sequence_to_array(write, vk.WriteDescriptorSet)
     copies, copies_ptr, copy_count = sequence_to_array(copy, vk.CopyDescriptorSet)
     api.UpdateDescriptorSets(device, write_count, writes_ptr, copy_count, copies_ptr)
+
+
+def descriptor_update_template_entry(**kwargs):
+    required_arguments = ('dst_binding', 'descriptor_type', 'offset')
+    check_ctypes_members(vk.DescriptorUpdateTemplateEntry, required_arguments, kwargs.keys())
+
+    return vk.DescriptorUpdateTemplateEntry(
+        dst_binding = kwargs['dst_binding'],
+        dst_array_element = kwargs.get('dst_array_element', 0),
+        descriptor_count = kwargs.get('descriptor_count', 1),
+        descriptor_type = kwargs['descriptor_type'],
+        offset = kwargs['offset'],
+        stride = kwargs.get('stride', 0)
+    )
+
+
+def descriptor_update_template_create_info(**kwargs):
+    required_arguments = ('descriptor_update_entries', 'descriptor_set_layout')
+    check_ctypes_members(vk.DescriptorUpdateTemplateCreateInfo, required_arguments, kwargs.keys())
+
+    entries, entries_ptr, entry_count = sequence_to_array(kwargs['descriptor_update_entries'], vk.DescriptorUpdateTemplateEntry)
+
+    return vk.DescriptorUpdateTemplateCreateInfo(
+        type = vk.STRUCTURE_TYPE_DESCRIPTOR_UPDATE_TEMPLATE_CREATE_INFO,
+        next = None,
+        flags = 0,
+        descriptor_update_entry_count = entry_count,
+        descriptor_update_entries = entries_ptr,
+        template_type = kwargs.get('template_type', vk.DESCRIPTOR_UPDATE_TEMPLATE_TYPE_DESCRIPTOR_SET),
+        descriptor_set_layout = kwargs['descriptor_set_layout'],
+        pipeline_bind_point = kwargs.get('pipeline_bind_point', 0),
+        pipeline_layout = kwargs.get('pipeline_layout', 0),
+        set = kwargs.get('set', 0)
+    )
+
+
+def create_descriptor_update_template(api, device, info):
+    template = vk.DescriptorUpdateTemplate(0)
+    result = api.CreateDescriptorUpdateTemplate(device, byref(info), None, byref(template))
+    if result != vk.SUCCESS:
+        raise RuntimeError("Failed to create a descriptor update template")
+
+    return template
+
+
+def destroy_descriptor_update_template(api, device, template):
+    api.DestroyDescriptorUpdateTemplate(device, template, None)
+
+
+def update_descriptor_set_with_template(api, device, descriptor_set, template, data):
+    api.UpdateDescriptorSetWithTemplate(device, descriptor_set, template, data)
@@ -31,6 +31,15 @@ def wait_for_fences(api, device, fences, wait_all=True, timeout=-1):
     return result
 
 
+def get_fence_status(api, device, fence):
+    """ Return True if `fence` is signaled. Does not block. """
+    result = api.GetFenceStatus(device, fence)
+    if result not in (vk.SUCCESS, vk.NOT_READY):
+        raise RuntimeError(f"Failed to get the fence status: {result}")
+
+    return result == vk.SUCCESS
+
+
 def reset_fences(api, device, fences):
     fences_count = len(fences)
     fences = array(vk.Fence, fences_count, fences)
@@ -0,0 +1,116 @@
+"""
+Measure the python time spent per 1000 image uniform swaps (one frame where 1000 objects change their textures).
+Compare the previous update (the image info of a cached write set is edited, then all the write sets are packed
+in a new array for `vkUpdateDescriptorSets`) with descriptor update templates, native and emulated.
+
+The vulkan functions are replaced by `getpid` from the C library, so the ctypes calls and the argument conversions
+are measured, but not the driver. Linux only.
+
+Usage:
+`python ./tools/benchmark_descriptor_updates.py`
+"""
+
+from pathlib import Path
+import sys, timeit
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from vulkan import vk, helpers as hvk
+from engine.data_components.descriptor_updates import DescriptorUpdateTemplate, update_descriptor_sets
+from ctypes import CDLL, cast, c_void_p
+
+
+OBJECT_COUNT = 1000
+
+class FakeApi(object):
+    pass
+
+noop = cast(CDLL(None).getpid, c_void_p).value
+api = FakeApi()
+api.UpdateDescriptorSets = vk.FnUpdateDescriptorSets(noop)
+api.UpdateDescriptorSetWithTemplate = vk.FnUpdateDescriptorSetWithTemplate(noop)
+device = vk.Device(0)
+
+
+def templates(image_count):
+    wst = [{"name": "view", "descriptor_type": vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC, "range": 256, "binding": 0, "buffer": True, "bindless": False, "count": 1}]
+    for i in range(image_count):
+        wst.append({"name": f"image{i}", "descriptor_type": vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER, "range": None, "binding": i+1, "buffer": False, "bindless": False, "count": 1})
+
+    return wst
+
+
+def legacy_setup(wst):
+    write_sets = []
+    for index in range(OBJECT_COUNT):
+        write_sets.append({
+            w["name"]: hvk.write_descriptor_set(
+                dst_set = index,
+                dst_binding = w["binding"],
+                descriptor_type = w["descriptor_type"],
+                image_info = (vk.DescriptorImageInfo(),)
+            )
+            for w in wst if not w["buffer"]
+        })
+
+    return write_sets
+
+
+def legacy_swap(objects, names, view):
+    image_write_sets = []
+    for write_sets in objects:
+        for name in names:
+            write_set = write_sets[name]
+            image_info = write_set.image_info[0]
+            image_info.sampler = 1
+            image_info.image_layout = vk.IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL
+            image_info.image_view = view
+            image_write_sets.append(write_set)
+
+    hvk.update_descriptor_sets(api, device, image_write_sets, ())
+
+
+def template_setup(wst, native):
+    # Templates are not created by the fake api
+    template = DescriptorUpdateTemplate(api, device, 0, wst, False)
+    if native:
+        template.handle = vk.DescriptorUpdateTemplate(1)
+
+    return [template.new_set_data(index) for index in range(OBJECT_COUNT)]
+
+
+def template_swap(objects, names, view):
+    pending_sets = set()
+    for set_data in objects:
+        for name in names:
+            image_info = getattr(set_data.data, name)
+            image_info.sampler = 1
+            image_info.image_layout = vk.IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL
+            image_info.image_view = view
+            pending_sets.add(set_data)
+
+    update_descriptor_sets(api, device, pending_sets)
+
+
+def run(image_count):
+    wst = templates(image_count)
+    names = [w["name"] for w in wst if not w["buffer"]]
+    swaps = OBJECT_COUNT * image_count
+
+    legacy = legacy_setup(wst)
+    native = template_setup(wst, True)
+    emulated = template_setup(wst, False)
+
+    number = 20
+    best = lambda fn: min(timeit.repeat(fn, repeat=5, number=number)) / number
+    legacy_time = best(lambda: legacy_swap(legacy, names, 2))
+    native_time = best(lambda: template_swap(native, names, 2))
+    emulated_time = best(lambda: template_swap(emulated, names, 2))
+
+    per_1000 = lambda t: t * 1000 * 1000 / swaps
+    print(f"{OBJECT_COUNT} objects, {image_count} image(s) per set: legacy {per_1000(legacy_time):>6.2f}ms | "
+          f"template {per_1000(native_time):>6.2f}ms | emulated template {per_1000(emulated_time):>6.2f}ms (per 1000 swaps)")
+
+
+run(1)
+run(3)
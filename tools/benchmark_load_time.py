@@ -0,0 +1,168 @@
+"""
+Measure the host side of a scene load on a ~100MB asset set: reading the assets and writing them in the staging ring.
+Compare the previous staging writes (ctypes arrays built from the asset data, byte by byte for the images and
+the memoryview meshes) with the current ones (memoryviews over the asset data, copied once in the staging ring).
+
+The asset set is generated in a temporary directory: a BC3 2048x2048 texture array with 16 layers and a full mipmap chain
+(~85MB) and 16 meshes of 1MB backed by a memoryview over their file, like the meshes of a glb file.
+The staging ring is a host buffer of the default ring size, so the device copies are not measured.
+
+Usage:
+`python ./tools/benchmark_load_time.py`
+"""
+
+from pathlib import Path
+import sys, tempfile, tracemalloc
+from time import perf_counter
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from vulkan import helpers as hvk
+from engine.assets import KTXFile
+from engine.assets.ktx_file import KtxHeader, KTX_ID
+from engine.public_components import Image, Mesh, TypedArray, TypedArrayFormat
+from engine.upload_manager import DEFAULT_STAGING_RING_SIZE
+from ctypes import c_ubyte, c_uint8, c_uint32, memmove, byref
+import os
+
+
+TEXTURE_SIZE = 2048
+TEXTURE_LAYERS = 16
+MESH_COUNT = 16
+MESH_SIZE = 1024 * 1024
+REPEAT = 3      # The legacy writes take more than a minute, so they run once
+
+
+def write_ktx(path):
+    header = KtxHeader(
+        id = KTX_ID,
+        endianness = 0x04030201,
+        gl_type = 0, gl_type_size = 1, gl_format = 0,
+        gl_internal_format = 0x83F3,    # BC3
+        gl_base_internal_format = 0x1908,
+        pixel_width = TEXTURE_SIZE, pixel_height = TEXTURE_SIZE,
+        number_of_array_elements = TEXTURE_LAYERS,
+        number_of_faces = 1,
+        number_of_mipmap_levels = TEXTURE_SIZE.bit_length(),
+    )
+
+    with open(path, "wb") as f:
+        f.write(header)
+        size = TEXTURE_SIZE
+        while size > 0:
+            blocks = max(1, size // 4)
+            mip_size = blocks * blocks * 16
+            f.write(c_uint32(mip_size))
+            f.write(os.urandom(mip_size) * TEXTURE_LAYERS)
+            size //= 2
+
+
+def write_meshes(path):
+    with open(path, "wb") as f:
+        f.write(os.urandom(MESH_SIZE * MESH_COUNT))
+
+
+def load_assets(ktx_path, meshes_path):
+    image = Image.from_ktx(KTXFile.open(ktx_path))
+
+    with open(meshes_path, "rb") as f:
+        buffer = memoryview(f.read())
+
+    meshes = []
+    indices_size = MESH_SIZE // 4
+    for i in range(MESH_COUNT):
+        start = i * MESH_SIZE
+        indices = TypedArray.from_memory_view(TypedArrayFormat.UInt16, indices_size // 2, buffer[start:start+indices_size])
+        positions = TypedArray.from_memory_view(TypedArrayFormat.Float32, (MESH_SIZE - indices_size) // 4, buffer[start+indices_size:start+MESH_SIZE])
+        meshes.append(Mesh.from_array(indices=indices, attributes={"POSITION": positions}))
+
+    return image, meshes
+
+
+class Ring(object):
+    """ Host buffer written like the staging ring, without the device copies """
+
+    def __init__(self):
+        self.size = DEFAULT_STAGING_RING_SIZE
+        self.chunk_size = self.size // 4
+        self.buffer = (c_uint8 * self.size)()
+        self.view = memoryview(self.buffer).cast('B')
+        self.head = 0
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        for offset in range(0, len(data), self.chunk_size):
+            piece = data[offset:offset+self.chunk_size]
+            size = len(piece)
+            if self.head + size > self.size:
+                self.head = 0
+            self.view[self.head:self.head+size] = piece
+            self.head += size
+
+
+def legacy_typed_array_pointer(array):
+    raw_data = (c_uint8 * array.size_bytes)(*array.data.tobytes())
+    return byref(raw_data)
+
+
+def legacy(ring, image, meshes):
+    for mesh in meshes:
+        buffer = (c_ubyte * mesh.size())()
+        offset = 0
+        for array in (mesh.indices, *mesh.attributes.values()):
+            memmove(byref(buffer, offset), legacy_typed_array_pointer(array), array.size_bytes)
+            offset += array.size_bytes
+
+        ring.write(buffer)
+
+    data = hvk.array(c_ubyte, image.texture_size, image.texture_data())
+    data = memoryview(data).cast('B')
+    for m in image.iter_mipmaps():
+        ring.write(data[m.offset:m.offset+m.size])
+
+
+def zero_copy(ring, image, meshes):
+    for mesh in meshes:
+        for array in (mesh.indices, *mesh.attributes.values()):
+            ring.write(array.view())
+
+    for _, data in image.iter_mipmaps_data():
+        ring.write(data)
+
+
+def run(name, write, ktx_path, meshes_path, repeat):
+    best_load = best_write = float("inf")
+    peak = 0
+    ring = Ring()
+
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = perf_counter()
+        image, meshes = load_assets(ktx_path, meshes_path)
+        loaded = perf_counter()
+        write(ring, image, meshes)
+        end = perf_counter()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        best_load = min(best_load, loaded - start)
+        best_write = min(best_write, end - loaded)
+        del image, meshes
+
+    print(f"{name:>10}: read {best_load*1000:>8.2f}ms | staging writes {best_write*1000:>8.2f}ms | peak python memory {peak/(1024*1024):>7.1f}MB")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        ktx_path, meshes_path = Path(tmp) / "array.ktx", Path(tmp) / "meshes.bin"
+        write_ktx(ktx_path)
+        write_meshes(meshes_path)
+
+        total = ktx_path.stat().st_size + meshes_path.stat().st_size
+        print(f"Asset set: {total/(1024*1024):.1f}MB, staging ring: {DEFAULT_STAGING_RING_SIZE//(1024*1024)}MB")
+
+        run("legacy", legacy, ktx_path, meshes_path, 1)
+        run("zero copy", zero_copy, ktx_path, meshes_path, REPEAT)
+
+
+main()
@@ -0,0 +1,41 @@
+"""
+Compare the scalar `Mat4` math with the batched `Mat4Array` math when updating the uniforms of many objects.
+For each object, compute `projection * (view * model)` and the inverse transpose of `model`.
+NumPy must be installed.
+
+Usage:
+`python ./tools/benchmark_mat4.py`
+"""
+
+from pathlib import Path
+import sys, timeit, random
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from utils import Mat4, Mat4Array
+
+
+def scalar_update(projection, view, models):
+    results = []
+    for model in models:
+        results.append((projection * (view * model), model.clone().invert().transpose()))
+
+    return results
+
+
+def batch_update(projection, view, models):
+    return Mat4Array.mul(projection, Mat4Array.mul(view, models)), models.inverse_transpose()
+
+
+projection = Mat4.perspective(1.0, 800/600, 0.1, 1000.0)
+view = Mat4.look_at((0.0, 0.0, 5.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+
+for count in (1, 100, 10000):
+    models = [Mat4.from_rotation(random.random(), (0.0, 1.0, 0.0)).translate(random.random(), 0.0, 0.0) for _ in range(count)]
+    models_array = Mat4Array.from_matrices(models)
+    number = max(1, 1000 // count)
+
+    scalar = timeit.timeit(lambda: scalar_update(projection, view, models), number=number) / number
+    batch = timeit.timeit(lambda: batch_update(projection, view, models_array), number=number) / number
+
+    print(f"{count:>6} objects: scalar {scalar*1000:>10.3f}ms | batch {batch*1000:>10.3f}ms | x{scalar/batch:.1f}")
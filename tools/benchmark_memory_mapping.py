@@ -0,0 +1,81 @@
+"""
+Count the `vkMapMemory` / `vkUnmapMemory` calls made by the `MemoryManager` over 1000 frames. Every frame writes
+the uniforms of the frame slice and a staging buffer, like a scene updating its uniforms and streaming data.
+
+Compare the persistent mapping (host visible blocks are mapped once, when they are allocated) with the previous
+behavior (every `map_alloc` maps and unmaps the memory). The vulkan functions are replaced by the fake api of
+`fake_memory_api.py`, that counts the calls and hands out host memory, so no device is needed.
+
+Usage:
+`python ./tools/benchmark_memory_mapping.py`
+"""
+
+from pathlib import Path
+import sys, timeit
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from vulkan import vk, helpers as hvk
+from engine.memory_manager import MemoryManager, MemoryBlock
+from fake_memory_api import FakeEngine, HOST_MEMORY
+from ctypes import c_uint8
+
+
+FRAMES = 1000
+FRAMES_IN_FLIGHT = 3
+UNIFORMS_SLICE_SIZE = 64 * 1024
+STAGING_SIZE = 1024 * 1024
+
+
+class LegacyMemoryManager(MemoryManager):
+    """ Host visible blocks are not mapped when they are allocated, so `map_alloc` maps and unmaps the memory """
+
+    def _allocate_block(self, memory_type_index, linear, size):
+        _, api, device = self.ctx
+
+        device_memory = hvk.allocate_memory(api, device, hvk.memory_allocate_info(
+            allocation_size = size,
+            memory_type_index = memory_type_index
+        ))
+
+        block = MemoryBlock(device_memory, memory_type_index, linear, size, dedicated=size > self.block_size)
+        self.blocks.append(block)
+
+        return block
+
+
+def frames(mem, uniforms_alloc, staging_alloc, data):
+    for frame in range(FRAMES):
+        offset = (frame % FRAMES_IN_FLIGHT) * UNIFORMS_SLICE_SIZE
+        with mem.map_alloc(uniforms_alloc, offset, UNIFORMS_SLICE_SIZE) as mapping:
+            mapping.write_bytes(0, data)
+
+        with mem.map_alloc(staging_alloc) as mapping:
+            mapping.write_bytes(0, data)
+
+
+def run(name, manager_type):
+    engine = FakeEngine()
+    api = engine.api
+    mem = manager_type(engine)
+
+    uniforms = api.resource(vk.Buffer, UNIFORMS_SLICE_SIZE * FRAMES_IN_FLIGHT)
+    staging = api.resource(vk.Buffer, STAGING_SIZE)
+    uniforms_alloc = mem.alloc(uniforms, vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO, (HOST_MEMORY,))
+    staging_alloc = mem.alloc(staging, vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO, (HOST_MEMORY,))
+    host_blocks = sum(1 for b in mem.blocks if b.memory_type_index == 1)
+
+    data = (c_uint8 * UNIFORMS_SLICE_SIZE)()
+    setup_maps = api.calls["MapMemory"]
+    elapsed = min(timeit.repeat(lambda: frames(mem, uniforms_alloc, staging_alloc, data), repeat=3, number=1))
+    maps = (api.calls["MapMemory"] - setup_maps) // 3
+    unmaps = api.calls["UnmapMemory"] // 3
+
+    print(f"{name:>10}: {setup_maps} map(s) at allocation for {host_blocks} host visible block(s) | "
+          f"{maps} map(s), {unmaps} unmap(s) per {FRAMES} frames | {elapsed*1000:>7.2f}ms")
+
+    mem.free()
+
+
+run("legacy", LegacyMemoryManager)
+run("persistent", MemoryManager)
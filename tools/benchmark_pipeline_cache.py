@@ -0,0 +1,81 @@
+"""
+Measure the pipeline creation time of the game scenes on a cold start (empty pipeline cache) and
+on a warm start (pipeline cache reloaded from the disk by a new process). Pipelines are compiled in the background,
+so the time `Engine.load` blocks is reported separately from the time until the pipelines are available.
+
+Each start runs in its own process. The driver on-disk shader caches (mesa, nvidia) are disabled
+in the child processes, so only the engine pipeline cache is measured. Requires a vulkan device.
+
+Usage:
+`python ./tools/benchmark_pipeline_cache.py`
+"""
+
+from pathlib import Path
+import sys, os, subprocess, tempfile, json
+
+SRC_PATH = Path(__file__).parent.parent / "src"
+
+
+def child(cache_path):
+    sys.path.append(str(SRC_PATH))
+    os.chdir(SRC_PATH)
+
+    from engine import Engine, QueueConf, QueueType
+    from game import MainScene, DebugTexturesScene, DebugNormalsScene, DebugPBRScene, DebugComputeScene
+    from time import perf_counter
+
+    class App(object):
+        def switch_scene(self, data):
+            pass
+
+    start = perf_counter()
+    engine = Engine({
+        "QUEUES": (QueueConf.Default, QueueConf(name="compute", type=QueueType.Compute, required=False)),
+        "PIPELINE_CACHE_PATH": cache_path,
+    })
+    startup = perf_counter() - start
+
+    results = {"startup": startup, "cache_size": engine.pipeline_cache.loaded_size, "scenes": []}
+    app = App()
+    for scene_type in (MainScene, DebugTexturesScene, DebugNormalsScene, DebugPBRScene, DebugComputeScene):
+        scene = scene_type(app, engine)
+        start = perf_counter()
+        engine.load(scene.scene)
+        load = perf_counter() - start
+
+        data_scene = engine.graph[scene.scene.id]
+        data_scene.poll_pipelines(wait=True)
+        count, cached, seconds = data_scene.pipeline_stats
+        results["scenes"].append((scene_type.__name__, count, cached, seconds, load))
+
+    engine.free()
+    print(json.dumps(results))
+
+
+def run(cache_path):
+    env = dict(os.environ, MESA_SHADER_CACHE_DISABLE="true", __GL_SHADER_DISK_CACHE="0")
+    out = subprocess.check_output([sys.executable, __file__, "--child", cache_path], env=env)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cache_path:
+        cold = run(cache_path)
+        warm = run(cache_path)
+
+    print(f"Engine startup: cold {cold['startup']*1000:>8.2f}ms | warm {warm['startup']*1000:>8.2f}ms (loaded {warm['cache_size']} bytes of pipeline cache)")
+
+    cold_total = warm_total = 0.0
+    for (name, count, _, cold_time, cold_load), (_, _, cached, warm_time, warm_load) in zip(cold["scenes"], warm["scenes"]):
+        cold_total += cold_time
+        warm_total += warm_time
+        print(f"{name:>20}: {count} pipelines | cold {cold_time*1000:>8.2f}ms | warm {warm_time*1000:>8.2f}ms ({cached} cached) | "
+              f"load blocked cold {cold_load*1000:>8.2f}ms, warm {warm_load*1000:>8.2f}ms")
+
+    print(f"{'Total':>20}: cold {cold_total*1000:>8.2f}ms | warm {warm_total*1000:>8.2f}ms")
+
+
+if "--child" in sys.argv:
+    child(sys.argv[-1])
+else:
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare the uniforms containers of the engine with the previous implementation that marked a uniform as
+updated in `__getattribute__`. Measures attribute reads, in place updates and assignments.
+
+Usage:
+`python ./tools/benchmark_uniforms.py`
+"""
+
+from pathlib import Path
+import sys, timeit
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from engine.base_types import UniformsMaps
+from engine.data_components.shared import uniform_struct
+
+
+class LegacyUniformsMaps(object):
+
+    def __init__(self, values):
+        sup = super()
+        sup.__setattr__('updated_member_names', set())
+        sup.__setattr__('uniform_names', list(values.keys()))
+        for name, value in values.items():
+            sup.__setattr__(name, value)
+
+    def __getattribute__(self, name):
+        sup = super()
+        names = sup.__getattribute__("uniform_names")
+
+        if name in names:
+            sup.__getattribute__("updated_member_names").add(name)
+
+        return sup.__getattribute__(name)
+
+    def __setattr__(self, name, value):
+        sup = super()
+        names = sup.__getattribute__("uniform_names")
+
+        if name in names:
+            sup.__getattribute__("updated_member_names").add(name)
+
+        sup.__setattr__(name, value)
+
+
+MAT4, VEC4, INT = 2, 5, 13
+fields = lambda *types: [{"name": f"field{i}", "type": t, "count": 1} for i, t in enumerate(types)]
+
+structs = {
+    "render": uniform_struct("Render", fields(VEC4, VEC4, VEC4, VEC4, VEC4, INT)),
+    "camera": uniform_struct("Camera", fields(MAT4)),
+    "view": uniform_struct("View", fields(MAT4, MAT4, MAT4)),
+}
+
+
+def new_values():
+    return {name: struct() for name, struct in structs.items()}
+
+
+def read(uniforms):
+    for _ in range(100):
+        uniforms.view
+        uniforms.render
+        uniforms.camera
+
+
+def update_legacy(uniforms):
+    for _ in range(100):
+        uniforms.render.field5[0] = 1
+
+
+def update(uniforms):
+    for _ in range(100):
+        uniforms.render.field5[0] = 1
+        uniforms.touch("render")
+
+
+def assign(uniforms):
+    view = uniforms.view
+    for _ in range(100):
+        uniforms.view = view
+
+
+legacy = LegacyUniformsMaps(new_values())
+bound = UniformsMaps().bind(new_values(), ())
+
+tests = (
+    ("300 reads", read, read),
+    ("100 in place updates", update_legacy, update),
+    ("100 assignments", assign, assign),
+)
+
+number = 2000
+for name, legacy_test, test in tests:
+    legacy_time = timeit.timeit(lambda: legacy_test(legacy), number=number) / number
+    bound_time = timeit.timeit(lambda: test(bound), number=number) / number
+    print(f"{name:>22}: legacy {legacy_time*1000000:>8.2f}us | bound {bound_time*1000000:>8.2f}us | x{legacy_time/bound_time:.1f}")
+
+# Only real writes should mark the uniforms as updated
+legacy, bound = LegacyUniformsMaps(new_values()), UniformsMaps().bind(new_values(), ())
+read(legacy)
+read(bound)
+print(f"Updated after reads: legacy {sorted(legacy.updated_member_names)} | bound {sorted(bound.updated_member_names)}")
@@ -0,0 +1,92 @@
+"""
+Simulate the upload of the uniforms of 10k dirty objects to a fake mapped uniforms buffer with 2 frames in flight.
+Compare the previous upload (values queued for each slice, then one `write_typed_data` call per value and per slice)
+with the upload of `UniformsUpload` (uniforms are views in the CPU side copy, dirty 256 bytes pages are merged in runs
+copied with one slice assignment per run), and check that both produce the same buffer content.
+
+Usage:
+`python ./tools/benchmark_uniforms_upload.py`
+"""
+
+from pathlib import Path
+import sys, timeit, random
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from engine.data_components.uniforms_upload import UniformsUpload
+from engine.data_components.shared import uniform_struct
+from ctypes import c_uint8, sizeof, addressof, string_at, pointer
+
+
+OBJECT_COUNT = 10000
+FRAMES_IN_FLIGHT = 2
+ALIGNMENT = 256
+
+MAT4 = 2
+View = uniform_struct("View", [{"name": n, "type": MAT4, "count": 1} for n in ("mvp", "model", "normal")], ALIGNMENT)
+
+
+def legacy_upload(dst, values):
+    pending_slices = tuple({} for _ in range(FRAMES_IN_FLIGHT))
+    for offset, value in values:
+        for pending in pending_slices:
+            pending[offset] = value
+
+    # Previous `MappedDeviceMemory.write_typed_data`
+    for slice_index, pending in enumerate(pending_slices):
+        dst_address = addressof(dst[slice_index])
+        for offset, value in pending.items():
+            data = (type(value)*1).from_address(dst_address + offset)
+            data[0] = value
+
+
+def planned_upload(upload, dst, values):
+    for offset, value in values:
+        upload.write(offset, value)
+
+    for slice_index in range(FRAMES_IN_FLIGHT):
+        upload.flush(slice_index, memoryview(dst[slice_index]).cast('B'))
+
+
+def run(name, dirty_values, slice_size, views=True):
+    slices_type = (c_uint8 * slice_size) * FRAMES_IN_FLIGHT
+    legacy_dst, planned_dst = slices_type(), slices_type()
+    upload = UniformsUpload(slice_size, FRAMES_IN_FLIGHT)
+
+    # Like in `DataScene._setup_uniforms`, the uniforms are views in the shadow copy
+    if views:
+        planned_values = []
+        for offset, value in dirty_values:
+            view = upload.view(type(value), offset)
+            pointer(view)[0] = value
+            planned_values.append((offset, view))
+    else:
+        planned_values = dirty_values
+
+    for offset, value in planned_values:
+        upload.write(offset, value)
+    runs = upload.plan(0)
+
+    number = 5
+    legacy = timeit.timeit(lambda: legacy_upload(legacy_dst, dirty_values), number=number) / number
+    planned = timeit.timeit(lambda: planned_upload(upload, planned_dst, planned_values), number=number) / number
+
+    size = sizeof(slices_type)
+    same = string_at(addressof(legacy_dst), size) == string_at(addressof(planned_dst), size)
+    print(f"{name:>30}: legacy {legacy*1000:>8.2f}ms | planned {planned*1000:>8.2f}ms | {len(dirty_values):>5} values in {len(runs):>4} runs | same content: {same}")
+
+
+stride = sizeof(View)
+slice_size = stride * OBJECT_COUNT
+
+values = []
+for index in range(OBJECT_COUNT):
+    view = View()
+    view.mvp[::] = [random.random() for _ in range(16)]
+    view.model[::] = [random.random() for _ in range(16)]
+    values.append((index * stride, view))
+
+run("10k dirty objects", values, slice_size)
+run("10k dirty objects (shuffled)", random.sample(values, len(values)), slice_size)
+run("every 10th object dirty", values[::10], slice_size)
+run("10k objects, copied values", values, slice_size, views=False)
@@ -0,0 +1,247 @@
+"""
+Check the instanced rendering path of `DataScene`: the batching of the objects of an instanced shader and the placement
+of their instance data in the uniforms buffer. No device is needed: the shader is set up from its mapping only
+(no shader module), and the scene only runs the setup of the draw lists, the instance data and the indirect commands.
+
+The instanced shader reads `pos` and `normal` from the meshes and a per instance struct (`model`, `color`) from a
+vertex binding with an instance input rate. 40 objects use 3 meshes: every fifth object is hidden, and two objects have no mesh.
+The check fails if:
+- The instance data is not set up from the mapping "instance" entry, or a bad instance stride is accepted
+- The draw list is not split in one `(mesh, first_instance, instance_count)` batch per mesh, counting only the visible objects
+- The instance data of a batch is not the data of its objects, placed at `first_instance`, with hidden and undrawn objects after
+- With indirect draws, the indirect commands do not match the batches (a single multi draw from the shared meshes layout)
+- With indirect draws, hiding an object does not update its batch and the indirect commands
+
+Usage:
+`python ./tools/check_instancing.py`
+"""
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from vulkan import vk
+from engine.public_components import Mesh, TypedArray, TypedArrayFormat
+from engine.data_components.data_scene import DataScene
+from engine.data_components.data_shader import DataShader
+from engine.data_components.data_mesh import DataMesh
+from engine.data_components.data_game_object import DataGameObject
+from engine.data_components.uniforms_upload import UniformsUpload
+from ctypes import sizeof
+
+
+OBJECT_COUNT = 40
+MESH_VERTICES = (4, 6, 3)
+UNDRAWN = (7, 23)
+
+INSTANCE_MAPPING = {
+    "sets": [],
+    "uniforms": [],
+    "bindings": [
+        {"id": 0, "stride": 12},
+        {"id": 1, "stride": 12},
+        {"id": 2, "stride": 80, "rate": vk.VERTEX_INPUT_RATE_INSTANCE},
+    ],
+    "attributes": [
+        {"name": "pos", "location": 0, "binding": 0, "format": vk.FORMAT_R32G32B32_SFLOAT},
+        {"name": "normal", "location": 1, "binding": 1, "format": vk.FORMAT_R32G32B32_SFLOAT},
+        {"name": "model0", "location": 2, "binding": 2, "format": vk.FORMAT_R32G32B32A32_SFLOAT, "offset": 0},
+        {"name": "model1", "location": 3, "binding": 2, "format": vk.FORMAT_R32G32B32A32_SFLOAT, "offset": 16},
+        {"name": "model2", "location": 4, "binding": 2, "format": vk.FORMAT_R32G32B32A32_SFLOAT, "offset": 32},
+        {"name": "model3", "location": 5, "binding": 2, "format": vk.FORMAT_R32G32B32A32_SFLOAT, "offset": 48},
+        {"name": "color", "location": 6, "binding": 2, "format": vk.FORMAT_R32G32B32A32_SFLOAT, "offset": 64},
+    ],
+    "instance": {"name": "instance", "binding": 2, "fields": [
+        {"name": "model", "type": 2, "count": 1},
+        {"name": "color", "type": 5, "count": 1},
+    ]},
+}
+
+
+class FakeShader(object):
+
+    def __init__(self, mapping):
+        self.name = "instanced"
+        self.mapping = mapping
+
+
+class FakeEngine(object):
+
+    def __init__(self):
+        self.info = {"multi_draw_indirect": True}
+
+
+class FakeObject(object):
+    """ The attributes of a `GameObject` read by the scene """
+
+    def __init__(self, object_id, mesh, hidden, uniforms):
+        self.id = object_id
+        self.name = f"object{object_id}"
+        self.shader = 0
+        self.mesh = mesh
+        self.hidden = hidden
+        self.uniforms = uniforms
+
+
+class FakeUniforms(object):
+    pass
+
+
+def data_shader(mapping):
+    # Only the vertex state and the instance data are set up, the shader modules and the layouts need a device
+    shader = DataShader.__new__(DataShader)
+    shader.shader = FakeShader(mapping)
+    shader.instance_name = shader.instance_struct = shader.instance_binding = None
+    shader.instance_offset = shader.indirect_offset = 0
+    shader._setup_vertex_state()
+    shader._setup_instance_data()
+    return shader
+
+
+def mesh(vertex_count):
+    positions = TypedArray.from_array(TypedArrayFormat.Float32, [float(i) for i in range(vertex_count * 3)])
+    normals = TypedArray.from_array(TypedArrayFormat.Float32, [float(-i) for i in range(vertex_count * 3)])
+    indices = TypedArray.from_array(TypedArrayFormat.UInt16, [i % vertex_count for i in range(vertex_count * 3)])
+    return Mesh.from_array(indices=indices, attributes={"pos": positions, "normal": normals})
+
+
+def setup_scene(indirect_draws, objects, data_meshes, meshes_size):
+    shader = data_shader(INSTANCE_MAPPING)
+    stride = sizeof(shader.instance_struct)
+    shader.indirect_offset = OBJECT_COUNT * stride
+
+    scene = DataScene.__new__(DataScene)
+    scene.engine = FakeEngine()
+    scene.indirect_draws = indirect_draws
+    scene.shaders = [shader]
+    scene.meshes = data_meshes
+    scene.objects = [DataGameObject(obj) for obj in objects]
+    scene.shader_objects_sorted = False
+    scene.uniforms_upload = UniformsUpload(shader.indirect_offset + len(data_meshes) * sizeof(vk.DrawIndexedIndirectCommand), 1)
+
+    for data_obj in scene.objects:
+        data_obj.pipeline = 0
+        data_obj.write_sets = {}
+
+    scene.shared_meshes, _ = scene._setup_shared_meshes(scene.objects, data_meshes, meshes_size)
+    scene._setup_draw_lists()
+    scene.shader_groups = {0: 0}
+
+    return scene
+
+
+def expected_batches(objects):
+    batches, first_instance = [], 0
+    for mesh_index in range(len(MESH_VERTICES)):
+        mesh_objects = [obj for obj in objects if obj.mesh == mesh_index]
+        visible = sum(1 for obj in mesh_objects if not obj.hidden)
+        batches.append((mesh_index, first_instance, visible))
+        first_instance += len(mesh_objects)
+
+    return batches
+
+
+def placed_objects(scene):
+    # Object ids stored in the instance data of the scene, in instance order
+    shader = scene.shaders[0]
+    stride = sizeof(shader.instance_struct)
+    upload = scene.uniforms_upload
+    return [int(upload.view(shader.instance_struct, shader.instance_offset + i * stride).model[0]) for i in range(OBJECT_COUNT)]
+
+
+def indirect_commands(scene, count):
+    shader = scene.shaders[0]
+    stride = sizeof(vk.DrawIndexedIndirectCommand)
+    commands = [scene.uniforms_upload.view(vk.DrawIndexedIndirectCommand, shader.indirect_offset + i * stride) for i in range(count)]
+    return [(c.index_count, c.instance_count, c.first_index, c.vertex_offset, c.first_instance) for c in commands]
+
+
+failures = []
+
+def check(condition, message):
+    print(f"{'OK' if condition else 'FAILED'}: {message}")
+    if not condition:
+        failures.append(message)
+
+
+# Shader setup
+shader = data_shader(INSTANCE_MAPPING)
+check(shader.instanced and shader.instance_binding == 2 and sizeof(shader.instance_struct) == 80, "the instance struct is read from the binding 2 (80 bytes)")
+check(shader.ordered_attribute_names == ("pos", "normal") and shader.ordered_attribute_strides == (12, 12), "the mesh attributes do not include the instance attributes")
+
+bad_mapping = dict(INSTANCE_MAPPING, bindings=[dict(b, stride=64) if b["id"] == 2 else b for b in INSTANCE_MAPPING["bindings"]])
+try:
+    data_shader(bad_mapping)
+    check(False, "an instance stride that does not match the instance struct is rejected")
+except ValueError:
+    check(True, "an instance stride that does not match the instance struct is rejected")
+
+# Scene objects. The instance data of an object stores its id in `model[0]` and its mesh in `color[0]`
+meshes = [mesh(count) for count in MESH_VERTICES]
+data_meshes, meshes_size = [], 0
+for m in meshes:
+    data_meshes.append(DataMesh(m, meshes_size))
+    meshes_size += m.size()
+
+objects = []
+for object_id in range(OBJECT_COUNT):
+    mesh_index = None if object_id in UNDRAWN else object_id * 7 % len(MESH_VERTICES)
+    uniforms = FakeUniforms()
+    uniforms.instance = shader.instance_struct()
+    uniforms.instance.model[0] = object_id
+    uniforms.instance.color[0] = -1 if mesh_index is None else mesh_index
+    objects.append(FakeObject(object_id, mesh_index, object_id % 5 == 0, uniforms))
+
+visible_ids = lambda mesh_index: {o.id for o in objects if o.mesh == mesh_index and not o.hidden}
+hidden_ids = lambda mesh_index: {o.id for o in objects if o.mesh == mesh_index and o.hidden}
+
+# Direct draws: hidden objects are not in the draw list
+scene = setup_scene(False, objects, data_meshes, meshes_size)
+batches = scene.instance_batches[0]
+direct_batches, first_instance = [], 0
+for mesh_index, _, count in expected_batches(objects):
+    direct_batches.append((mesh_index, first_instance, count))
+    first_instance += count
+
+check(batches == direct_batches, f"direct draws: {len(batches)} batches {batches}, one per mesh with the visible objects")
+
+placed = placed_objects(scene)
+check(all(set(placed[first:first+count]) == visible_ids(m) for m, first, count in batches), "direct draws: the instance data of a batch is the data of its visible objects")
+drawn = sum(count for _, _, count in batches)
+check(set(placed[drawn:]) == {o.id for o in objects if o.hidden or o.mesh is None}, "direct draws: hidden and undrawn objects are placed after the batches")
+
+offsets = {data_obj.write_sets["instance"]["buffer_offset_range"][0] for data_obj in scene.objects}
+stride = sizeof(shader.instance_struct)
+check(all(placed[data_obj.write_sets["instance"]["buffer_offset_range"][0] // stride] == data_obj.obj.id for data_obj in scene.objects) and len(offsets) == OBJECT_COUNT,
+      "direct draws: the instance offset of every object points to its own data")
+
+# Indirect draws: hidden objects stay in the draw list, after the visible objects of their batch
+scene = setup_scene(True, objects, data_meshes, meshes_size)
+batches = scene.instance_batches[0]
+check(batches == expected_batches(objects), f"indirect draws: {len(batches)} batches {batches}, hidden objects stay in their batch")
+
+placed = placed_objects(scene)
+next_batches = [first for _, first, _ in batches[1:]] + [OBJECT_COUNT - len(UNDRAWN)]
+check(all(set(placed[first:first+count]) == visible_ids(m) and set(placed[first+count:end]) == hidden_ids(m) for (m, first, count), end in zip(batches, next_batches)),
+      "indirect draws: in a batch, the visible objects are placed before the hidden ones")
+
+layout = scene.shared_meshes.get(0)
+check(layout is not None and sorted(layout["draws"]) == [0, 1, 2], "indirect draws: the meshes of the instanced shader have a shared layout")
+
+expected_commands = lambda batches: [(data_meshes[m].indices_count, count, *layout["draws"][m], first) for m, first, count in batches]
+check(indirect_commands(scene, len(batches)) == expected_commands(batches), "indirect draws: one command per batch, drawn from the shared layout at the batch first instance")
+
+# Hiding an object only updates the instance data and the indirect commands
+hidden = next(o for o in objects if o.mesh == 1 and not o.hidden)
+hidden.hidden = True
+scene._update_object_state(hidden, scene.objects[hidden.id])
+batches = scene.instance_batches[0]
+check(batches == expected_batches(objects) and indirect_commands(scene, len(batches)) == expected_commands(batches),
+      f"indirect draws: hiding object {hidden.id} updates its batch and the indirect commands")
+
+if len(failures) > 0:
+    print(f"FAILED: {len(failures)} check(s)")
+    sys.exit(1)
+
+print("OK: all checks passed")
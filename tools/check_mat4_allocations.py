@@ -0,0 +1,84 @@
+"""
+Check that the in place `Mat4` operations (`mul_into`, `inverse_transpose_into`) do not allocate matrices.
+
+For each object, the mvp and normal matrices are written in preallocated matrices, like the debug scenes do with their
+uniforms. The memory allocated from `mat4.py` is traced with `tracemalloc` over many frames and compared with the
+allocating operators (`projection * (view * model)`, `model.clone().invert().transpose()`).
+
+The check fails if the in place updates retain memory after the frames, or if their peak memory grows with the
+number of objects (the floats unpacked by the math are short lived and reused).
+
+Usage:
+`python ./tools/check_mat4_allocations.py`
+"""
+
+from pathlib import Path
+import sys, random, tracemalloc
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from utils import Mat4
+
+
+FRAMES = 60
+
+
+def in_place(projection, view, models, mvps, normals):
+    for model, mvp, normal in zip(models, mvps, normals):
+        Mat4.mul_into(view, model, mvp)
+        Mat4.mul_into(projection, mvp, mvp)
+        Mat4.inverse_transpose_into(model, normal)
+
+
+def allocating(projection, view, models, mvps, normals):
+    for index, model in enumerate(models):
+        mvps[index] = projection * (view * model)
+        normals[index] = model.clone().invert().transpose()
+
+
+def trace(update, count):
+    projection = Mat4.perspective(1.0, 800/600, 0.1, 1000.0)
+    view = Mat4.look_at((0.0, 0.0, 5.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+    models = [Mat4.from_rotation(random.random(), (0.0, 1.0, 0.0)).translate(random.random(), 0.0, 0.0) for _ in range(count)]
+    mvps = [Mat4() for _ in range(count)]
+    normals = [Mat4() for _ in range(count)]
+
+    mat4_only = [tracemalloc.Filter(True, "*mat4.py")]
+    update(projection, view, models, mvps, normals)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(mat4_only)
+    base = tracemalloc.get_traced_memory()[0]
+
+    for _ in range(FRAMES):
+        update(projection, view, models, mvps, normals)
+
+    peak = tracemalloc.get_traced_memory()[1] - base
+    after = tracemalloc.take_snapshot().filter_traces(mat4_only)
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return retained, peak
+
+
+failures = []
+peaks = []
+for count in (100, 1000):
+    retained, peak = trace(in_place, count)
+    allocating_retained, allocating_peak = trace(allocating, count)
+    peaks.append(peak)
+
+    print(f"{count:>5} objects, {FRAMES} frames: in place retained {retained:>7} bytes, peak {peak:>7} bytes | "
+          f"allocating retained {allocating_retained:>7} bytes, peak {allocating_peak:>7} bytes")
+
+    if retained != 0:
+        failures.append(f"in place updates of {count} objects retained {retained} bytes")
+
+if peaks[-1] > 2 * peaks[0]:
+    failures.append(f"in place peak memory grows with the number of objects ({peaks[0]} -> {peaks[-1]} bytes)")
+
+if len(failures) > 0:
+    print("FAILED: " + "; ".join(failures))
+    sys.exit(1)
+
+print("OK: in place Mat4 updates do not allocate matrices")
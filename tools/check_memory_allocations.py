@@ -0,0 +1,99 @@
+"""
+Check that the `MemoryManager` sub-allocates the resources from shared blocks of device memory.
+
+The vulkan functions are replaced by the fake api of `fake_memory_api.py`, that counts the `vkAllocateMemory` /
+`vkFreeMemory` calls, so no device is needed. The check fails if:
+- 1000 buffers and 200 images need more than one `vkAllocateMemory` per 64MB block (instead of one per resource)
+- Released ranges are not reused by the next allocations of the same size (first fit free list)
+- Released ranges are not merged back into a single free range once a block is empty
+- A resource bigger than the block size does not get its own dedicated block, freed with the resource
+
+Usage:
+`python ./tools/check_memory_allocations.py`
+"""
+
+from pathlib import Path
+import sys, random
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from vulkan import vk
+from engine.memory_manager import MemoryManager, DEFAULT_MEMORY_BLOCK_SIZE
+from fake_memory_api import FakeEngine
+
+
+BUFFER_COUNT, BUFFER_SIZE = 1000, 256 * 1024
+IMAGE_COUNT, IMAGE_SIZE = 200, 1024 * 1024
+DEDICATED_SIZE = 100 * 1024 * 1024
+
+DEVICE_MEMORY = vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+BUFFER, IMAGE = vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO, vk.STRUCTURE_TYPE_IMAGE_CREATE_INFO
+
+
+failures = []
+
+def check(condition, message):
+    print(f"{'OK' if condition else 'FAILED'}: {message}")
+    if not condition:
+        failures.append(message)
+
+
+engine = FakeEngine()
+api = engine.api
+mem = MemoryManager(engine)
+block_size = DEFAULT_MEMORY_BLOCK_SIZE
+
+# One allocation per block instead of one per resource
+buffers = [mem.alloc(api.resource(vk.Buffer, BUFFER_SIZE), BUFFER, (DEVICE_MEMORY,)) for _ in range(BUFFER_COUNT)]
+images = [mem.alloc(api.resource(vk.Image, IMAGE_SIZE), IMAGE, (DEVICE_MEMORY,)) for _ in range(IMAGE_COUNT)]
+
+expected = -(-BUFFER_COUNT * BUFFER_SIZE // block_size) + -(-IMAGE_COUNT * IMAGE_SIZE // block_size)
+allocations = api.calls["AllocateMemory"]
+check(allocations == expected, f"{BUFFER_COUNT} buffers and {IMAGE_COUNT} images: {allocations} vkAllocateMemory (expected {expected}, one per resource would be {BUFFER_COUNT+IMAGE_COUNT})")
+check(all(size == block_size for size in api.allocation_sizes), f"every block is {block_size//(1024*1024)}MB")
+check(len({(a.block.device_memory.value, a.offset) for a in buffers}) == BUFFER_COUNT, "buffer ranges do not overlap")
+check(not any(b.linear for b in {a.block for a in images}) and all(b.linear for b in {a.block for a in buffers}), "buffers and images never share a block")
+
+# Released ranges are reused by the next allocations (first fit)
+released = buffers[1::2]
+released_ranges = {(a.block.device_memory.value, a.offset) for a in released}
+for alloc in released:
+    mem.free_alloc(alloc)
+
+buffers = buffers[0::2]
+reused = [mem.alloc(api.resource(vk.Buffer, BUFFER_SIZE), BUFFER, (DEVICE_MEMORY,)) for _ in range(len(released))]
+reused_ranges = {(a.block.device_memory.value, a.offset) for a in reused}
+check(api.calls["AllocateMemory"] == allocations, f"{len(released)} buffers allocated after a release: no new vkAllocateMemory")
+check(reused_ranges == released_ranges, "the released ranges are reused")
+buffers.extend(reused)
+
+# Released ranges are merged, in any order. One empty block of each kind is kept for the next scene.
+random.seed(0)
+random.shuffle(buffers)
+for alloc in buffers + images:
+    mem.free_alloc(alloc)
+
+kept = list(mem.blocks)
+check(all(b.free_ranges == [(0, b.size)] and b.used == 0 for b in kept), "empty blocks have a single free range")
+check(len(kept) == 2 and api.calls["FreeMemory"] == allocations - 2, f"{len(kept)} empty block(s) kept, {api.calls['FreeMemory']} vkFreeMemory")
+
+# Resources bigger than a block get a dedicated block, released with the resource
+allocations = api.calls["AllocateMemory"]
+frees = api.calls["FreeMemory"]
+big = mem.alloc(api.resource(vk.Buffer, DEDICATED_SIZE), BUFFER, (DEVICE_MEMORY,))
+check(api.calls["AllocateMemory"] == allocations + 1 and api.allocation_sizes[-1] == DEDICATED_SIZE and big.block.dedicated, f"a {DEDICATED_SIZE//(1024*1024)}MB buffer gets a dedicated block")
+
+small = mem.alloc(api.resource(vk.Buffer, BUFFER_SIZE), BUFFER, (DEVICE_MEMORY,))
+check(small.block is not big.block, "other resources are not placed in the dedicated block")
+
+mem.free_alloc(big)
+check(api.calls["FreeMemory"] == frees + 1 and all(not b.dedicated for b in mem.blocks), "the dedicated block is freed with its resource")
+
+mem.free_alloc(small)
+mem.free()
+
+if len(failures) > 0:
+    print(f"FAILED: {len(failures)} check(s)")
+    sys.exit(1)
+
+print("OK: all checks passed")
@@ -0,0 +1,101 @@
+"""
+Check that loading scenes never blocks on a fence submitted to the render queue.
+
+Two game scenes are loaded in the background with `Engine.load_async`, then registered with `Engine.poll_loads`.
+Every queue submit and fence wait is recorded, and the check fails if a thread waited on a fence submitted to the render queue.
+The only exception are the waits of the load thread on the chunks of the staging ring, which are counted. The staging ring
+is reduced to 1MB so that the scenes are streamed in many chunks. Requires a vulkan device.
+
+Uses the transfer queue if the device has one. Otherwise, the chunks of the staging ring are submitted to the render queue
+and the load thread blocks on it when the ring is full: this fallback is reported separately.
+
+Usage:
+`python ./tools/check_upload_waits.py`
+"""
+
+from pathlib import Path
+import sys, os, time, threading
+
+SRC_PATH = Path(__file__).parent.parent / "src"
+sys.path.append(str(SRC_PATH))
+os.chdir(SRC_PATH)
+
+from vulkan import helpers as hvk
+from engine import Engine, QueueConf, QueueType
+from game import DebugTexturesScene, DebugNormalsScene
+
+
+class App(object):
+    def switch_scene(self, data):
+        pass
+
+
+fence_queues = {}
+ring_fences = set()
+render_queue_waits = []
+ring_waits = []
+
+queue_submit, wait_for_fences = hvk.queue_submit, hvk.wait_for_fences
+
+def recording_queue_submit(api, queue, infos, fence=0):
+    if fence:
+        fence_queues[fence.value] = queue.value
+    return queue_submit(api, queue, infos, fence)
+
+def recording_wait_for_fences(api, device, fences, *args, **kwargs):
+    load_thread = threading.current_thread() is not threading.main_thread()
+    for fence in fences:
+        if load_thread and fence.value in ring_fences:
+            ring_waits.append(fence_queues.get(fence.value))
+        elif fence_queues.get(fence.value) == render_queue:
+            render_queue_waits.append(fence.value)
+    return wait_for_fences(api, device, fences, *args, **kwargs)
+
+def recording_end_chunk():
+    fence = end_chunk()
+    ring_fences.add(fence.value)
+    return fence
+
+hvk.queue_submit, hvk.wait_for_fences = recording_queue_submit, recording_wait_for_fences
+
+
+engine = Engine({
+    "QUEUES": (
+        QueueConf.Default,
+        QueueConf(name="transfer", type=QueueType.Transfer, required=False),
+    ),
+    "STAGING_RING_SIZE": 1024 * 1024,
+})
+render_queue = engine.render_queue.handle.value
+upload = engine.upload_manager
+end_chunk = upload.ring.end_chunk
+upload.ring.end_chunk = recording_end_chunk
+print(f"Uploads on the {'transfer' if upload.ownership_transfer else 'render'} queue (family {upload.queue.family.index})")
+
+app = App()
+scenes = [DebugTexturesScene(app, engine).scene, DebugNormalsScene(app, engine).scene]
+jobs = [engine.load_async(scene) for scene in scenes]
+
+while not all(job.done() for job in jobs):
+    engine.poll_loads()
+    upload.collect()
+    time.sleep(0.001)
+
+for job in jobs:
+    job.result()
+
+engine.free()
+
+fallback_waits = sum(1 for queue in ring_waits if queue == render_queue)
+print(f"{len(ring_waits) - fallback_waits} wait(s) on staging ring chunks submitted to the transfer queue in the load thread")
+print(f"{fallback_waits} wait(s) on staging ring chunks submitted to the render queue in the load thread")
+
+if len(render_queue_waits) > 0:
+    print(f"FAILED: {len(render_queue_waits)} blocking wait(s) on render queue fences while loading two scenes")
+    sys.exit(1)
+
+if fallback_waits > 0:
+    print(f"FALLBACK: no transfer queue, the load thread blocked {fallback_waits} time(s) on the render queue to reuse the staging ring")
+    sys.exit(0)
+
+print("OK: no blocking wait on the render queue while loading two scenes")
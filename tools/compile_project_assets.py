@@ -52,6 +52,7 @@ def process(*inputs):
 
 shaders = (
     (SHADERS_PATH/"debug_texture", "debug_texture"),
+    (SHADERS_PATH/"debug_texture_bindless", "debug_texture_bindless"),
     (SHADERS_PATH/"debug_texture_array", "debug_texture_array"),
     (SHADERS_PATH/"debug_texture_cube", "debug_texture_cube"),
     (SHADERS_PATH/"debug_normals", "debug_normals"),
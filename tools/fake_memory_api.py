@@ -0,0 +1,87 @@
+"""
+Fake vulkan api for the tools that run the `MemoryManager` without a device. Not a tool itself.
+
+The memory functions of a device with a device local and a host visible memory type are implemented with ctypes
+callbacks: they count the `vkAllocateMemory` / `vkFreeMemory` / `vkMapMemory` / `vkUnmapMemory` calls and hand out
+host memory for the host visible allocations. The `src` directory must be in the import path.
+"""
+
+from vulkan import vk
+from ctypes import c_uint8, c_void_p, addressof
+
+
+HOST_MEMORY = vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT | vk.MEMORY_PROPERTY_HOST_COHERENT_BIT
+
+
+class FakeApi(object):
+    """ The memory functions of a device with a device local and a host visible memory type """
+
+    def __init__(self):
+        self.calls = {"AllocateMemory": 0, "FreeMemory": 0, "MapMemory": 0, "UnmapMemory": 0}
+        self.allocation_sizes = []
+        self.memory = {}
+        self.resource_sizes = {}
+
+        def get_memory_properties(physical_device, props):
+            props = props[0]
+            props.memory_type_count = 2
+            props.memory_types[0].property_flags = vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+            props.memory_types[1].property_flags = HOST_MEMORY
+            props.memory_heap_count = 1
+
+        def allocate_memory(device, info, allocator, memory):
+            self.calls["AllocateMemory"] += 1
+            info = info[0]
+            handle = len(self.memory) + 1
+            host = info.memory_type_index == 1
+            self.memory[handle] = (c_uint8 * info.allocation_size)() if host else None
+            self.allocation_sizes.append(info.allocation_size)
+            memory[0] = vk.DeviceMemory(handle)
+            return vk.SUCCESS
+
+        def free_memory(device, memory, allocator):
+            self.calls["FreeMemory"] += 1
+            self.memory[memory] = None
+
+        def map_memory(device, memory, offset, size, flags, data):
+            self.calls["MapMemory"] += 1
+            data[0] = c_void_p(addressof(self.memory[memory]) + offset)
+            return vk.SUCCESS
+
+        def unmap_memory(device, memory):
+            self.calls["UnmapMemory"] += 1
+
+        def memory_requirements(device, resource, req):
+            req = req[0]
+            req.size = self.resource_sizes[resource]
+            req.alignment = 256
+            req.memory_type_bits = 0b11
+
+        def bind_memory(device, resource, memory, offset):
+            return vk.SUCCESS
+
+        # Keep a reference to the callbacks, they must outlive the api
+        self.GetPhysicalDeviceMemoryProperties = vk.FnGetPhysicalDeviceMemoryProperties(get_memory_properties)
+        self.AllocateMemory = vk.FnAllocateMemory(allocate_memory)
+        self.FreeMemory = vk.FnFreeMemory(free_memory)
+        self.MapMemory = vk.FnMapMemory(map_memory)
+        self.UnmapMemory = vk.FnUnmapMemory(unmap_memory)
+        self.GetBufferMemoryRequirements = vk.FnGetBufferMemoryRequirements(memory_requirements)
+        self.GetImageMemoryRequirements = vk.FnGetImageMemoryRequirements(memory_requirements)
+        self.BindBufferMemory = vk.FnBindBufferMemory(bind_memory)
+        self.BindImageMemory = vk.FnBindImageMemory(bind_memory)
+
+    def resource(self, handle_type, size):
+        """ Return a new `handle_type` handle (`vk.Buffer` or `vk.Image`) whose memory requirements are `size` bytes """
+        handle = len(self.resource_sizes) + 1
+        self.resource_sizes[handle] = size
+        return handle_type(handle)
+
+
+class FakeEngine(object):
+
+    def __init__(self):
+        self.api = FakeApi()
+        self.device = vk.Device(0)
+        self.physical_device = vk.PhysicalDevice(0)
+        self.configuration = {}